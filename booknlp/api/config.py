@@ -50,6 +50,12 @@ class Settings(BaseSettings):
     job_ttl_seconds: int = 3600
     shutdown_grace_period: float = 30.0
     
+    # Inference executor (shared by /analyze and the job worker)
+    inference_max_workers: int = 1  # GPU constraint - one analysis at a time
+    inference_max_pending: int = 4
+    inference_queue_timeout: float = 30.0
+    inference_timeout: float = 600.0
+    
     # Model
     default_model: str = "small"
     available_models: list[str] = ["small", "big"]
@@ -15,6 +15,7 @@ from booknlp.api.routes import analyze, health, jobs
 from booknlp.api.services.nlp_service import get_nlp_service, initialize_nlp_service
 from booknlp.api.services.job_queue import initialize_job_queue
 from booknlp.api.services.async_processor import get_async_processor
+from booknlp.api.services.inference_executor import initialize_inference_executor
 from booknlp.api.rate_limit import limiter
 from booknlp.api.metrics import instrument_app
 
@@ -35,6 +36,14 @@ async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
     # Startup: Initialize NLP service (models loaded lazily or on demand)
     initialize_nlp_service()
     
+    # Bounded executor that runs analyses and jobs off the event loop
+    inference_executor = initialize_inference_executor(
+        max_workers=settings.inference_max_workers,
+        max_pending=settings.inference_max_pending,
+        queue_timeout=settings.inference_queue_timeout,
+        timeout=settings.inference_timeout,
+    )
+    
     # Initialize and start the job queue
     job_queue = await initialize_job_queue(
         processor=get_async_processor().process,
@@ -52,6 +61,7 @@ async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
     # Shutdown: Stop the job queue worker with grace period
     logger.info("Shutting down...")
     await job_queue.stop(grace_period=settings.shutdown_grace_period)
+    inference_executor.shutdown(wait=False)
     logger.info("Shutdown complete")
 
 
@@ -16,6 +16,7 @@ from booknlp.api.schemas.job_schemas import (
 )
 from booknlp.api.services.job_queue import get_job_queue
 from booknlp.api.services.async_processor import get_async_processor
+from booknlp.api.services.inference_executor import get_inference_executor
 from booknlp.api.dependencies import verify_api_key
 from booknlp.api.rate_limit import rate_limit
 
@@ -109,6 +110,7 @@ async def get_queue_stats(
         "max_document_size": 5000000,  # 5M characters
         "job_ttl_seconds": 3600,  # 1 hour
         "max_concurrent_jobs": 1,  # GPU constraint
+        "inference": get_inference_executor().stats(),
     })
     
     return stats
@@ -5,7 +5,9 @@ from enum import Enum
 from typing import Any, Optional
 from uuid import UUID, uuid4
 
-from pydantic import BaseModel, Field, ConfigDict
+from pydantic import BaseModel, Field, ConfigDict, field_validator
+
+from booknlp.api.schemas.requests import normalize_pipeline
 
 # Constants for repeated field descriptions
 UNIQUE_JOB_ID_DESC = "Unique job identifier"
@@ -36,6 +38,12 @@ class JobRequest(BaseModel):
         None, description="Path for custom model (only when model='custom')"
     )
 
+    @field_validator("pipeline")
+    @classmethod
+    def validate_pipeline(cls, v: list[str]) -> list[str]:
+        """Normalize pipeline components and add their dependencies."""
+        return normalize_pipeline(v)
+
 
 class JobResponse(BaseModel):
     """Response after job submission."""
@@ -2,7 +2,49 @@
 
 from typing import Literal
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, field_validator
+
+# Pipeline components, in the order BookNLP runs them
+PIPELINE_COMPONENTS = ["entity", "quote", "supersense", "event", "coref"]
+
+# Plural names accepted for components
+PIPELINE_ALIASES = {
+    "entities": "entity",
+    "quotes": "quote",
+    "supersenses": "supersense",
+    "events": "event",
+}
+
+# Components each component needs to have run first
+PIPELINE_DEPENDENCIES = {
+    "quote": ["entity"],
+    "coref": ["entity", "quote"],
+}
+
+
+def normalize_pipeline(pipeline: list[str]) -> list[str]:
+    """Resolve aliases and add the components each requested component depends on.
+
+    Args:
+        pipeline: Requested component names.
+
+    Returns:
+        The components to run, in pipeline order.
+
+    Raises:
+        ValueError: If a component name is unknown.
+    """
+    requested = set()
+    for name in pipeline:
+        component = PIPELINE_ALIASES.get(name, name)
+        if component not in PIPELINE_COMPONENTS:
+            raise ValueError(
+                f"Unknown pipeline component '{name}'; "
+                f"expected one of: {', '.join(PIPELINE_COMPONENTS)}"
+            )
+        requested.add(component)
+        requested.update(PIPELINE_DEPENDENCIES.get(component, []))
+    return [component for component in PIPELINE_COMPONENTS if component in requested]
 
 
 class AnalyzeRequest(BaseModel):
@@ -30,3 +72,9 @@ class AnalyzeRequest(BaseModel):
         default=None,
         description="Path for custom model (only used when model='custom')",
     )
+
+    @field_validator("pipeline")
+    @classmethod
+    def validate_pipeline(cls, v: list[str]) -> list[str]:
+        """Normalize pipeline components and add their dependencies."""
+        return normalize_pipeline(v)
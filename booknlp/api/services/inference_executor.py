@@ -0,0 +1,249 @@
+"""Bounded executor for BookNLP inference shared by /analyze and the job worker."""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+# Sentinel for "use the executor's configured value"
+_DEFAULT: Any = object()
+
+
+class ExecutorSaturatedError(RuntimeError):
+    """Raised when no inference worker is free and the wait queue is full or timed out."""
+
+
+class InferenceTimeoutError(TimeoutError):
+    """Raised when an inference call runs longer than its timeout."""
+
+
+class InferenceExecutor:
+    """Runs blocking inference calls on a fixed number of worker threads.
+
+    At most max_workers calls run at once and at most max_pending more wait for a
+    worker; further calls are rejected with ExecutorSaturatedError instead of
+    queueing without bound.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = 1,
+        max_pending: int = 4,
+        queue_timeout: Optional[float] = 30.0,
+        timeout: Optional[float] = 600.0,
+    ):
+        """Initialize the executor.
+
+        Args:
+            max_workers: Number of calls that run concurrently.
+            max_pending: Number of calls that may wait for a free worker.
+            queue_timeout: Seconds a call may wait for a worker (None waits forever).
+            timeout: Seconds a call may run once started (None for no limit).
+        """
+        self._max_workers = max_workers
+        self._max_pending = max_pending
+        self._queue_timeout = queue_timeout
+        self._timeout = timeout
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="booknlp-inference",
+        )
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._running = 0
+
+    @property
+    def max_workers(self) -> int:
+        """Get the number of concurrent calls."""
+        return self._max_workers
+
+    @property
+    def max_pending(self) -> int:
+        """Get the number of calls that may wait for a worker."""
+        return self._max_pending
+
+    def stats(self) -> dict[str, int]:
+        """Get current executor usage.
+
+        Returns:
+            Dictionary with running and queued call counts and limits.
+        """
+        with self._lock:
+            return {
+                "running": self._running,
+                "queued": self._in_flight - self._running,
+                "max_workers": self._max_workers,
+                "max_pending": self._max_pending,
+            }
+
+    def _submit(
+        self,
+        func: Callable[..., Any],
+        args: tuple,
+        reject_when_full: bool,
+        on_start: Callable[[float], None],
+    ) -> Future:
+        """Submit a call; on_start is called with its start time from the worker thread."""
+        with self._lock:
+            if reject_when_full and self._in_flight >= self._max_workers + self._max_pending:
+                raise ExecutorSaturatedError("All inference workers are busy and the queue is full")
+            self._in_flight += 1
+
+        def call() -> Any:
+            on_start(time.monotonic())
+            with self._lock:
+                self._running += 1
+            try:
+                return func(*args)
+            finally:
+                with self._lock:
+                    self._running -= 1
+
+        def release(future: Future) -> None:
+            # Runs when the call finishes or is cancelled before starting
+            with self._lock:
+                self._in_flight -= 1
+
+        try:
+            future = self._executor.submit(call)
+        except RuntimeError:
+            with self._lock:
+                self._in_flight -= 1
+            raise
+        future.add_done_callback(release)
+        return future
+
+    async def run(
+        self,
+        func: Callable[..., Any],
+        *args: Any,
+        queue_timeout: Optional[float] = _DEFAULT,
+        timeout: Optional[float] = _DEFAULT,
+        reject_when_full: bool = True,
+    ) -> Any:
+        """Run func(*args) on a worker thread without blocking the event loop.
+
+        Args:
+            func: Blocking function to call.
+            *args: Arguments for func.
+            queue_timeout: Seconds to wait for a worker (defaults to the executor's).
+            timeout: Seconds the call may run (defaults to the executor's).
+            reject_when_full: Whether to raise instead of waiting when the queue is full.
+
+        Returns:
+            The return value of func.
+
+        Raises:
+            ExecutorSaturatedError: If the queue is full or no worker frees up in time.
+            asyncio.CancelledError: If the executor shuts down before the call starts.
+            InferenceTimeoutError: If the call runs longer than its timeout. The call
+                keeps its worker until it finishes, since threads can't be interrupted.
+        """
+        if queue_timeout is _DEFAULT:
+            queue_timeout = self._queue_timeout
+        if timeout is _DEFAULT:
+            timeout = self._timeout
+
+        loop = asyncio.get_running_loop()
+        started = loop.create_future()
+
+        def set_started(start_time: float) -> None:
+            if not started.done():
+                started.set_result(start_time)
+
+        def on_start(start_time: float) -> None:
+            try:
+                loop.call_soon_threadsafe(set_started, start_time)
+            except RuntimeError:
+                # The caller's event loop has closed; the call still runs
+                pass
+
+        future = self._submit(func, args, reject_when_full, on_start)
+        wrapped = asyncio.wrap_future(future)
+        # Retrieve late results and errors of calls abandoned after a timeout
+        wrapped.add_done_callback(lambda f: f.cancelled() or f.exception())
+
+        # Wait for a worker to pick the call up
+        try:
+            await asyncio.wait([started, wrapped], timeout=queue_timeout, return_when=asyncio.FIRST_COMPLETED)
+        except asyncio.CancelledError:
+            # Don't leave work queued for a caller that has gone away
+            future.cancel()
+            raise
+        if not started.done():
+            if future.cancelled():
+                # shutdown() dropped the call before a worker picked it up
+                raise asyncio.CancelledError("Inference executor shut down")
+            if future.cancel():
+                raise ExecutorSaturatedError(f"No inference worker became free within {queue_timeout:g}s")
+
+        if timeout is None:
+            return await asyncio.shield(wrapped)
+
+        # The call may have started after the wait above timed out
+        start_time = await started
+        remaining = timeout - (time.monotonic() - start_time)
+        try:
+            return await asyncio.wait_for(asyncio.shield(wrapped), max(remaining, 0))
+        except asyncio.TimeoutError:
+            raise InferenceTimeoutError(f"Inference did not finish within {timeout:g}s")
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Stop accepting calls and cancel the queued ones.
+
+        Args:
+            wait: Whether to wait for running calls to finish.
+        """
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+
+# Global singleton instance
+_inference_executor: Optional[InferenceExecutor] = None
+
+
+def get_inference_executor() -> InferenceExecutor:
+    """Get the global inference executor instance.
+
+    Returns:
+        The singleton InferenceExecutor instance.
+    """
+    global _inference_executor
+    if _inference_executor is None:
+        from booknlp.api.config import get_settings
+
+        settings = get_settings()
+        _inference_executor = InferenceExecutor(
+            max_workers=settings.inference_max_workers,
+            max_pending=settings.inference_max_pending,
+            queue_timeout=settings.inference_queue_timeout,
+            timeout=settings.inference_timeout,
+        )
+    return _inference_executor
+
+
+def initialize_inference_executor(
+    max_workers: int = 1,
+    max_pending: int = 4,
+    queue_timeout: Optional[float] = 30.0,
+    timeout: Optional[float] = 600.0,
+) -> InferenceExecutor:
+    """Initialize and return the global inference executor.
+
+    Args:
+        max_workers: Number of calls that run concurrently.
+        max_pending: Number of calls that may wait for a free worker.
+        queue_timeout: Seconds a call may wait for a worker.
+        timeout: Seconds a call may run once started.
+
+    Returns:
+        The initialized InferenceExecutor instance.
+    """
+    global _inference_executor
+    _inference_executor = InferenceExecutor(
+        max_workers=max_workers,
+        max_pending=max_pending,
+        queue_timeout=queue_timeout,
+        timeout=timeout,
+    )
+    return _inference_executor
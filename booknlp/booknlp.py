@@ -13,21 +13,34 @@ class BookNLP():
 		if language == "en":
 			self.booknlp=EnglishBookNLP(model_params)
 
-	def process(self, inputFile, outputFolder, idd):
-		self.booknlp.process(inputFile, outputFolder, idd)
+	def process(self, inputFile, outputFolder, idd, pipeline=None):
+		self.booknlp.process(inputFile, outputFolder, idd, pipeline=pipeline)
 
-	def process_text(self, text: str) -> dict:
+	def process_text(self, text: str, pipeline=None) -> dict:
 		"""Process text in-memory and return structured results.
 		
 		This method bypasses file I/O for better performance.
 		
 		Args:
 			text: The text to analyze.
+			pipeline: Subset of the loaded pipeline to run; defaults to all of it.
 			
 		Returns:
 			Dictionary with tokens, entities, quotes, characters.
 		"""
-		return self.booknlp.process_text(text)
+		return self.booknlp.process_text(text, pipeline=pipeline)
+
+	def process_records(self, text: str, pipeline=None) -> dict:
+		"""Process text in-memory and return the rows of the output files.
+		
+		Args:
+			text: The text to analyze.
+			pipeline: Subset of the loaded pipeline to run; defaults to all of it.
+			
+		Returns:
+			Dictionary with tokens, entities, quotes, supersenses, events, characters.
+		"""
+		return self.booknlp.process_records(text, pipeline=pipeline)
 
 
 def proc():
@@ -9,6 +9,127 @@ import torch.nn as nn
 import torch.nn.init as I
 import torch.nn.utils.rnn as R
 from torch.autograd import Variable
+import numpy as np
+
+try:
+	import numba
+except ImportError:
+	numba = None
+
+VITERBI_BACKENDS = ("torch", "numpy", "numba")
+
+_viterbi_backend = "torch"
+_numba_kernel = None
+
+
+def set_viterbi_backend(backend):
+	"""Select the default implementation of CRF.viterbi_decode: "torch" (default), or the CPU
+	kernels "numpy" and "numba" (the latter requires numba to be installed)"""
+	global _viterbi_backend
+
+	if backend not in VITERBI_BACKENDS:
+		raise ValueError("unknown viterbi backend: %s (expected one of %s)" % (backend, ", ".join(VITERBI_BACKENDS)))
+	if backend == "numba" and numba is None:
+		raise ImportError("the numba viterbi backend requires numba (pip install numba)")
+
+	_viterbi_backend = backend
+
+
+def get_viterbi_backend():
+	return _viterbi_backend
+
+
+def _viterbi_numpy(logits, transitions, lens, start_idx, stop_idx):
+	"""NumPy version of CRF.viterbi_decode (same arithmetic, so the same results)"""
+	batch_size, seq_len, n_labels = logits.shape
+
+	vit = np.full((batch_size, n_labels), -10000, dtype=logits.dtype)
+	vit[:, start_idx] = 0
+
+	steps = np.arange(seq_len)[:, None]
+	active = (steps < lens[None, :])[:, :, None]
+	last = (steps == lens[None, :] - 1)[:, :, None]
+	stop = transitions[stop_idx][None, :]
+
+	rows = np.arange(batch_size)[:, None]
+	cols = np.arange(n_labels)[None, :]
+
+	pointers = np.empty((seq_len, batch_size, n_labels), dtype=np.int64)
+	for t_idx in range(seq_len):
+		vit_trn_sum = vit[:, None, :] + transitions[None, :, :]
+		pointers[t_idx] = vit_trn_sum.argmax(2)
+		vt_max = vit_trn_sum[rows, cols, pointers[t_idx]]
+		vit = np.where(active[t_idx], vt_max + logits[:, t_idx], vit)
+		vit = np.where(last[t_idx], vit + stop, vit)
+
+	idx = vit.argmax(1)
+	scores = vit[np.arange(batch_size), idx]
+
+	paths = np.empty((batch_size, seq_len), dtype=np.int64)
+	if seq_len > 0:
+		paths[:, -1] = idx
+	for t_idx in range(seq_len - 1, 0, -1):
+		paths[:, t_idx - 1] = pointers[t_idx][np.arange(batch_size), paths[:, t_idx]]
+
+	return scores, paths
+
+
+def _viterbi_loops(logits, transitions, lens, start_idx, stop_idx):
+	"""Scalar-loop version of CRF.viterbi_decode, compiled with numba"""
+	batch_size, seq_len, n_labels = logits.shape
+
+	scores = np.empty(batch_size, dtype=logits.dtype)
+	paths = np.empty((batch_size, seq_len), dtype=np.int64)
+	pointers = np.empty((seq_len, n_labels), dtype=np.int64)
+	vit = np.empty(n_labels, dtype=logits.dtype)
+	vit_nxt = np.empty(n_labels, dtype=logits.dtype)
+
+	for b in range(batch_size):
+		for i in range(n_labels):
+			vit[i] = -10000
+		vit[start_idx] = 0
+
+		for t_idx in range(seq_len):
+			for i in range(n_labels):
+				best = vit[0] + transitions[i, 0]
+				best_j = 0
+				for j in range(1, n_labels):
+					val = vit[j] + transitions[i, j]
+					if val > best:
+						best = val
+						best_j = j
+				pointers[t_idx, i] = best_j
+				vit_nxt[i] = best + logits[b, t_idx, i]
+
+			if t_idx < lens[b]:
+				for i in range(n_labels):
+					vit[i] = vit_nxt[i]
+			if t_idx == lens[b] - 1:
+				for i in range(n_labels):
+					vit[i] = vit[i] + transitions[stop_idx, i]
+
+		idx = 0
+		for i in range(1, n_labels):
+			if vit[i] > vit[idx]:
+				idx = i
+		scores[b] = vit[idx]
+
+		if seq_len > 0:
+			paths[b, seq_len - 1] = idx
+		for t_idx in range(seq_len - 1, 0, -1):
+			paths[b, t_idx - 1] = pointers[t_idx, paths[b, t_idx]]
+
+	return scores, paths
+
+
+def _get_numba_kernel():
+	global _numba_kernel
+
+	if numba is None:
+		raise ImportError("the numba viterbi backend requires numba (pip install numba)")
+	if _numba_kernel is None:
+		_numba_kernel = numba.njit(cache=False)(_viterbi_loops)
+	return _numba_kernel
 
 def log_sum_exp(vec, dim=0):
 	max, idx = torch.max(vec, dim)
@@ -63,54 +184,74 @@ class CRF(nn.Module):
 
 		return norm
 
-	def viterbi_decode(self, logits, lens):
+	def viterbi_decode(self, logits, lens, backend=None):
 		"""Borrowed from pytorch tutorial
 
 		Arguments:
 			logits: [batch_size, seq_len, n_labels] FloatTensor
 			lens: [batch_size] LongTensor
+			backend: "torch", "numpy" or "numba" (default: see set_viterbi_backend).  The numpy and
+				numba kernels run on CPU only; CUDA inputs are always decoded with torch.
+
+		As in the original, the scores of sequences shorter than seq_len are frozen after their last
+		step, but backpointers are still recorded for (and the backtrace still passes through) the
+		padded steps.
 		"""
+		if backend is None:
+			backend = _viterbi_backend
+
+		if backend != "torch" and not logits.is_cuda:
+			return self._viterbi_decode_cpu(logits, lens, backend)
+
 		batch_size, seq_len, n_labels = logits.size()
+		device = logits.device
+
 		vit = logits.data.new(batch_size, self.n_labels).fill_(-10000)
 		vit[:, self.start_idx] = 0
-		vit = Variable(vit)
-		c_lens = lens.clone()
 
-		logits_t = logits.transpose(1, 0)
-		pointers = []
-		for t_idx, logit in enumerate(logits_t):
-			vit_exp = vit.unsqueeze(1).expand(batch_size, n_labels, n_labels)
-			trn_exp = self.transitions.unsqueeze(0).expand_as(vit_exp)
-			vit_trn_sum = vit_exp + trn_exp
-			vt_max, vt_argmax = vit_trn_sum.max(2)
+		# which steps update each sequence's scores, and the step at which it ends
+		steps = torch.arange(seq_len, device=device).unsqueeze(1)
+		c_lens = lens.to(device).unsqueeze(0)
+		active = (steps < c_lens).unsqueeze(-1)
+		last = (steps == c_lens - 1).unsqueeze(-1)
 
-			vt_max = vt_max.squeeze(-1)
-			vit_nxt = vt_max + logit
-			pointers.append(vt_argmax.squeeze(-1).unsqueeze(0))
+		trn = self.transitions.data.unsqueeze(0)
+		stop = self.transitions.data[self.stop_idx].unsqueeze(0)
 
-			mask = (c_lens > 0).float().unsqueeze(-1).expand_as(vit_nxt).to(self.device)
-			vit = mask * vit_nxt + (1 - mask) * vit
+		pointers = torch.empty((seq_len, batch_size, n_labels), dtype=torch.long, device=device)
+		logits_t = logits.data.transpose(1, 0)
+		for t_idx in range(seq_len):
+			vt_max, pointers[t_idx] = (vit.unsqueeze(1) + trn).max(2)
+			vit = torch.where(active[t_idx], vt_max + logits_t[t_idx], vit)
+			vit = torch.where(last[t_idx], vit + stop, vit)
 
-			mask = (c_lens == 1).float().unsqueeze(-1).expand_as(vit_nxt).to(self.device)
-			vit += mask * self.transitions[ self.stop_idx ].unsqueeze(0).expand_as(vit_nxt)
+		scores, idx = vit.max(1)
 
-			c_lens = c_lens - 1
+		paths = torch.empty((batch_size, seq_len), dtype=torch.long, device=device)
+		if seq_len > 0:
+			paths[:, -1] = idx
+		for t_idx in range(seq_len - 1, 0, -1):
+			paths[:, t_idx - 1] = torch.gather(pointers[t_idx], 1, paths[:, t_idx].unsqueeze(-1)).squeeze(-1)
 
-		pointers = torch.cat(pointers)
-		scores, idx = vit.max(1)
-		if batch_size > 1:
-			idx = idx.squeeze(-1)
-		paths = [idx.unsqueeze(1)]
+		scores = scores.squeeze(-1)
 
-		for argmax in reversed(pointers):
-			idx_exp = idx.unsqueeze(-1)
-			idx = torch.gather(argmax, 1, idx_exp)
-			idx = idx.squeeze(-1)
+		return scores, paths
 
-			paths.insert(0, idx.unsqueeze(1))
+	def _viterbi_decode_cpu(self, logits, lens, backend):
 
-		paths = torch.cat(paths[1:], 1)
-		scores = scores.squeeze(-1)
+		logits_np = logits.detach().cpu().numpy()
+		transitions_np = self.transitions.detach().cpu().numpy()
+		lens_np = lens.detach().cpu().numpy().astype(np.int64)
+
+		if backend == "numpy":
+			scores, paths = _viterbi_numpy(logits_np, transitions_np, lens_np, self.start_idx, self.stop_idx)
+		elif backend == "numba":
+			scores, paths = _get_numba_kernel()(logits_np, transitions_np, lens_np, self.start_idx, self.stop_idx)
+		else:
+			raise ValueError("unknown viterbi backend: %s" % backend)
+
+		scores = torch.from_numpy(scores).to(logits.device).squeeze(-1)
+		paths = torch.from_numpy(paths).to(logits.device)
 
 		return scores, paths
 
@@ -1,7 +1,18 @@
 import numpy as np
 import torch
+from booknlp.common.pooling import WordpiecePooling, get_alignment
 
-def get_batches(model, sentences, max_batch, tagset, training=True):
+def get_token_budget_batch_size(ordered_data, start, max_tokens):
+
+	""" Number of sentences (sorted by increasing length) from start that fit in a batch of at most max_tokens
+	wordpieces after padding to the longest of them; always at least one """
+
+	size=1
+	while start+size < len(ordered_data) and (size+1)*len(ordered_data[start+size]) <= max_tokens:
+		size+=1
+	return size
+
+def get_batches(model, sentences, max_batch, tagset, training=True, max_tokens=None):
 
 	"""
 	Partitions a list of sentences (each a list containing [word, label]) into a set of batches
@@ -15,11 +26,12 @@ def get_batches(model, sentences, max_batch, tagset, training=True):
 	
 	-- batched_mask: Binary flag for real tokens (1) and padded tokens (0) [[1 1 1 1], [1 1 1 0]] (for BERT)
 	
-	-- batched_transforms: BERT word piece tokenization splits words into pieces; this matrix specifies how
-	to combine those pieces back into the original tokens (by averaging their representations) using matrix operations.
+	-- batched_transforms: BERT word piece tokenization splits words into pieces; this WordpiecePooling specifies how
+	to combine those pieces back into the original tokens (by averaging their representations).
 	If the original sentence is 3 words that have been tokenized into 4 word piece tokens [101 37 42 102] 
-	(where 37 42 are the pieces of one original word), the transformation matrix is 4 x 3 (zero padded to 4 x 4), 
-	resulting in the original sequence length of 3. [[1 0 0 0], [0 0.5 0.5 0], [0 0 0 1]]. 
+	(where 37 42 are the pieces of one original word), each word piece is mapped to its original token [0 1 1 2]
+	with weights [1 0.5 0.5 1], resulting in the original sequence length of 3.  This is the sparse equivalent of
+	the 3 x 4 averaging matrix [[1 0 0 0], [0 0.5 0.5 0], [0 0 0 1]].
 
 	-- batched_labels: Labels for each sentence, one label per original token (prior to word piece tokenization). Padded tokens
 		and [CLS] and [SEP] have labels -100.
@@ -34,6 +46,10 @@ def get_batches(model, sentences, max_batch, tagset, training=True):
 
 	-- ordering: inverse argsort to recover original ordering of sentences.
 
+	Sentences are sorted by wordpiece length before batching.  By default batches hold max_batch sentences
+	(fewer for long sentences); if max_tokens is set, each batch instead holds as many sentences as fit in
+	max_tokens wordpieces once padded to the longest of them.
+
 	"""
 
 	rev_tagset={tagset[v]:v for v in tagset}
@@ -84,24 +100,14 @@ def get_batches(model, sentences, max_batch, tagset, training=True):
 		layered_labels3=[]
 		layered_labels4=[]
 		layered_labels5=[]
-		
-		transform=[]
 
 		all_toks=[]
-		n=0
 		for idx, toks in enumerate(sentence):
 			# toks=model.tokenizer.tokenize(word[0])
 			all_toks.append(toks)
-			n+=len(toks)
 
-		cur=0
 		for idx, word in enumerate(sentence):
 			toks=all_toks[idx]
-			ind=list(np.zeros(n))
-			for j in range(cur,cur+len(toks)):
-				ind[j]=1./len(toks)
-			cur+=len(toks)
-			transform.append(ind)
 
 			tok_ids.extend(model.tokenizer.convert_tokens_to_ids(toks))
 
@@ -118,7 +124,7 @@ def get_batches(model, sentences, max_batch, tagset, training=True):
 
 		all_data.append(tok_ids)
 		all_masks.append(input_mask)
-		all_transforms.append(transform)
+		all_transforms.append(get_alignment(all_toks))
 
 		if training:
 
@@ -209,6 +215,9 @@ def get_batches(model, sentences, max_batch, tagset, training=True):
 
 	while i < len(ordered_data):
 
+		if max_tokens is not None:
+			current_batch=get_token_budget_batch_size(ordered_data, i, max_tokens)
+
 		for j in range(current_batch):
 			order_to_batch_map.append((batch_num, current_batch, j))
 
@@ -256,11 +265,6 @@ def get_batches(model, sentences, max_batch, tagset, training=True):
 			for k in range(blen, max_len):
 				batch_data[j].append(0)
 				batch_mask[j].append(0)
-				for z in range(len(batch_transforms[j])):
-					batch_transforms[j][z].append(0)
-
-			for k in range(len(batch_transforms[j]), max_label_length):
-				batch_transforms[j].append(np.zeros(max_len))
 
 			if training:
 
@@ -313,7 +317,7 @@ def get_batches(model, sentences, max_batch, tagset, training=True):
 		batched_sents.append(batch_sents)
 		batched_orig_token_lens.append(torch.LongTensor(batch_orig_lens))
 
-		batched_transforms.append(torch.FloatTensor(np.array(batch_transforms)))
+		batched_transforms.append(WordpiecePooling.from_alignments(batch_transforms, max_len, max_label_length))
 
 		if training:
 
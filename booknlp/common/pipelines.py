@@ -1,4 +1,5 @@
 import re
+import numpy as np
 
 class Entity:
 	def __init__(self, start, end, entity_id=None, quote_id=None, quote_eid=None, proper=None, ner_cat=None, in_quote=None, text=None):
@@ -74,20 +75,214 @@ class Token:
 		return sents
 
 
+class TokenTable:
+
+	"""
+	A document's tokens stored column-wise: NumPy arrays for the integer fields (ids, offsets, heads), interned
+	codes for the categorical ones (pos, deprel, lemma, ...) and one string holding all of the token texts.
+
+	Indexing and iterating yield TokenViews, which keep the Token attribute API (including setting inQuote and
+	event); code that wants whole columns can use e.g. table.paragraph_id, table.inQuote or table.get_texts().
+
+	"""
+
+	int_columns=["paragraph_id", "sentence_id", "index_within_sentence_idx", "token_id", "dephead", "startByte", "endByte"]
+	categorical_columns=["pos", "fine_pos", "lemma", "deprel", "ner", "event"]
+
+	def __init__(self, paragraph_id, sentence_id, index_within_sentence_idx, token_id, text, pos, fine_pos, lemma, deprel, dephead, ner, startByte):
+
+		""" Each argument is a column (a list or array with one value per token), in Token's argument order """
+
+		self.paragraph_id=np.asarray(paragraph_id, dtype=np.int64)
+		self.sentence_id=np.asarray(sentence_id, dtype=np.int64)
+		self.index_within_sentence_idx=np.asarray(index_within_sentence_idx, dtype=np.int64)
+		self.token_id=np.asarray(token_id, dtype=np.int64)
+		self.dephead=np.asarray(dephead, dtype=np.int64)
+		self.startByte=np.asarray(startByte, dtype=np.int64)
+
+		self.text_arena=''.join(text)
+		text_lens=np.fromiter((len(t) for t in text), dtype=np.int64, count=len(text))
+		self.text_offsets=np.zeros(len(text)+1, dtype=np.int64)
+		np.cumsum(text_lens, out=self.text_offsets[1:])
+
+		self.endByte=self.startByte+text_lens
+
+		self.codes={}
+		self.categories={}
+		for name, values in [("pos", pos), ("fine_pos", fine_pos), ("lemma", lemma), ("deprel", deprel), ("ner", ner), ("event", ["O"]*len(text))]:
+			self.codes[name], self.categories[name]=self.intern(values)
+
+		self.inQuote=np.zeros(len(text), dtype=bool)
+
+	@staticmethod
+	def intern(values):
+		categories={}
+		codes=np.fromiter((categories.setdefault(val, len(categories)) for val in values), dtype=np.int32, count=len(values))
+		return codes, list(categories)
+
+	@classmethod
+	def from_tokens(cls, tokens):
+		table=cls(*[[getattr(tok, name) for tok in tokens] for name in ["paragraph_id", "sentence_id", "index_within_sentence_idx", "token_id", "text", "pos", "fine_pos", "lemma", "deprel", "dephead", "ner", "startByte"]])
+		for idx, tok in enumerate(tokens):
+			table.inQuote[idx]=tok.inQuote
+			table.set_category("event", idx, tok.event)
+		return table
+
+	def get_text(self, i):
+		return self.text_arena[self.text_offsets[i]:self.text_offsets[i+1]]
+
+	def get_texts(self):
+		offsets=self.text_offsets.tolist()
+		return [self.text_arena[offsets[i]:offsets[i+1]] for i in range(len(self))]
+
+	def get_column(self, name):
+
+		""" The values of one attribute for every token, as a list """
+
+		if name == "text":
+			return self.get_texts()
+		if name in self.codes:
+			return self.get_categories(name)
+		return getattr(self, name).tolist()
+
+	def get_category(self, name, i):
+		return self.categories[name][self.codes[name][i]]
+
+	def get_categories(self, name):
+		categories=self.categories[name]
+		return [categories[code] for code in self.codes[name].tolist()]
+
+	def set_category(self, name, i, value):
+		categories=self.categories[name]
+		if value not in categories:
+			categories.append(value)
+		self.codes[name][i]=categories.index(value)
+
+	def __len__(self):
+		return len(self.token_id)
+
+	def __getitem__(self, i):
+		if isinstance(i, slice):
+			return [TokenView(self, j) for j in range(*i.indices(len(self)))]
+		if i < 0:
+			i+=len(self)
+		if i < 0 or i >= len(self):
+			raise IndexError("token index out of range")
+		return TokenView(self, i)
+
+	def __iter__(self):
+		for i in range(len(self)):
+			yield TokenView(self, i)
+
+
+def get_token_column(tokens, name):
+
+	""" The values of one attribute for every token, from a TokenTable or a list of Tokens """
+
+	if isinstance(tokens, TokenTable):
+		return tokens.get_column(name)
+	return [getattr(tok, name) for tok in tokens]
+
+
+def _int_column(name):
+	return property(lambda self: int(getattr(self.table, name)[self.i]))
+
+def _categorical_column(name):
+	return property(lambda self: self.table.get_category(name, self.i))
+
+
+class TokenView:
+
+	""" One row of a TokenTable, with the attributes of a Token """
+
+	__slots__=("table", "i")
+
+	def __init__(self, table, i):
+		self.table=table
+		self.i=i
+
+	paragraph_id=_int_column("paragraph_id")
+	sentence_id=_int_column("sentence_id")
+	index_within_sentence_idx=_int_column("index_within_sentence_idx")
+	token_id=_int_column("token_id")
+	dephead=_int_column("dephead")
+	startByte=_int_column("startByte")
+	endByte=_int_column("endByte")
+
+	pos=_categorical_column("pos")
+	fine_pos=_categorical_column("fine_pos")
+	lemma=_categorical_column("lemma")
+	deprel=_categorical_column("deprel")
+	ner=_categorical_column("ner")
+
+	@property
+	def text(self):
+		return self.table.get_text(self.i)
+
+	@property
+	def inQuote(self):
+		return bool(self.table.inQuote[self.i])
+
+	@inQuote.setter
+	def inQuote(self, value):
+		self.table.inQuote[self.i]=value
+
+	@property
+	def event(self):
+		return self.table.get_category("event", self.i)
+
+	@event.setter
+	def event(self, value):
+		self.table.set_category("event", self.i, value)
+
+	__str__=Token.__str__
+
+
 from spacy.tokens import Doc
+from spacy.pipeline import Sentencizer
+from spacy.attrs import ORTH, POS, TAG, LEMMA, DEP, HEAD, IDX, IS_SPACE
+
+# shard size (in characters) for parallel parsing when none is given
+DEFAULT_SHARD_SIZE=100000
+
+# components only needed for the dependency parse and lemmas
+SYNTAX_COMPONENTS=("parser", "lemmatizer")
 
 class SpacyPipeline:
-	def __init__(self, spacy_nlp):
+	def __init__(self, spacy_nlp, n_process=1, shard_size=None, batch_size=4, syntax=True):
+
+		"""
+		n_process: number of processes to parse with; with n_process > 1 (or a shard_size), the text is split at
+		paragraph breaks into shards of about shard_size characters, which are parsed separately (with nlp.pipe) and
+		stitched back together.  Sentences and dependency arcs then never cross shard boundaries.
+		batch_size: number of shards sent to a process at a time
+		syntax: whether tag() runs the parser and lemmatizer by default.  Without them, sentence boundaries come from
+		the senter (or a rule-based sentencizer if the model has none), every token heads itself and lemmas and
+		relations are empty.
+
+		"""
+
 		self.spacy_nlp=spacy_nlp
 		self.spacy_nlp.max_length = 10000000
 
+		self.n_process=n_process
+		self.batch_size=batch_size
+		self.shard_size=shard_size
+		if self.shard_size is None and self.n_process > 1:
+			self.shard_size=DEFAULT_SHARD_SIZE
+
+		self.syntax=syntax
+		self.light_pipeline=None
+
 
 	def filter_ws(self, text):
 		text=re.sub(" ", "S", text)
 		text=re.sub("[\n\r]", "N", text)
 		text=re.sub("\t", "T", text)
 		return text
-		
+
+	# filter_ws as a single str.translate
+	ws_table=str.maketrans({" ":"S", "\n":"N", "\r":"N", "\t":"T"})
 		
 	def tag_pretokenized(self, toks, sents, spaces):
 
@@ -100,14 +295,180 @@ class SpacyPipeline:
 
 		return self.process_doc(doc)
 
-	def tag(self, text):
+	def get_light_pipeline(self):
+
+		""" The (name, component) pipeline without the syntax components, with a sentence segmenter in the parser's place """
+
+		if self.light_pipeline is not None:
+			return self.light_pipeline
+
+		pipeline=[(name, proc) for name, proc in self.spacy_nlp.pipeline if name not in SYNTAX_COMPONENTS]
+
+		# the parser sets sentence boundaries too, so something else has to if nothing already does
+		if not any(name in ("senter", "sentencizer") for name, proc in pipeline):
+			if "senter" in self.spacy_nlp.component_names:
+				segmenter=("senter", self.spacy_nlp.get_pipe("senter"))
+			else:
+				segmenter=("sentencizer", Sentencizer())
+
+			names=self.spacy_nlp.pipe_names
+			position=len(pipeline)
+			if "parser" in names:
+				position=len([name for name in names[:names.index("parser")] if name not in SYNTAX_COMPONENTS])
+			pipeline.insert(position, segmenter)
+
+		self.light_pipeline=pipeline
+		return pipeline
+
+	def parse(self, text, syntax=True):
+
+		if syntax:
+			return self.spacy_nlp(text)
+
+		doc=self.spacy_nlp.make_doc(text)
+		for name, proc in self.get_light_pipeline():
+			doc=proc(doc)
+		return doc
+
+	def tag(self, text, syntax=None):
+
+		""" syntax: whether to run the parser and lemmatizer (defaults to self.syntax) """
+
+		if syntax is None:
+			syntax=self.syntax
 
-		doc = self.spacy_nlp(text)
+		if self.shard_size is not None:
+			return self.tag_sharded(text, syntax=syntax)
+
+		doc = self.parse(text, syntax=syntax)
 		return self.process_doc(doc)
 
+	def get_shards(self, text):
+
+		"""
+		Split text into (character offset, text) shards of at least shard_size characters.  Shards end after a run of
+		whitespace containing a blank line, so every shard but the first starts a new paragraph with a word.
+
+		"""
+
+		shards=[]
+		start=0
+		for match in re.finditer(r"\n\n\s*", text):
+			end=match.end()
+			if end - start >= self.shard_size and end < len(text):
+				shards.append((start, text[start:end]))
+				start=end
+
+		shards.append((start, text[start:]))
+		return shards
+
+	def tag_sharded(self, text, syntax=True):
+
+		shards=self.get_shards(text)
+		if syntax:
+			docs=self.spacy_nlp.pipe([shard for offset, shard in shards], n_process=self.n_process, batch_size=self.batch_size)
+		else:
+			# nlp.pipe can't skip components without changing the shared pipeline, so light shards are parsed in this process
+			docs=(self.parse(shard, syntax=False) for offset, shard in shards)
+
+		return self.stitch([(offset, self.process_doc(doc)) for (offset, shard), doc in zip(shards, docs)])
+
+	def stitch(self, tables):
+
+		""" Join the TokenTables of consecutive shards (with their character offsets) into one, renumbering ids and heads """
+
+		columns=[[] for i in range(12)]
+
+		num_words=0
+		num_sentences=0
+		num_paragraphs=0
+
+		for shard_idx, (offset, table) in enumerate(tables):
+			if len(table) == 0:
+				continue
+
+			# the whitespace before each shard after the first holds a paragraph break
+			paragraph_offset=num_paragraphs if shard_idx == 0 else max(num_paragraphs, 1)
+
+			for column, val in zip(columns, [table.paragraph_id+paragraph_offset, table.sentence_id+num_sentences, table.index_within_sentence_idx, table.token_id+num_words, table.get_texts(), table.get_categories("pos"), table.get_categories("fine_pos"), table.get_categories("lemma"), table.get_categories("deprel"), table.dephead+num_words, table.get_categories("ner"), table.startByte+offset]):
+				column.append(val)
+
+			num_words+=len(table)
+			num_sentences=int(table.sentence_id[-1])+num_sentences+1
+			num_paragraphs=int(table.paragraph_id[-1])+paragraph_offset+1
+
+		if len(columns[0]) == 0:
+			return TokenTable(*columns)
+
+		return TokenTable(*[np.concatenate(column) if isinstance(column[0], np.ndarray) else [val for vals in column for val in vals] for column in columns])
+
 	def process_doc(self, doc):
 
-		tokens=[]
+		tokens=self.process_doc_arrays(doc)
+		if tokens is None:
+			tokens=self.process_doc_by_token(doc)
+		return tokens
+
+	def get_strings(self, doc, ids):
+
+		""" Map spaCy string ids (hashes, or symbol ids for POS) to strings, looking each distinct id up once """
+
+		uniq, inverse=np.unique(ids, return_inverse=True)
+		strings=[doc.vocab.strings[int(val)] for val in uniq]
+		return [strings[idx] for idx in inverse.tolist()]
+
+	def process_doc_arrays(self, doc):
+
+		"""
+		Build the TokenTable from the doc's attribute arrays in bulk.  Whitespace tokens are dropped and ids and heads
+		renumbered over the remaining words, as in process_doc_by_token; returns None for docs it can't handle that
+		way (a syntactic head outside its token's sentence), which fall back to process_doc_by_token.
+
+		"""
+
+		arrays=doc.to_array([ORTH, POS, TAG, LEMMA, DEP, HEAD, IDX, IS_SPACE])
+		num_toks=len(doc)
+
+		is_space=arrays[:,7].astype(bool)
+		words=np.flatnonzero(~is_space)
+
+		# number of whitespace tokens up to and including each token
+		spaces=np.cumsum(is_space)
+
+		sent_starts=np.array([sent.start for sent in doc.sents], dtype=np.int64)
+		sent_idx=np.searchsorted(sent_starts, np.arange(num_toks), side="right")-1
+
+		heads=np.arange(num_toks)+arrays[:,5].astype(np.int64)
+		if np.any(sent_idx[heads[words]] != sent_idx[words]):
+			return None
+
+		# sentences without words don't get an id
+		sent_has_word=np.bincount(sent_idx[words], minlength=len(sent_starts)) > 0
+		sentence_id=np.cumsum(sent_has_word)-1
+
+		words_before_sent=sent_starts-(spaces[sent_starts]-is_space[sent_starts])
+		token_id=words-spaces[words]
+
+		# a new paragraph starts at a word preceded by whitespace containing a blank line
+		new_paragraph=np.zeros(len(words), dtype=bool)
+		space_idx=np.flatnonzero(is_space)
+		if len(space_idx) > 0:
+			next_word=np.searchsorted(words, space_idx)
+			whitespace={}
+			for tok_idx, word in zip(space_idx.tolist(), next_word.tolist()):
+				if word < len(words):
+					whitespace[word]=whitespace.get(word, "")+doc[tok_idx].text
+			for word, text in whitespace.items():
+				if "\n\n" in text:
+					new_paragraph[word]=True
+
+		texts=[text.translate(self.ws_table) for text in self.get_strings(doc, arrays[words,0])]
+
+		return TokenTable(np.cumsum(new_paragraph), sentence_id[sent_idx[words]], token_id-words_before_sent[sent_idx[words]], token_id, texts, self.get_strings(doc, arrays[words,1]), self.get_strings(doc, arrays[words,2]), self.get_strings(doc, arrays[words,3]), self.get_strings(doc, arrays[words,4]), heads[words]-spaces[heads[words]], [None]*len(words), arrays[words,6].astype(np.int64))
+
+	def process_doc_by_token(self, doc):
+
+		columns=[[] for i in range(12)]
 		skipped_global=0
 		paragraph_id=0
 		current_whitespace=""
@@ -137,14 +498,14 @@ class SpacyPipeline:
 
 					head_in_sentence=tok.head.i-sent.start
 					skips_between_token_and_head=skips_in_sentence[head_in_sentence]-skips_in_sentence[w_idx]
-					token=Token(paragraph_id, sentence_id, w_idx-skipped_in_sentence, tok.i-skipped_global, self.filter_ws(tok.text), tok.pos_, tok.tag_, tok.lemma_, tok.dep_, tok.head.i-skipped_global-skips_between_token_and_head, None, tok.idx)
-					tokens.append(token)
+					for column, val in zip(columns, [paragraph_id, sentence_id, w_idx-skipped_in_sentence, tok.i-skipped_global, self.filter_ws(tok.text), tok.pos_, tok.tag_, tok.lemma_, tok.dep_, tok.head.i-skipped_global-skips_between_token_and_head, None, tok.idx]):
+						column.append(val)
 					current_whitespace=""
 
 			if hasWord:
 				sentence_id+=1
 
-		return tokens
+		return TokenTable(*columns)
 
 class StanzaPipeline:
 	def __init__(self, nlp):
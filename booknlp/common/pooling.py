@@ -0,0 +1,108 @@
+"""
+Averaging BERT wordpiece representations back into the original tokens.
+
+Each token is represented by the mean of the wordpieces it was split into.  Rather than materializing
+a dense (n_tokens x n_wordpieces) averaging matrix per sentence and multiplying by it, we store for each
+wordpiece the index of the token it belongs to and its weight (1/number of pieces in that token), and
+sum the weighted wordpieces into their tokens with a scatter-add.
+
+The same segment mean is used by the nested NER tagger to merge the tokens of an entity into a single
+position when moving from one layer to the next; pool_spans averages arbitrary (start, end) wordpiece
+ranges (e.g. speaker candidates and quotes) from a cumulative sum.
+
+"""
+
+import torch
+
+
+def get_alignment(all_toks):
+
+	""" Token index and averaging weight for each wordpiece of a sentence, given the wordpieces of each token """
+
+	word_ids=[]
+	weights=[]
+	for idx, toks in enumerate(all_toks):
+		word_ids.extend([idx]*len(toks))
+		weights.extend([1./len(toks)]*len(toks))
+	return word_ids, weights
+
+
+class WordpiecePooling:
+
+	"""
+	Index-based equivalent of a batch of dense wordpiece->token averaging matrices.
+
+	-- word_ids: batch_size x max_wordpieces; the token each wordpiece belongs to.  Padded wordpieces
+	point to an extra row (num_words) that is dropped after pooling.
+
+	-- weights: batch_size x max_wordpieces; the weight of each wordpiece in its token's average.
+
+	-- num_words: number of (padded) tokens per sentence in the output.
+
+	Like the tensors it replaces, it's moved to a device with .to(device).
+
+	"""
+
+	def __init__(self, word_ids, weights, num_words):
+		self.word_ids=word_ids
+		self.weights=weights
+		self.num_words=num_words
+
+	@classmethod
+	def from_alignments(cls, alignments, max_len, num_words):
+
+		""" Pad the (word_ids, weights) alignments of a batch of sentences (from get_alignment) to max_len wordpieces """
+
+		batch_word_ids=[]
+		batch_weights=[]
+		for word_ids, weights in alignments:
+			pad=max_len-len(word_ids)
+			batch_word_ids.append(word_ids + [num_words]*pad)
+			batch_weights.append(weights + [0.]*pad)
+
+		return cls(torch.LongTensor(batch_word_ids), torch.FloatTensor(batch_weights), num_words)
+
+	def to(self, device):
+		return WordpiecePooling(self.word_ids.to(device), self.weights.to(device), self.num_words)
+
+	def pool(self, all_layers):
+
+		""" all_layers: batch_size x max_wordpieces x dim -> batch_size x num_words x dim """
+
+		batch_s, _, dim=all_layers.shape
+		weighted=all_layers * self.weights.to(all_layers.dtype).unsqueeze(-1)
+		out=all_layers.new_zeros((batch_s, self.num_words+1, dim))
+		out=out.scatter_add(1, self.word_ids.unsqueeze(-1).expand(-1, -1, dim), weighted)
+		return out[:,:self.num_words,:]
+
+	def dense(self):
+
+		""" The equivalent dense batch_size x num_words x max_wordpieces averaging matrix """
+
+		batch_s, max_len=self.word_ids.shape
+		matrix=torch.zeros((batch_s, self.num_words+1, max_len), dtype=self.weights.dtype, device=self.weights.device)
+		matrix.scatter_(1, self.word_ids.unsqueeze(1), self.weights.unsqueeze(1))
+		return matrix[:,:self.num_words,:]
+
+
+def pool_spans(all_layers, spans):
+
+	"""
+	Mean of the wordpieces in each [start, end) range.
+
+	all_layers: batch_size x max_wordpieces x dim; spans: batch_size x num_spans x 2 -> batch_size x num_spans x dim
+
+	Empty ranges (start == end) pool to zero.
+
+	"""
+
+	batch_s, _, dim=all_layers.shape
+	cumulative=torch.cat((all_layers.new_zeros((batch_s, 1, dim)), all_layers.cumsum(1)), 1)
+
+	starts=spans[:,:,0]
+	ends=spans[:,:,1]
+
+	summed=cumulative.gather(1, ends.unsqueeze(-1).expand(-1, -1, dim)) - cumulative.gather(1, starts.unsqueeze(-1).expand(-1, -1, dim))
+	widths=(ends-starts).clamp(min=1).unsqueeze(-1).to(all_layers.dtype)
+
+	return summed/widths
@@ -0,0 +1,40 @@
+"""
+Process-wide cache of the data files the pipeline parses for every document (the gender priors, the name alias table).
+
+Each file is parsed once per process and the parsed (read-only) result is shared by every caller; an entry is
+reloaded only if the file changes on disk.
+
+"""
+
+import os
+import threading
+
+_resources={}
+_resources_lock=threading.Lock()
+
+
+def load_resource(loader, filename, *args):
+
+	""" Return loader(filename, *args), parsing the file only the first time it's asked for with these arguments """
+
+	path=os.path.realpath(filename)
+	stat=os.stat(path)
+	key=(loader, path, args)
+	version=(stat.st_mtime_ns, stat.st_size)
+
+	with _resources_lock:
+		entry=_resources.get(key)
+		if entry is not None and entry[0] == version:
+			return entry[1]
+
+	resource=loader(path, *args)
+
+	with _resources_lock:
+		_resources[key]=(version, resource)
+
+	return resource
+
+
+def clear_resources():
+	with _resources_lock:
+		_resources.clear()
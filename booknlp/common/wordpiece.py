@@ -0,0 +1,247 @@
+"""
+Caching of BERT wordpiece tokenization.
+
+The entity tagger, coreference and quote attribution models all split the same document into
+wordpieces, one word at a time.  A WordpieceCache is built once per document and handed to each
+of them so that every distinct word is tokenized at most once; a bounded, process-wide LRU
+additionally carries frequent words over from one document to the next.
+
+Cache entries are keyed by the identity of the tokenizer's vocabulary (base vocab + added tokens),
+so models that share a vocabulary share entries, and by the *normalized* word (see normalize_word).
+
+Models can optionally swap their slow (pure Python) BertTokenizer for a Rust-backed equivalent built by
+build_fast_tokenizer; with a fast tokenizer, WordpieceCache.prime tokenizes all of a document's distinct
+words in one batched call up front instead of one call per word.
+
+"""
+
+import hashlib
+import threading
+import weakref
+from collections import OrderedDict
+
+from tokenizers import Tokenizer, models, normalizers, pre_tokenizers
+from transformers import BertTokenizerFast
+
+# pseudo-tokens used by the speaker attribution model; these are never lowercased or case-marked
+SPECIAL_TOKENS=frozenset(["[QUOTE]", "[ALTQUOTE]", "[PAR]"])
+
+DEFAULT_SHARED_CACHE_SIZE=100000
+
+# number of words sent to a fast tokenizer per call in WordpieceCache.prime
+PRIME_CHUNK_SIZE=10000
+
+_vocab_keys=weakref.WeakKeyDictionary()
+_vocab_keys_lock=threading.Lock()
+
+
+def normalize_word(word, lowercase=False):
+
+	""" We work with uncased BERT models, so add a special [CAP] tag to denote capitalization.
+	With lowercase=True, the rest of the word is lowercased as well (as in speaker attribution) """
+
+	if word in SPECIAL_TOKENS:
+		return word
+
+	if word[0].lower() != word[0]:
+		return "[CAP] " + word.lower()
+
+	if lowercase:
+		return word.lower()
+
+	return word
+
+
+def vocab_key(tokenizer):
+
+	""" Identify a tokenizer by the contents of its vocabulary (including added tokens), so that e.g.
+	two models built on the same BERT vocab with the same added tokens share cache entries """
+
+	with _vocab_keys_lock:
+		key=_vocab_keys.get(tokenizer)
+		if key is None:
+			vocab=tokenizer.get_vocab()
+			digest=hashlib.sha1()
+			for term in sorted(vocab, key=vocab.get):
+				digest.update(term.encode("utf-8"))
+				digest.update(b"\x00")
+			digest.update(b"\x01")
+			for term in sorted(tokenizer.get_added_vocab()):
+				digest.update(term.encode("utf-8"))
+				digest.update(b"\x00")
+			key=digest.hexdigest()
+			_vocab_keys[tokenizer]=key
+		return key
+
+
+def build_fast_tokenizer(tokenizer):
+
+	""" Build a BertTokenizerFast that reproduces a slow BertTokenizer loaded with do_lower_case=False and
+	do_basic_tokenize=False: the same vocab, the same added tokens with the same ids, no normalization
+	(no accent stripping, control character cleanup or CJK splitting) and splitting on whitespace only,
+	so that wordpieces and ids are identical to tokenizer.tokenize() """
+
+	backend=Tokenizer(models.WordPiece(vocab=dict(tokenizer.vocab), unk_token=tokenizer.unk_token, max_input_chars_per_word=tokenizer.wordpiece_tokenizer.max_input_chars_per_word))
+	backend.normalizer=normalizers.BertNormalizer(clean_text=False, handle_chinese_chars=False, strip_accents=False, lowercase=False)
+	backend.pre_tokenizer=pre_tokenizers.WhitespaceSplit()
+
+	fast=BertTokenizerFast(tokenizer_object=backend, do_lower_case=False, tokenize_chinese_chars=False, strip_accents=False, unk_token=tokenizer.unk_token, sep_token=tokenizer.sep_token, pad_token=tokenizer.pad_token, cls_token=tokenizer.cls_token, mask_token=tokenizer.mask_token, model_max_length=tokenizer.model_max_length)
+
+	# added tokens must be added in the same order to get the same ids (and so line up with the resized embeddings)
+	for idx, added in sorted(tokenizer.added_tokens_decoder.items()):
+		if idx < len(tokenizer.vocab):
+			continue
+		fast.add_tokens([added.content], special_tokens=added.special)
+		if fast.convert_tokens_to_ids(added.content) != idx:
+			raise ValueError("added token %s has id %s in the fast tokenizer, expected %s" % (added.content, fast.convert_tokens_to_ids(added.content), idx))
+
+	if len(fast) != len(tokenizer):
+		raise ValueError("fast tokenizer has %s entries, expected %s" % (len(fast), len(tokenizer)))
+
+	return fast
+
+
+def encode_words(tokenizer, words):
+
+	""" Wordpieces for each of a list of normalized words in a single call to a fast tokenizer, using the
+	word ids of the pre-tokenized encoding to assign wordpieces back to the word they came from """
+
+	encoding=tokenizer.backend_tokenizer.encode(words, is_pretokenized=True, add_special_tokens=False)
+	pieces=[[] for word in words]
+	for tok, word_id in zip(encoding.tokens, encoding.word_ids):
+		pieces[word_id].append(tok)
+	return [tuple(toks) for toks in pieces]
+
+
+class LRUWordpieceCache:
+
+	""" Thread-safe, bounded map from (vocab key, normalized word) to wordpieces """
+
+	def __init__(self, maxsize=DEFAULT_SHARED_CACHE_SIZE):
+		self.maxsize=maxsize
+		self.lock=threading.Lock()
+		self.entries=OrderedDict()
+		self.hits=0
+		self.misses=0
+
+	def get(self, key):
+		with self.lock:
+			val=self.entries.get(key)
+			if val is None:
+				self.misses+=1
+				return None
+			self.entries.move_to_end(key)
+			self.hits+=1
+			return val
+
+	def put(self, key, val):
+		if self.maxsize <= 0:
+			return
+		with self.lock:
+			self.entries[key]=val
+			self.entries.move_to_end(key)
+			while len(self.entries) > self.maxsize:
+				self.entries.popitem(last=False)
+
+	def resize(self, maxsize):
+		with self.lock:
+			self.maxsize=maxsize
+			while len(self.entries) > max(0, maxsize):
+				self.entries.popitem(last=False)
+
+	def clear(self):
+		with self.lock:
+			self.entries.clear()
+			self.hits=0
+			self.misses=0
+
+	def __len__(self):
+		return len(self.entries)
+
+
+_shared_cache=LRUWordpieceCache()
+
+
+def get_shared_cache():
+	return _shared_cache
+
+
+def configure_shared_cache(maxsize):
+	""" Set the size of the process-wide LRU (0 disables it) """
+	_shared_cache.resize(maxsize)
+
+
+class WordpieceCache:
+
+	"""
+	Per-document wordpiece cache.  Not bounded (it lives only as long as one document is being processed);
+	words not yet seen in this document are looked up in the process-wide LRU before falling back to the tokenizer.
+
+	Returned wordpiece sequences are tuples and are shared between callers, so they must not be modified.
+
+	"""
+
+	def __init__(self, shared=None):
+		if shared is None:
+			shared=_shared_cache
+		self.shared=shared
+		self.tables={}
+
+	def _table(self, tokenizer):
+		key=vocab_key(tokenizer)
+		table=self.tables.get(key)
+		if table is None:
+			table=self.tables[key]={}
+		return key, table
+
+	def tokenize(self, tokenizer, word):
+
+		""" Wordpieces for an already-normalized word """
+
+		key, table=self._table(tokenizer)
+		toks=table.get(word)
+		if toks is None:
+			toks=self.shared.get((key, word))
+			if toks is None:
+				toks=tuple(tokenizer.tokenize(word))
+				self.shared.put((key, word), toks)
+			table[word]=toks
+		return toks
+
+	def prime(self, tokenizer, words, lowercase=False):
+
+		""" Tokenize all raw words not already cached with as few calls to a fast tokenizer as possible.
+		Does nothing for slow tokenizers, whose words are tokenized one at a time as they are requested """
+
+		if not getattr(tokenizer, "is_fast", False):
+			return
+
+		key, table=self._table(tokenizer)
+
+		missing=[]
+		seen=set()
+		for word in words:
+			word=normalize_word(word, lowercase=lowercase)
+			if word in table or word in seen:
+				continue
+			seen.add(word)
+			toks=self.shared.get((key, word))
+			if toks is None:
+				missing.append(word)
+			else:
+				table[word]=toks
+
+		for start in range(0, len(missing), PRIME_CHUNK_SIZE):
+			chunk=missing[start:start+PRIME_CHUNK_SIZE]
+			for word, toks in zip(chunk, encode_words(tokenizer, chunk)):
+				table[word]=toks
+				self.shared.put((key, word), toks)
+
+	def tokenize_word(self, tokenizer, word, lowercase=False):
+
+		""" Wordpieces for a raw word, normalized with normalize_word """
+
+		return self.tokenize(tokenizer, normalize_word(word, lowercase=lowercase))
+
+	def __len__(self):
+		return sum(len(table) for table in self.tables.values())
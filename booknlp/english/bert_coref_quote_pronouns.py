@@ -18,6 +18,8 @@ from booknlp.english.litbank_quote import QuoteTagger
 from booknlp.english.name_coref import NameCoref
 
 from booknlp.english.bert_qa import QuotationAttribution
+from booknlp.common.wordpiece import WordpieceCache, build_fast_tokenizer
+from booknlp.common.pooling import WordpiecePooling, get_alignment
 
 random.seed(1)
 np.random.seed(1)
@@ -28,10 +30,16 @@ torch.backends.cudnn.benchmark = False
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 print("using device", device)
 
+# number of candidate antecedents considered for each mention
+MAX_PREVIOUS_MENTIONS=20
+
+# number of (mention, candidate) pairs scored at once during inference
+PAIR_BATCHSIZE=4096
+
 
 class BERTCorefTagger(nn.Module):
 
-	def __init__(self, gender_cats, freeze_bert=False, base_model=None, pronominalCorefOnly=True):
+	def __init__(self, gender_cats, freeze_bert=False, base_model=None, pronominalCorefOnly=True, use_fast_tokenizer=False):
 		super(BERTCorefTagger, self).__init__()
 
 		modelName=base_model
@@ -59,6 +67,9 @@ class BERTCorefTagger(nn.Module):
 		self.tokenizer.add_tokens(["[CAP]"], special_tokens=True)
 		self.bert.resize_token_embeddings(len(self.tokenizer))
 
+		if use_fast_tokenizer:
+			self.tokenizer=build_fast_tokenizer(self.tokenizer)
+
 		self.bert.eval()
 
 		self.vec_get_distance_bucket=np.vectorize(self.get_distance_bucket)
@@ -127,7 +138,7 @@ class BERTCorefTagger(nn.Module):
 		_, pooled_outputs, sequence_outputs = self.bert(input_ids, token_type_ids=None, attention_mask=attention_mask, output_hidden_states=True, return_dict=False)
 
 		all_layers = sequence_outputs[-1]
-		embeds=torch.matmul(transforms,all_layers)
+		embeds=transforms.pool(all_layers)
 
 		average=torch.matmul(matrix, embeds)
 
@@ -176,6 +187,47 @@ class BERTCorefTagger(nn.Module):
 			return span_representation.detach()
 
 
+	def get_all_mention_reps(self, matrix, index, starts, ends, widths, input_ids, attention_mask, transforms, entities, active=None, doTrain=False):
+
+		"""
+		Span representations for all mentions in a document as a single (num_entities x dim) tensor, filled in batch by batch.
+
+		If active is given (see forward), the batches only cover the active entities and all other rows are zero.
+
+		"""
+
+		num_mentions=len(entities)
+		dim=self.unary1.in_features
+
+		rows=None
+		if active is None:
+			span_representation=torch.empty((num_mentions, dim), device=device)
+		else:
+			span_representation=torch.zeros((num_mentions, dim), device=device)
+			rows=torch.LongTensor(np.flatnonzero(active)).to(device)
+
+		quotes=torch.LongTensor([1 if entity.in_quote else 0 for entity in entities]).to(device)
+		if rows is not None:
+			quotes=quotes[rows]
+
+		cur=0
+		for b in range(len(matrix)):
+
+			n=len(starts[b])
+
+			span_reps=self.get_mention_reps(input_ids=input_ids[b], attention_mask=attention_mask[b], starts=starts[b], ends=ends[b], index=index[b], widths=widths[b], quotes=quotes[cur:cur+n], transforms=transforms[b], matrix=matrix[b], doTrain=doTrain)
+
+			if rows is None:
+				span_representation[cur:cur+n]=span_reps
+			else:
+				span_representation[rows[cur:cur+n]]=span_reps
+
+			cur+=n
+
+		assert cur == len(quotes)
+
+		return span_representation
+
 	def assign_quotes_to_entity(self, entities):
 		# For training, assign quotes to the nearest gold mention
 		for idx, entity in enumerate(entities):
@@ -247,7 +299,145 @@ class BERTCorefTagger(nn.Module):
 
 		return np.array(dists), ent_dist
 
-	def forward(self, matrix, index, existing=None, truth=None, token_positions=None, starts=None, ends=None, widths=None, input_ids=None, attention_mask=None, transforms=None, entities=None, ref_genders={}):
+	def get_cands(self, i, entities):
+
+		""" Candidate antecedents for mention i and their distance (in mentions) from it """
+
+		first=max(0,i-MAX_PREVIOUS_MENTIONS)
+
+		if entities[i].in_quote == False:
+			# entities not in quotes can only refer back to other entities not in quotes
+			cands_idx, ent_dist=self.get_non_quote_cands(first, i, entities)
+		else:
+			# entities in quotes can refer back to *any* entity (in quote or outside) or up to 10 entities outside quotes ahead
+			cands_idx, ent_dist=self.get_closest_entities(first, i, entities)
+
+		return cands_idx[-MAX_PREVIOUS_MENTIONS:], ent_dist[-MAX_PREVIOUS_MENTIONS:]
+
+	def score_pairs(self, span_representation, unary_scores, mention_idx, cand_idx, ent_dist, same_speaker, nest1, nest2):
+
+		""" Antecedent scores for (mention, candidate) pairs, given as parallel arrays """
+
+		targets=span_representation[cand_idx]
+		cp=span_representation[mention_idx]
+
+		same_speaker_embeds=self.speaker_embeddings(torch.LongTensor(same_speaker).to(device))
+		distance_embeds=self.distance_embeddings(torch.LongTensor(self.vec_get_distance_bucket(ent_dist)).to(device))
+		nesteds_embeds=self.nested_embeddings(torch.LongTensor(nest1).to(device))
+		nesteds_embeds2=self.nested_embeddings(torch.LongTensor(nest2).to(device))
+
+		elementwise=cp*targets
+		concat=torch.cat((cp, targets, elementwise, distance_embeds, nesteds_embeds, nesteds_embeds2, same_speaker_embeds), 1)
+
+		preds=self.mention_mention3(self.tanh(self.drop_layer_020(self.mention_mention2(self.tanh(self.drop_layer_020(self.mention_mention1(concat)))))))
+
+		preds=preds + unary_scores[mention_idx] + unary_scores[cand_idx]
+
+		return preds.squeeze(-1)
+
+	def score_all_pairs(self, span_representation, unary_scores, entities, mentions, pair_batchsize=PAIR_BATCHSIZE):
+
+		"""
+		Phase 1 of inference: score every (mention, candidate) pair for the given mentions in large batches.
+
+		The only pairwise feature that depends on earlier decisions is same_speaker (for mentions in a quote
+		with a known speaker: is the candidate coreferent with the speaker?), so for those mentions each pair
+		is scored both ways (same_speaker=0 and 1) and the right score is picked once the candidate's entity
+		is known (see select_pair_scores).  All other pairs have same_speaker=2.
+
+		Returns {mention: (cands_idx, scores)}, where scores is a tensor of shape [n_cands] or [2, n_cands].
+
+		"""
+
+		starts=np.array([e.global_start for e in entities])
+		ends=np.array([e.global_end for e in entities])
+
+		all_mention=[]
+		all_cand=[]
+		all_dist=[]
+		all_speaker=[]
+		spans=[]
+
+		n=0
+		for i in mentions:
+			cands_idx, ent_dist=self.get_cands(i, entities)
+			cands_idx=np.asarray(cands_idx, dtype=np.int64)
+			ent_dist=np.asarray(ent_dist, dtype=np.int64)
+
+			speakers=[2]
+			if entities[i].in_quote and entities[i].quote_mention is not None:
+				speakers=[0, 1]
+
+			for speaker in speakers:
+				all_mention.append(np.full(len(cands_idx), i))
+				all_cand.append(cands_idx)
+				all_dist.append(ent_dist)
+				all_speaker.append(np.full(len(cands_idx), speaker))
+
+			spans.append((i, cands_idx, n, len(speakers)))
+			n+=len(cands_idx)*len(speakers)
+
+		if n == 0:
+			return {}
+
+		all_mention=np.concatenate(all_mention)
+		all_cand=np.concatenate(all_cand)
+		all_dist=np.concatenate(all_dist)
+		all_speaker=np.concatenate(all_speaker)
+
+		# is the current mention nested within a candidate (nest1), or a candidate within the mention (nest2)?
+		nest1=((starts[all_mention] >= starts[all_cand]) & (ends[all_mention] < ends[all_cand])).astype(np.int64)
+		nest2=((starts[all_cand] >= starts[all_mention]) & (ends[all_cand] < ends[all_mention])).astype(np.int64)
+
+		scores=[]
+		for start in range(0, n, pair_batchsize):
+			end=start+pair_batchsize
+			scores.append(self.score_pairs(span_representation, unary_scores, all_mention[start:end], all_cand[start:end], all_dist[start:end], all_speaker[start:end], nest1[start:end], nest2[start:end]).cpu())
+
+		scores=torch.cat(scores)
+
+		pair_scores={}
+		for i, cands_idx, start, n_speakers in spans:
+			k=len(cands_idx)
+			if n_speakers == 1:
+				pair_scores[i]=(cands_idx, scores[start:start+k])
+			else:
+				pair_scores[i]=(cands_idx, scores[start:start+2*k].view(2, k))
+
+		return pair_scores
+
+	def select_pair_scores(self, i, cands_idx, scores, entities, assignments):
+
+		""" Phase 2 of inference: pick each candidate's score given the same_speaker value implied by the current assignments """
+
+		if len(scores.shape) == 1:
+			return scores
+
+		attribution_assignment=assignments[entities[i].quote_mention]
+		same_speaker=torch.BoolTensor([assignments[e] == attribution_assignment for e in cands_idx])
+
+		return torch.where(same_speaker, scores[1], scores[0])
+
+	def get_scored_mentions(self, entities, existing=None):
+
+		""" Mentions whose antecedents are scored at inference time (all others are resolved without the model) """
+
+		to_score=[]
+		for i, entity in enumerate(entities):
+			if i == 0 or (existing is not None and existing[i] != -1) or (entity.proper != "PRON" and self.pronominalCorefOnly):
+				continue
+			to_score.append(i)
+
+		return to_score
+
+	def forward(self, matrix, index, existing=None, truth=None, token_positions=None, starts=None, ends=None, widths=None, input_ids=None, attention_mask=None, transforms=None, entities=None, ref_genders={}, active=None):
+
+		"""
+		active: optional boolean array over entities.  If given, the batched inputs (matrix ... transforms) cover
+		only the sentence windows containing the active entities, and only those entities get span representations;
+		all mentions that are scored (and their candidates) must be active.
+
+		"""
 		
 		doTrain=False
 		if truth is not None:
@@ -263,43 +453,9 @@ class BERTCorefTagger(nn.Module):
 				if val != -1 and val is not None:
 					self.add_property(entity_properties, val, e, ref_genders)
 
-		all_starts=None
-		all_ends=None
-
-		span_representation=None
-
-		all_all=[]
-		cur=0
-		for b in range(len(matrix)):
-
-			quotes=[]
-			for entity in entities[cur:cur+len(starts[b])]:
-				if entity.in_quote:
-					quotes.append(1)
-				else:
-					quotes.append(0)
-			cur+=len(starts[b])
-
-			quotes=torch.LongTensor(quotes)
-
-			span_reps=self.get_mention_reps(input_ids=input_ids[b], attention_mask=attention_mask[b], starts=starts[b], ends=ends[b], index=index[b], widths=widths[b], quotes=quotes, transforms=transforms[b], matrix=matrix[b], doTrain=doTrain)
-			
-			if b == 0:
-				span_representation=span_reps
-				all_starts=starts[b]
-				all_ends=ends[b]
-
-			else:
+		span_representation=self.get_all_mention_reps(matrix, index, starts, ends, widths, input_ids, attention_mask, transforms, entities, active=active, doTrain=doTrain)
 
-				span_representation=torch.cat((span_representation, span_reps), 0)
-	
-				all_starts=torch.cat((all_starts, starts[b]), 0)
-				all_ends=torch.cat((all_ends, ends[b]), 0)
-
-		all_starts=all_starts.to(device)
-		all_ends=all_ends.to(device)
-		
-		num_mentions,=all_starts.shape
+		num_mentions=len(entities)
 
 		running_loss=0
 
@@ -328,6 +484,10 @@ class BERTCorefTagger(nn.Module):
 
 		unary_scores=self.unary3(self.tanh(self.drop_layer_020(self.unary2(self.tanh(self.drop_layer_020(self.unary1(span_representation)))))))
 
+		if not doTrain:
+			# score all pairs up front for every mention that will need them
+			pair_scores=self.score_all_pairs(span_representation, unary_scores, entities, self.get_scored_mentions(entities, existing))
+
 		# process entities outside of quotes first
 
 		for inQuoteVal in [False, True]:
@@ -368,20 +528,7 @@ class BERTCorefTagger(nn.Module):
 					
 					continue
 
-				MAX_PREVIOUS_MENTIONS=20
-
-				first=max(0,i-MAX_PREVIOUS_MENTIONS)
-
-				cands_idx=None
-				if inQuoteVal == False:
-					# entities not in quotes can only refer back to other entities not in quotes
-					cands_idx, ent_dist=self.get_non_quote_cands(first, i, entities)
-				else:
-					# entities in quotes can refer back to *any* entity (in quote or outside) or up to 10 entities outside quotes ahead
-					cands_idx, ent_dist=self.get_closest_entities(first, i, entities)
-
-				cands_idx=cands_idx[-MAX_PREVIOUS_MENTIONS:]
-				ent_dist=ent_dist[-MAX_PREVIOUS_MENTIONS:]
+				cands_idx, ent_dist=self.get_cands(i, entities)
 
 
 				preds=None
@@ -402,17 +549,17 @@ class BERTCorefTagger(nn.Module):
 
 				else:
 
-					targets=span_representation[cands_idx]
-					cp=span_representation[i].expand_as(targets)
-					
-					dists=[]
-					nesteds=[]
-
 					# force 1st person pronouns in quotes to co-refer with the quote speaker
 					if entity.quote_mention is not None and assignments[entity.quote_mention ] is not None and (entity.text.lower() == "i" or entity.text.lower() == "me" or entity.text.lower() == "my" or entity.text.lower() == "myself") and entity.in_quote:
 						assignments[i]=assignments[entity.quote_mention]
 						continue
 
+				if not doTrain:
+					cands_idx, preds=pair_scores[i]
+					preds=self.select_pair_scores(i, cands_idx, preds, entities, assignments)
+
+				else:
+
 					same_speaker=[]
 					for e in cands_idx:
 						if not entities[i].in_quote:
@@ -433,15 +580,7 @@ class BERTCorefTagger(nn.Module):
 								else:
 									same_speaker.append(0)
 
-
-					same_speaker_embeds=self.speaker_embeddings(torch.LongTensor(same_speaker).to(device))
-
-					# get distance in mentions
-					dists=self.vec_get_distance_bucket(ent_dist)
-					dists=torch.LongTensor(dists).to(device)
-					distance_embeds=self.distance_embeddings(dists)
-
-					# is the current mention nested within a previous one?
+					# is the current mention nested within a previous one (nest1), or a previous one within it (nest2)?
 
 					nest1=[]
 					nest2=[]
@@ -455,17 +594,7 @@ class BERTCorefTagger(nn.Module):
 						else:
 							nest2.append(0)
 
-					nesteds_embeds=self.nested_embeddings(torch.LongTensor(nest1).to(device))
-					nesteds_embeds2=self.nested_embeddings(torch.LongTensor(nest2).to(device))
-
-					elementwise=cp*targets
-					concat=torch.cat((cp, targets, elementwise, distance_embeds, nesteds_embeds, nesteds_embeds2, same_speaker_embeds), 1)
-
-					preds=self.mention_mention3(self.tanh(self.drop_layer_020(self.mention_mention2(self.tanh(self.drop_layer_020(self.mention_mention1(concat)))))))
-
-					preds=preds + unary_scores[i] + unary_scores[cands_idx]
-
-					preds=preds.squeeze(-1)
+					preds=self.score_pairs(span_representation, unary_scores, np.full(len(cands_idx), i), np.asarray(cands_idx), ent_dist, same_speaker, nest1, nest2)
 
 				if doTrain:
 		
@@ -654,7 +783,10 @@ class BERTCorefTagger(nn.Module):
 		return matrix
 
 
-	def get_data(self, doc, ents, max_ents, max_words, batchsize=128):
+	def get_data(self, doc, ents, max_ents, max_words, batchsize=128, wordpiece_cache=None):
+
+		if wordpiece_cache is None:
+			wordpiece_cache=WordpieceCache()
 
 		token_positions=[]
 		ent_spans=[]
@@ -759,25 +891,16 @@ class BERTCorefTagger(nn.Module):
 		for sent in doc:
 			tok_ids=[]
 			input_mask=[]
-			transform=[]
 
 			all_toks=[]
-			n=0
 			for idx, word in enumerate(sent):
-				toks=self.tokenizer.tokenize(word)
+				toks=wordpiece_cache.tokenize(self.tokenizer, word)
 				all_toks.append(toks)
-				n+=len(toks)
 
 
-			cur=0
 			for idx, word in enumerate(sent):
 
 				toks=all_toks[idx]
-				ind=list(np.zeros(n))
-				for j in range(cur,cur+len(toks)):
-					ind[j]=1./len(toks)
-				cur+=len(toks)
-				transform.append(ind)
 
 				tok_id=self.tokenizer.convert_tokens_to_ids(toks)
 				assert len(tok_id) == len(toks)
@@ -789,7 +912,7 @@ class BERTCorefTagger(nn.Module):
 
 			all_masks.append(input_mask)
 			all_data.append(tok_ids)
-			all_transforms.append(transform)
+			all_transforms.append(get_alignment(all_toks))
 
 			if len(all_masks) == batchsize:
 				batch_masks.append(all_masks)
@@ -817,14 +940,9 @@ class BERTCorefTagger(nn.Module):
 				for k in range(blen, max_len):
 					batch_data[b][j].append(0)
 					batch_masks[b][j].append(0)
-					for z in range(len(batch_transforms[b][j])):
-						batch_transforms[b][j][z].append(0)
-
-				for k in range(len(batch_transforms[b][j]), max_words_batch[b]):
-					batch_transforms[b][j].append(np.zeros(max_len))
 
 			batch_data[b]=torch.LongTensor(batch_data[b])
-			batch_transforms[b]=torch.FloatTensor(np.array(batch_transforms[b]))
+			batch_transforms[b]=WordpiecePooling.from_alignments(batch_transforms[b], max_len, max_words_batch[b])
 			batch_masks[b]=torch.FloatTensor(batch_masks[b])
 			
 		tok_pos=0
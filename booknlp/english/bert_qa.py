@@ -2,36 +2,153 @@ import torch
 import re
 from booknlp.english.speaker_attribution import BERTSpeakerID
 from booknlp.patches import remove_position_ids_from_state_dict
+from booknlp.common.wordpiece import WordpieceCache, normalize_word
 import numpy as np
 import sys
+import bisect
 
 PINK = '\033[95m'
 ENDC = '\033[0m'
 
+class QuoteWindows:
+
+	"""
+	Finds the context window around each quote in a document from prefix sums over per-token wordpiece
+	lengths, so no token is tokenized more than once per document.
+
+	Going back from the end of a quote (and then ahead), the window takes up to *window* tokens outside of
+	quotes while the running wordpiece count stays under max_before (and then max_total); each [PAR] and
+	quote end crossed counts as one extra wordpiece.
+
+	"""
+
+	def __init__(self, wp_lens, in_quotes, end_quotes, paragraph_ids, window=50, max_before=350, max_total=475):
+
+		self.wp_lens=np.asarray(wp_lens, dtype=np.int64)
+		self.window=window
+		self.max_before=max_before
+		self.max_total=max_total
+
+		n=len(self.wp_lens)
+		paragraph_ids=np.asarray(paragraph_ids)
+		out_quote=np.asarray(in_quotes) == 0
+
+		is_quote_end=np.zeros(n, dtype=np.int64)
+		is_quote_end[list(end_quotes)]=1
+
+		# paragraph changes relative to the previous token (going ahead) and the next token (going back)
+		self.par_change=np.zeros(n, dtype=np.int64)
+		self.par_change[1:]=paragraph_ids[1:] != paragraph_ids[:-1]
+		self.next_par_change=np.zeros(n, dtype=np.int64)
+		self.next_par_change[:-1]=self.par_change[1:]
+
+		self.paragraph_ids=paragraph_ids
+		self.base=out_quote*self.wp_lens + is_quote_end
+
+		self.out_quote_cum=np.concatenate(([0], np.cumsum(out_quote)))
+		self.back_cum=np.concatenate(([0], np.cumsum(self.base + self.next_par_change)))
+		self.ahead_cum=np.concatenate(([0], np.cumsum(self.base + self.par_change)))
+
+	def get_window(self, end_tok):
+
+		""" Start and end (inclusive) token of the context window for the quote ending at end_tok """
+
+		n=len(self.wp_lens)
+
+		# the first token visited always counts as a new paragraph
+		fix=1-self.next_par_change[end_tok]
+
+		# going back: token s is taken if fewer than *window* out-of-quote tokens and fewer than max_before
+		# wordpieces (including its own) have been seen in (s, end_tok]
+		lo=max(0, bisect.bisect_right(self.out_quote_cum, self.out_quote_cum[end_tok+1]-self.window)-1)
+		lo=max(lo, bisect.bisect_right(self.back_cum, self.back_cum[end_tok+1]+fix-self.max_before)-1)
+
+		positions=np.arange(end_tok, lo-1, -1)
+		seen=self.back_cum[end_tok+1]-self.back_cum[positions+1]+fix
+		seen[0]=0
+
+		fails=np.flatnonzero(seen + self.wp_lens[positions] >= self.max_before)
+		start=positions[fails[0]]+1 if len(fails) > 0 else lo
+
+		if start > end_tok:
+			wp_tok_count=0
+			par_change=1
+		else:
+			wp_tok_count=self.back_cum[end_tok+1]-self.back_cum[start]+fix
+			par_change=int(self.paragraph_ids[end_tok] != self.paragraph_ids[start])
+
+		# going ahead (starting from end_tok again): the same, up to max_total wordpieces overall
+		first=self.base[end_tok]+par_change
+
+		hi=min(n-1, bisect.bisect_left(self.out_quote_cum, self.out_quote_cum[end_tok]+self.window)-1)
+		hi=min(hi, max(end_tok, bisect.bisect_left(self.ahead_cum, self.max_total-wp_tok_count-first+self.ahead_cum[end_tok+1])-1))
+
+		positions=np.arange(end_tok, hi+1)
+		seen=wp_tok_count+first+self.ahead_cum[positions]-self.ahead_cum[end_tok+1]
+		seen[0]=wp_tok_count
+
+		fails=np.flatnonzero(seen + self.wp_lens[positions] >= self.max_total)
+		end=positions[fails[0]] if len(fails) > 0 else hi+1
+
+		return int(start), int(end)-1
+
+
+class QuoteChains:
+
+	"""
+	Disjoint sets linking quotes to their speakers.  A quote attributed to another quote (an [ALTQUOTE]
+	candidate) shares that quote's speaker, so each quote points to the speaker span at the root of its chain;
+	find is iterative with path compression, so arbitrarily long back-and-forth dialogues resolve in
+	(near) linear time.
+
+	"""
+
+	def __init__(self):
+		self.parent={}
+
+	def find(self, node):
+
+		root=node
+		while root in self.parent:
+			root=self.parent[root]
+
+		while node != root:
+			self.parent[node], node=root, self.parent[node]
+
+		return root
+
+	def link(self, quote, target):
+
+		root=self.find(target)
+
+		# a quote can't be its own speaker
+		if root != quote:
+			self.parent[quote]=root
+
+		return root
+
+
 class QuotationAttribution:
 
-	def __init__(self, modelFile):
+	def __init__(self, modelFile, use_fast_tokenizer=False):
 
 		device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
 		base_model=re.sub("google_bert", "google/bert", modelFile.split("/")[-1])
 		base_model=re.sub(".model", "", base_model)
 
-		self.model = BERTSpeakerID(base_model=base_model)
+		self.model = BERTSpeakerID(base_model=base_model, use_fast_tokenizer=use_fast_tokenizer)
 		state_dict = torch.load(modelFile, map_location=device)
 		state_dict = remove_position_ids_from_state_dict(state_dict)
 		self.model.load_state_dict(state_dict)
 		self.model.to(device)
 		self.model.eval()
 
-	def tag(self, quotes, entities, tokens):
+		# number of quotes attributed in the last call to tag, and how many of those didn't need the model
+		self.num_quotes=0
+		self.num_short_circuited=0
 
-		def get_base(start, end, preds):
-			if (start, end) in preds:
-				s,e=preds[(start,end)]
-				return get_base(s,e,preds)
-
-			return start, end
+	def tag(self, quotes, entities, tokens, wordpiece_cache=None):
 
 		attributions=[None]*len(quotes)
 
@@ -39,70 +156,89 @@ class QuotationAttribution:
 		for idx, (start, end, cat, text) in enumerate(entities):
 			entity_by_position[start, end]=idx
 
-		texts, metas, positions, global_entity_positions, quote_indexes=self.get_representation(quotes, entities, tokens)
+		if wordpiece_cache is None:
+			wordpiece_cache=WordpieceCache()
+
+		texts, metas, positions, global_entity_positions, quote_indexes=self.get_representation(quotes, entities, tokens, wordpiece_cache=wordpiece_cache)
 
-		x_batches, m_batches, y_batches, o_batches=self.model.get_batches(texts, metas)
+		# quotes with a single candidate are resolved without the model; only the rest are batched through it
+		predictions=[None]*len(texts)
+		ambiguous=[]
+		for prediction_id, (_, labels, _) in enumerate(metas):
+			if len(labels) == 1:
+				predictions[prediction_id]=0
+			elif len(labels) > 1:
+				ambiguous.append(prediction_id)
 
-		all_preds={}
-		quote_chain={}
+		self.num_quotes=len(texts)
+		self.num_short_circuited=len(texts)-len(ambiguous)
 
-		idd=0
-		prediction_id=0
+		x_batches, m_batches, y_batches, o_batches=self.model.get_batches([texts[i] for i in ambiguous], [metas[i] for i in ambiguous], wordpiece_cache=wordpiece_cache)
 
+		k=0
 		for x1, m1, y1, o1 in zip(x_batches, m_batches, y_batches, o_batches):
 			y_pred = self.model.forward(x1, m1)
 			orig, meta=o1
-			predictions=torch.argmax(y_pred, axis=1).detach().cpu().numpy()
-			for idx, pred in enumerate(predictions):
-
-				global_quote_id=quote_indexes[prediction_id]
+			batch_predictions=torch.argmax(y_pred, axis=1).detach().cpu().numpy()
+			for idx, pred in enumerate(batch_predictions):
 
 				prediction=pred[0]
-				quote_start, quote_end=quotes[global_quote_id]
-				sent=orig[idx]
-				predval=y1["eid"][idx][prediction]
 
 				if prediction >= len(meta[idx][1]):
 					prediction=torch.argmax(y_pred[idx][:len(meta[idx][1])])
 
-				g_start, g_end=global_entity_positions[prediction_id][prediction]
+				predictions[ambiguous[k]]=int(prediction)
+				k+=1
 
-				cat,start, end, orig_text=positions[prediction_id][prediction]
+		quote_chains=QuoteChains()
 
-				if cat == "QUOTE":
-					g_start, g_end=get_base(start, end, quote_chain)
-	
-				if (g_start, g_end) in entity_by_position:
-					quote_chain[quote_start, quote_end]=g_start, g_end
-					attributions[prediction_id]=entity_by_position[g_start, g_end]
-				else:
-					print("Cannot resolve quotation")
+		for prediction_id, prediction in enumerate(predictions):
+
+			if prediction is None:
+				continue
+
+			global_quote_id=quote_indexes[prediction_id]
 
-				ent_start, ent_end, lab, ent_eid=meta[idx][1][prediction]
+			quote_start, quote_end=quotes[global_quote_id]
+			sent=texts[prediction_id]
 
-				if ' '.join(sent[ent_start:ent_end]) == "[PAR]":
-					print("Problem!!!! Linked [PAR]")
-					sys.exit(1)
-							
-				prediction_id+=1
+			g_start, g_end=global_entity_positions[prediction_id][prediction]
+
+			cat,start, end, orig_text=positions[prediction_id][prediction]
+
+			if cat == "QUOTE":
+				g_start, g_end=quote_chains.find((start, end))
+
+			if (g_start, g_end) in entity_by_position:
+				quote_chains.link((quote_start, quote_end), (g_start, g_end))
+				attributions[prediction_id]=entity_by_position[g_start, g_end]
+			else:
+				print("Cannot resolve quotation")
+
+			ent_start, ent_end, lab, ent_eid=metas[prediction_id][1][prediction]
+
+			if ' '.join(sent[ent_start:ent_end]) == "[PAR]":
+				print("Problem!!!! Linked [PAR]")
+				sys.exit(1)
 
 		return attributions
 
 
 
-	def get_representation(self, quotes, entities, tokens, doLowerCase=True):
+	def get_representation(self, quotes, entities, tokens, doLowerCase=True, wordpiece_cache=None):
+
+		if wordpiece_cache is None:
+			wordpiece_cache=WordpieceCache()
 
 		def convert_word(word):
-			if word == "[ALTQUOTE]" or word == "[PAR]" or word == "[QUOTE]":
-				word=word
+			if doLowerCase:
+				return normalize_word(word, lowercase=True)
+			return word
 
-			elif doLowerCase:
-				if word[0].lower() != word[0]:
-					word="[CAP] " + word.lower()
-				else:
-					word=word.lower()
+		def num_wordpieces(word):
+			return len(wordpiece_cache.tokenize(self.model.tokenizer, convert_word(word)))
 
-			return word
+		wordpiece_cache.prime(self.model.tokenizer, [tok.text for tok in tokens], lowercase=doLowerCase)
 
 		window=50
 
@@ -135,43 +271,14 @@ class QuotationAttribution:
 				entities_by_start[start]={}
 			entities_by_start[start][end]=1
 
+		wp_lens=[num_wordpieces(tok.text) for tok in tokens]
+		special_lens={tok: num_wordpieces(tok) for tok in ["[PAR]", "[QUOTE]", "[ALTQUOTE]"]}
+
+		windows=QuoteWindows(wp_lens, in_quotes, end_quotes, [tok.paragraph_id for tok in tokens], window=window)
+
 		for q_id, (start_tok, end_tok) in enumerate(quotes):
 
-			start=end_tok
-			count=0
-			wp_tok_count=0
-			# go back *window* tokens, not counting tokens that are in quotes
-			lastPar=None
-			while start >= 0 and count < window and wp_tok_count + len(self.model.tokenizer.tokenize(convert_word(tokens[start].text))) < 350:
-				if in_quotes[start] == 0:
-					count+=1
-					wp_tok_count+=len(self.model.tokenizer.tokenize(convert_word(tokens[start].text)))
-				if start in end_quotes:
-					wp_tok_count+=1
-				if tokens[start].paragraph_id != lastPar:
-					wp_tok_count+=1
-				lastPar=tokens[start].paragraph_id
-
-				start-=1
-
-			start+=1
-
-			# go ahead *window* tokens, not counting tokens that are in quotes
-			count=0
-			end=end_tok
-			while end < len(tokens) and count < window and wp_tok_count + len(self.model.tokenizer.tokenize(convert_word(tokens[end].text))) < 475:
-				if in_quotes[end] == 0:
-					count+=1
-					wp_tok_count+=len(self.model.tokenizer.tokenize(convert_word(tokens[end].text)))
-				if end in end_quotes:
-					wp_tok_count+=1
-				if tokens[end].paragraph_id != lastPar:
-					wp_tok_count+=1
-				lastPar=tokens[end].paragraph_id
-
-				end+=1
-
-			end-=1
+			start, end=windows.get_window(end_tok)
 
 			if end < end_tok+1:
 				end=end_tok+1
@@ -179,6 +286,7 @@ class QuotationAttribution:
 
 			toks=[]
 			cands=[]
+			tot_toks=0
 
 			lastPar=None
 
@@ -201,12 +309,14 @@ class QuotationAttribution:
 					toks.append("[PAR]")
 					reverse_map.append(i)
 					offset+=1
+					tot_toks+=special_lens["[PAR]"]
 
 				# if the token is not in a quotation, add it to the context representation
 				# if it is in a quotation, decrease the offset
 				if not in_quotes[i]:
 					toks.append(tokens[i].text)
 					reverse_map.append(i)
+					tot_toks+=wp_lens[i]
 				else:
 					offset-=1
 
@@ -216,6 +326,7 @@ class QuotationAttribution:
 					toks.append("[QUOTE]")
 					reverse_map.append(i)
 					offset+=1
+					tot_toks+=special_lens["[QUOTE]"]
 
 				# if the token ends a *different* quote, add an [ALTQUOTE] pseudo-token to represent it
 				elif i in end_quotes:
@@ -223,6 +334,7 @@ class QuotationAttribution:
 					toks.append("[ALTQUOTE]")
 					reverse_map.append(i)
 					offset+=1
+					tot_toks+=special_lens["[ALTQUOTE]"]
 
 					(q_start, q_end)=quotes[end_quotes[i]]
 		
@@ -257,9 +369,6 @@ class QuotationAttribution:
 								# print(inserts[entity_end-start])
 								cands.append((min(abs(entity_end-start_tok), abs(entity_start-end_tok)), entity_start+inserts[entity_start-start]-start, entity_end+inserts[entity_end-start]-start, None, "ENT", entity_start, entity_end))
 
-			tot_toks=0
-			for tok in toks:
-				tot_toks+=len(self.model.tokenizer.tokenize(convert_word(tok)))
 			if tot_toks > 500:
 				raise ValueError("Quotation window is unexpectedly long: %s" % tot_toks)
 
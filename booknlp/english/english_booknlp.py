@@ -1,13 +1,15 @@
 import sys
 import spacy
 import copy
-from booknlp.common.pipelines import SpacyPipeline
+from booknlp.common.pipelines import SpacyPipeline, get_token_column
 from booknlp.english.entity_tagger import LitBankEntityTagger
-from booknlp.english.gender_inference_model_1 import GenderEM
-from booknlp.english.name_coref import NameCoref
+from booknlp.english.gender_inference_model_1 import GenderEM, load_gender_hyperparameters
+from booknlp.english.name_coref import NameCoref, load_aliases
 from booknlp.english.litbank_coref import LitBankCoref
 from booknlp.english.litbank_quote import QuoteTagger
 from booknlp.english.bert_qa import QuotationAttribution
+from booknlp.common.wordpiece import WordpieceCache, configure_shared_cache
+import booknlp.common.crf as crf
 from os.path import join
 import os
 import json
@@ -35,6 +37,14 @@ class EnglishBookNLP:
 
 			spacy_nlp = spacy.load(spacy_model, disable=["ner"])
 
+			# CRF decoding kernel: "torch" (default), or the CPU kernels "numpy" or "numba"
+			if "crf_backend" in model_params:
+				crf.set_viterbi_backend(model_params["crf_backend"])
+
+			# size of the process-wide LRU of wordpiece tokenizations shared across documents (0 disables it)
+			if "wordpiece_cache_size" in model_params:
+				configure_shared_cache(model_params["wordpiece_cache_size"])
+
 			valid_keys=set("entity,event,supersense,quote,coref".split(","))
 			
 			pipes=model_params["pipeline"].split(",")
@@ -116,6 +126,8 @@ class EnglishBookNLP:
 				elif pipe == "quote":
 					self.doQuoteAttrib=True
 
+			self.pipes=set(pipes)
+
 			tagsetPath="data/entity_cat.tagset"
 			tagsetPath = pkg_resources.resource_filename(__name__, tagsetPath)
 
@@ -130,6 +142,18 @@ class EnglishBookNLP:
 			if "pronominalCorefOnly" in model_params:
 				pronominalCorefOnly=model_params["pronominalCorefOnly"]
 
+			# use Rust-backed BERT tokenizers (identical wordpieces, batched per document) instead of the pure-Python ones
+			use_fast_tokenizer=False
+
+			if "fast_tokenizer" in model_params:
+				use_fast_tokenizer=model_params["fast_tokenizer"]
+
+			# maximum number of (padded) wordpieces per entity tagger batch; by default batches hold up to 32 windows
+			entity_batch_tokens=None
+
+			if "entity_batch_tokens" in model_params:
+				entity_batch_tokens=model_params["entity_batch_tokens"]
+
 			if not self.doEntities and self.doCoref:
 				print("coref requires entity tagging")
 				sys.exit(1)
@@ -145,22 +169,75 @@ class EnglishBookNLP:
 			self.quoteTagger=QuoteTagger()
 
 			if self.doEntities:
-				self.entityTagger=LitBankEntityTagger(self.entityPath, tagsetPath)
+				self.entityTagger=LitBankEntityTagger(self.entityPath, tagsetPath, use_fast_tokenizer=use_fast_tokenizer, batch_max_tokens=entity_batch_tokens)
 				aliasPath = pkg_resources.resource_filename(__name__, "data/aliases.txt")
-				self.name_resolver=NameCoref(aliasPath)
+				self.name_resolver=NameCoref(aliases=load_aliases(aliasPath))
 
 
 			if self.doQuoteAttrib:
-				self.quote_attrib=QuotationAttribution(self.quoteAttribModel)
+				self.quote_attrib=QuotationAttribution(self.quoteAttribModel, use_fast_tokenizer=use_fast_tokenizer)
 
 			
 			if self.doCoref:
-				self.litbank_coref=LitBankCoref(self.coref_model, self.gender_cats, pronominalCorefOnly=pronominalCorefOnly)
+				self.litbank_coref=LitBankCoref(self.coref_model, self.gender_cats, pronominalCorefOnly=pronominalCorefOnly, use_fast_tokenizer=use_fast_tokenizer)
+
+			# parse with spaCy in this many processes, over shards of about spacy_shard_size characters split at paragraph breaks
+			spacy_n_process=1
+			spacy_shard_size=None
+
+			if "spacy_n_process" in model_params:
+				spacy_n_process=model_params["spacy_n_process"]
+			if "spacy_shard_size" in model_params:
+				spacy_shard_size=model_params["spacy_shard_size"]
+
+			# "full" always runs spaCy's parser and lemmatizer; "auto" only runs them when coref is in the pipeline, since
+			# only the character data in the .book output (and the gender heads it needs) use the parse and lemmas
+			spacy_syntax="full"
+			if "spacy_syntax" in model_params:
+				spacy_syntax=model_params["spacy_syntax"]
+			if spacy_syntax not in ("full", "auto"):
+				print("unknown spacy_syntax: %s" % spacy_syntax)
+				sys.exit(1)
+			self.spacy_syntax=spacy_syntax
 
-			self.tagger=SpacyPipeline(spacy_nlp)
+			self.tagger=SpacyPipeline(spacy_nlp, n_process=spacy_n_process, shard_size=spacy_shard_size, syntax=spacy_syntax == "full" or self.doCoref)
 
 			print("--- startup: %.3f seconds ---" % (time.time() - start_time))
 
+	def get_pipes(self, pipeline=None):
+
+		"""
+		The set of pipes to run for one call: pipeline is a subset of the pipes this model was loaded with (a list, or
+		a comma-separated string like the model's own), or None for all of them.  Raises ValueError if it names an
+		unknown or unloaded pipe, or leaves out a pipe another one depends on.
+
+		"""
+
+		if pipeline is None:
+			return self.pipes
+
+		if isinstance(pipeline, str):
+			pipeline=pipeline.split(",")
+
+		pipes=set(pipeline)
+		for pipe in pipeline:
+			if pipe not in self.pipes:
+				raise ValueError("pipe %s is not one of the loaded pipes (%s)" % (pipe, ",".join(sorted(self.pipes))))
+
+		if "coref" in pipes and "entity" not in pipes:
+			raise ValueError("coref requires entity tagging")
+		if "coref" in pipes and "quote" not in pipes:
+			raise ValueError("coref requires quotation attribution")
+		if "quote" in pipes and "entity" not in pipes:
+			raise ValueError("quotation attribution requires entity tagging")
+
+		return pipes
+
+	def needs_syntax(self, doCoref):
+
+		# with spacy_syntax="auto", only the character data built after coref needs the parse
+		return self.spacy_syntax == "full" or doCoref
+
 	def get_syntax(self, tokens, entities, assignments, genders):
 
 		def check_conj(tok, tokens):
@@ -186,10 +263,10 @@ class EnglishBookNLP:
 
 
 		toks_by_children={}
-		for tok in tokens:
-			if tok.dephead not in toks_by_children:
-				toks_by_children[tok.dephead]={}
-			toks_by_children[tok.dephead][tok]=1
+		for token_id, dephead in zip(get_token_column(tokens, "token_id"), get_token_column(tokens, "dephead")):
+			if dephead not in toks_by_children:
+				toks_by_children[dephead]={}
+			toks_by_children[dephead][token_id]=1
 
 		for idx, (start_token, end_token, cat, phrase) in enumerate(entities):
 			ner_prop=cat.split("_")[0]
@@ -227,17 +304,15 @@ class EnglishBookNLP:
 				# nsubj
 				# mod
 				if tok.deprel == "nsubj" and head.lemma == "be":
-					for sibling in toks_by_children[head.token_id]:
+					for sibling_id in toks_by_children[head.token_id]:
 
 						# "he was strong and happy", where happy -> conj -> strong -> attr/acomp -> be
-						sibling_id=sibling.token_id
 						sibling_tok=tokens[sibling_id]
 						if (sibling_tok.deprel == "attr" or sibling_tok.deprel == "acomp") and (sibling_tok.pos == "NOUN" or sibling_tok.pos == "ADJ"):
 							mods[coref].append({"w":sibling_tok.text, "i":sibling_tok.token_id})
 
-							if sibling.token_id in toks_by_children:
-								for grandsibling in toks_by_children[sibling.token_id]:
-									grandsibling_id=grandsibling.token_id
+							if sibling_id in toks_by_children:
+								for grandsibling_id in toks_by_children[sibling_id]:
 									grandsibling_tok=tokens[grandsibling_id]
 
 									if grandsibling_tok.deprel == "conj" and (grandsibling_tok.pos == "NOUN" or grandsibling_tok.pos == "ADJ"):
@@ -250,8 +325,7 @@ class EnglishBookNLP:
 					agents[coref].append({"w":head.text, "i":head.token_id})
 
 				# "Bill ducked and ran", where ran -> conj -> ducked
-					for sibling in toks_by_children[head.token_id]:
-						sibling_id=sibling.token_id
+					for sibling_id in toks_by_children[head.token_id]:
 						sibling_tok=tokens[sibling_id]
 						if sibling_tok.deprel == "conj" and sibling_tok.pos == "VERB":
 							agents[coref].append({"w":sibling_tok.text, "i":sibling_tok.token_id})
@@ -276,8 +350,7 @@ class EnglishBookNLP:
 					poss[coref].append({"w":head.text, "i":head.token_id})
 
 					# "her house and car", where car -> conj -> house
-					for sibling in toks_by_children[head.token_id]:
-						sibling_id=sibling.token_id
+					for sibling_id in toks_by_children[head.token_id]:
 						sibling_tok=tokens[sibling_id]
 						if sibling_tok.deprel == "conj":
 							poss[coref].append({"w":sibling_tok.text, "i":sibling_tok.token_id})
@@ -328,13 +401,125 @@ class EnglishBookNLP:
 		return data
 			
 
-	def process_text(self, text: str) -> dict:
+	def annotate(self, text, pipeline=None, verbose=False):
+
+		"""
+		Run the pipeline (or the subset of it given, see get_pipes) over text in memory.  Returns the tokens and the
+		output of every stage, with None for the stages that didn't run:
+			quotes: (start, end) token spans
+			entities: sorted (start, end, cat, text) mentions
+			supersense: (start, end, cat, text) spans
+			attributed_quotations: index into entities of each quote's speaker (or None)
+			assignments: coref id of each entity
+			characters: the character data of the .book output
+		verbose: print the time each stage takes
+
+		"""
+
+		pipes=self.get_pipes(pipeline)
+		doEntities="entity" in pipes
+		doQuoteAttrib="quote" in pipes
+		doCoref="coref" in pipes
+		doSS="supersense" in pipes
+		doEvent="event" in pipes
+
+		start_time=time.time()
+
+		def report(stage, note=""):
+			nonlocal start_time
+			if verbose:
+				print("--- %s: %.3f seconds%s ---" % (stage, time.time() - start_time, note))
+			start_time=time.time()
+
+		with torch.no_grad():
+
+			tokens=self.tagger.tag(text, syntax=self.needs_syntax(doCoref))
+
+			report("spacy")
+
+			# wordpiece tokenizations shared by the entity tagger, quote attribution and coref
+			wordpiece_cache=WordpieceCache()
+
+			data={"tokens": tokens, "quotes": None, "entities": None, "supersense": None, "attributed_quotations": None, "assignments": None, "characters": None}
+
+			if doEvent or doEntities or doSS:
+				entity_vals=self.entityTagger.tag(tokens, doEvent=doEvent, doEntities=doEntities, doSS=doSS, wordpiece_cache=wordpiece_cache)
+				entity_vals["entities"]=sorted(entity_vals["entities"])
+
+				if doSS:
+					data["supersense"]=entity_vals["supersense"]
+
+				if doEvent:
+					events=entity_vals["events"]
+					for token in tokens:
+						if token.token_id in events:
+							token.event="EVENT"
+
+				report("entities")
+
+			quotes=self.quoteTagger.tag(tokens)
+			data["quotes"]=quotes
+
+			report("quotes")
+
+			if doQuoteAttrib:
+				entities=entity_vals["entities"]
+				attributed_quotations=self.quote_attrib.tag(quotes, entities, tokens, wordpiece_cache=wordpiece_cache)
+				data["attributed_quotations"]=attributed_quotations
+
+				report("attribution", " (%s of %s quotes without the model)" % (self.quote_attrib.num_short_circuited, self.quote_attrib.num_quotes))
+
+			if doEntities:
+				entities=entity_vals["entities"]
+				data["entities"]=entities
+
+				in_quotes=[]
+				for start, end, cat, text in entities:
+					if tokens[start].inQuote or tokens[end].inQuote:
+						in_quotes.append(1)
+					else:
+						in_quotes.append(0)
+
+				# Create entity for first-person narrator, if present
+				refs=self.name_resolver.cluster_narrator(entities, in_quotes, tokens)
+
+				# Cluster non-PER PROP mentions that are identical
+				refs=self.name_resolver.cluster_identical_propers(entities, refs)
+
+				# Cluster mentions of named people
+				refs=self.name_resolver.cluster_only_nouns(entities, refs, tokens)
+
+				report("name coref")
+
+				# Infer referential gender from he/she/they mentions around characters
+				genderEM=GenderEM(tokens=tokens, entities=entities, refs=refs, genders=self.gender_cats, hyperparameters=load_gender_hyperparameters(self.gender_hyperparameterFile, self.gender_cats))
+				genders=genderEM.tag(entities, tokens, refs)
+
+				data["assignments"]=copy.deepcopy(refs)
+
+			if doCoref:
+				torch.cuda.empty_cache()
+				assignments=self.litbank_coref.tag(tokens, entities, refs, genders, attributed_quotations, quotes, wordpiece_cache=wordpiece_cache)
+				data["assignments"]=assignments
+
+				report("coref")
+
+				# Update gender estimates from coref data
+				genders=genderEM.update_gender_from_coref(genders, entities, assignments)
+
+				chardata=self.get_syntax(tokens, entities, assignments, genders)
+				data["characters"]=chardata["characters"]
+
+			return data
+
+	def process_text(self, text: str, pipeline=None) -> dict:
 		"""Process text in-memory and return structured results.
 		
 		This method bypasses file I/O for better performance.
 		
 		Args:
 			text: The text to analyze.
+			pipeline: Pipes to run (see get_pipes); defaults to every loaded pipe.
 			
 		Returns:
 			Dictionary containing:
@@ -342,143 +527,222 @@ class EnglishBookNLP:
 				- entities: List of entity dicts with char offsets  
 				- quotes: List of quote dicts with speaker attribution
 				- characters: List of character dicts
+				- supersenses: List of supersense dicts with char offsets
+				- events: List of event token dicts with char offsets
+
+		Raises:
+			ValueError: If the pipeline is invalid for this model.
 		"""
+		pipes = self.get_pipes(pipeline)
+
 		if not text or len(text.strip()) == 0:
-			return {"tokens": [], "entities": [], "quotes": [], "characters": []}
-			
-		with torch.no_grad():
-			# Tokenize text directly (no file I/O)
-			tokens = self.tagger.tag(text)
-			
-			result = {
-				"tokens": [],
-				"entities": [],
-				"quotes": [],
-				"characters": [],
-				"token_count": len(tokens),
-			}
-			
-			# Build token list with char offsets
+			return {"tokens": [], "entities": [], "quotes": [], "characters": [], "supersenses": [], "events": []}
+
+		data = self.annotate(text, pipeline=pipes)
+		tokens = data["tokens"]
+		entities = data["entities"]
+		assignments = data["assignments"]
+
+		result = {
+			"tokens": [],
+			"entities": [],
+			"quotes": [],
+			"characters": [],
+			"supersenses": [],
+			"events": [],
+			"token_count": len(tokens),
+		}
+
+		# Build token list with char offsets
+		for tok in tokens:
+			result["tokens"].append({
+				"text": tok.text,
+				"lemma": tok.lemma,
+				"pos": tok.pos,
+				"token_id": tok.token_id,
+				"sentence_id": tok.sentence_id,
+				"start_char": tok.startByte,
+				"end_char": tok.endByte,
+			})
+
+		if "event" in pipes:
 			for tok in tokens:
-				result["tokens"].append({
-					"text": tok.text,
-					"lemma": tok.lemma,
-					"pos": tok.pos,
-					"token_id": tok.token_id,
-					"sentence_id": tok.sentence_id,
-					"start_char": tok.startByte,
-					"end_char": tok.endByte,
-				})
-			
-			entities = []
-			assignments = None
-			genders = {}
-			attributed_quotations = []
-			
-			# Entity tagging
-			if self.doEvent or self.doEntities or self.doSS:
-				entity_vals = self.entityTagger.tag(tokens, doEvent=self.doEvent, doEntities=self.doEntities, doSS=self.doSS)
-				entity_vals["entities"] = sorted(entity_vals["entities"])
-				
-				if self.doEvent:
-					events = entity_vals["events"]
-					for token in tokens:
-						if token.token_id in events:
-							token.event = "EVENT"
-			
-			# Quote detection
-			in_quotes = []
-			quotes = self.quoteTagger.tag(tokens)
-			
-			# Quote attribution
-			if self.doQuoteAttrib:
-				entities = entity_vals["entities"]
-				attributed_quotations = self.quote_attrib.tag(quotes, entities, tokens)
-			
-			# Entity processing
-			if self.doEntities:
-				entities = entity_vals["entities"]
-				in_quotes = []
-				
-				for start, end, cat, text_span in entities:
-					if tokens[start].inQuote or tokens[end].inQuote:
-						in_quotes.append(1)
-					else:
-						in_quotes.append(0)
-				
-				# Cluster names
-				refs = self.name_resolver.cluster_narrator(entities, in_quotes, tokens)
-				refs = self.name_resolver.cluster_identical_propers(entities, refs)
-				refs = self.name_resolver.cluster_only_nouns(entities, refs, tokens)
-				
-				# Gender inference
-				genderEM = GenderEM(tokens=tokens, entities=entities, refs=refs, genders=self.gender_cats, hyperparameterFile=self.gender_hyperparameterFile)
-				genders = genderEM.tag(entities, tokens, refs)
-			
-			assignments = None
-			if self.doEntities:
-				assignments = copy.deepcopy(refs)
-			
-			# Coreference resolution
-			if self.doCoref:
-				torch.cuda.empty_cache()
-				assignments = self.litbank_coref.tag(tokens, entities, refs, genders, attributed_quotations, quotes)
-				genders = genderEM.update_gender_from_coref(genders, entities, assignments)
-				
-				# Build character data
-				chardata = self.get_syntax(tokens, entities, assignments, genders)
-				result["characters"] = chardata.get("characters", [])
-			
-			# Build entities output with char offsets
-			if self.doEntities and assignments is not None:
-				for idx, assignment in enumerate(assignments):
-					start, end, cat, text_span = entities[idx]
-					ner_prop = cat.split("_")[0]
-					ner_type = cat.split("_")[1]
-					result["entities"].append({
-						"coref_id": assignment,
-						"start_token": start,
-						"end_token": end,
-						"start_char": tokens[start].startByte,
-						"end_char": tokens[end].endByte,
-						"prop": ner_prop,
-						"cat": ner_type,
-						"text": text_span,
+				if tok.event == "EVENT":
+					result["events"].append({
+						"token_id": tok.token_id,
+						"sentence_id": tok.sentence_id,
+						"start_char": tok.startByte,
+						"end_char": tok.endByte,
+						"text": tok.text,
 					})
-			
-			# Build quotes output with char offsets
-			if self.doQuoteAttrib and assignments is not None:
-				for idx, (q_start, q_end) in enumerate(quotes):
-					mention = attributed_quotations[idx]
-					quote_data = {
-						"quote_start": q_start,
-						"quote_end": q_end,
-						"start_char": tokens[q_start].startByte,
-						"end_char": tokens[q_end].endByte,
-						"quote": ' '.join([tok.text for tok in tokens[q_start:q_end+1]]),
-					}
-					if mention is not None:
-						entity = entities[mention]
-						speaker_id = assignments[mention]
-						quote_data["mention_start"] = entity[0]
-						quote_data["mention_end"] = entity[1]
-						quote_data["mention_phrase"] = entity[3]
-						quote_data["char_id"] = speaker_id
-					else:
-						quote_data["mention_start"] = None
-						quote_data["mention_end"] = None
-						quote_data["mention_phrase"] = None
-						quote_data["char_id"] = None
-					result["quotes"].append(quote_data)
-			
+
+		if data["supersense"] is not None:
+			for start, end, cat, text_span in data["supersense"]:
+				result["supersenses"].append({
+					"start_token": start,
+					"end_token": end,
+					"start_char": tokens[start].startByte,
+					"end_char": tokens[end].endByte,
+					"cat": cat,
+					"text": text_span,
+				})
+
+		if data["characters"] is not None:
+			result["characters"] = data["characters"]
+
+		# Build entities output with char offsets
+		if entities is not None:
+			for idx, assignment in enumerate(assignments):
+				start, end, cat, text_span = entities[idx]
+				ner_prop = cat.split("_")[0]
+				ner_type = cat.split("_")[1]
+				result["entities"].append({
+					"coref_id": assignment,
+					"start_token": start,
+					"end_token": end,
+					"start_char": tokens[start].startByte,
+					"end_char": tokens[end].endByte,
+					"prop": ner_prop,
+					"cat": ner_type,
+					"text": text_span,
+				})
+
+		# Build quotes output with char offsets
+		if data["attributed_quotations"] is not None:
+			for idx, (q_start, q_end) in enumerate(data["quotes"]):
+				mention = data["attributed_quotations"][idx]
+				quote_data = {
+					"quote_start": q_start,
+					"quote_end": q_end,
+					"start_char": tokens[q_start].startByte,
+					"end_char": tokens[q_end].endByte,
+					"quote": ' '.join([tok.text for tok in tokens[q_start:q_end+1]]),
+				}
+				if mention is not None:
+					entity = entities[mention]
+					speaker_id = assignments[mention]
+					quote_data["mention_start"] = entity[0]
+					quote_data["mention_end"] = entity[1]
+					quote_data["mention_phrase"] = entity[3]
+					quote_data["char_id"] = speaker_id
+				else:
+					quote_data["mention_start"] = None
+					quote_data["mention_end"] = None
+					quote_data["mention_phrase"] = None
+					quote_data["char_id"] = None
+				result["quotes"].append(quote_data)
+
+		return result
+
+	def process_records(self, text: str, pipeline=None) -> dict:
+		"""Process text in-memory and return the rows of the output files process() would write.
+
+		Rows use the column names of the .tokens, .entities, .quotes and .supersense files, with ints and None
+		in place of their string forms; no .book.html is generated.
+
+		Args:
+			text: The text to analyze.
+			pipeline: Pipes to run (see get_pipes); defaults to every loaded pipe.
+
+		Returns:
+			Dictionary containing:
+				- tokens: .tokens rows
+				- entities: .entities rows
+				- quotes: .quotes rows
+				- supersenses: .supersense rows
+				- events: .tokens rows of the tokens tagged as events
+				- characters: The characters of the .book file
+
+		Raises:
+			ValueError: If the pipeline is invalid for this model.
+		"""
+		pipes = self.get_pipes(pipeline)
+
+		result = {"tokens": [], "entities": [], "quotes": [], "supersenses": [], "events": [], "characters": []}
+		if not text or len(text.strip()) == 0:
 			return result
 
-	def process(self, filename, outFolder, idd):		
+		data = self.annotate(text, pipeline=pipes)
+		tokens = data["tokens"]
+		entities = data["entities"]
+		assignments = data["assignments"]
+
+		for tok in tokens:
+			row = {
+				"paragraph_ID": tok.paragraph_id,
+				"sentence_ID": tok.sentence_id,
+				"token_ID_within_sentence": tok.index_within_sentence_idx,
+				"token_ID_within_document": tok.token_id,
+				"word": tok.text,
+				"lemma": tok.lemma,
+				"byte_onset": tok.startByte,
+				"byte_offset": tok.endByte,
+				"POS_tag": tok.pos,
+				"fine_POS_tag": tok.fine_pos,
+				"dependency_relation": tok.deprel,
+				"syntactic_head_ID": tok.dephead,
+				"event": tok.event,
+			}
+			result["tokens"].append(row)
+			if "event" in pipes and tok.event == "EVENT":
+				result["events"].append(row)
+
+		if data["supersense"] is not None:
+			for start, end, cat, text_span in data["supersense"]:
+				result["supersenses"].append({
+					"start_token": start,
+					"end_token": end,
+					"supersense_category": cat,
+					"text": text_span,
+				})
+
+		if entities is not None:
+			for assignment, (start, end, cat, text_span) in zip(assignments, entities):
+				ner_prop, ner_type = cat.split("_")[:2]
+				result["entities"].append({
+					"COREF": assignment,
+					"start_token": start,
+					"end_token": end,
+					"prop": ner_prop,
+					"cat": ner_type,
+					"text": text_span,
+				})
+
+		if data["attributed_quotations"] is not None:
+			for (q_start, q_end), mention in zip(data["quotes"], data["attributed_quotations"]):
+				row = {
+					"quote_start": q_start,
+					"quote_end": q_end,
+					"mention_start": None,
+					"mention_end": None,
+					"mention_phrase": None,
+					"char_id": None,
+					"quote": ' '.join([tok.text for tok in tokens[q_start:q_end+1]]),
+				}
+				if mention is not None:
+					row["mention_start"], row["mention_end"], cat, row["mention_phrase"] = entities[mention]
+					row["char_id"] = assignments[mention]
+				result["quotes"].append(row)
+
+		if data["characters"] is not None:
+			result["characters"] = data["characters"]
+
+		return result
+
+	def process(self, filename, outFolder, idd, pipeline=None):
+
+		""" pipeline: pipes to run (see get_pipes); defaults to every loaded pipe """
+
+		pipes=self.get_pipes(pipeline)
+		doEntities="entity" in pipes
+		doQuoteAttrib="quote" in pipes
+		doCoref="coref" in pipes
+		doSS="supersense" in pipes
+		doEvent="event" in pipes
 
 		with torch.no_grad():
 
-			start_time = time.time()
-			originalTime=start_time
+			originalTime=time.time()
 
 			with open(filename) as file:
 				data=file.read()
@@ -492,109 +756,31 @@ class EnglishBookNLP:
 				except FileExistsError:
 					pass
 
-					
-				tokens=self.tagger.tag(data)
-				
-				print("--- spacy: %.3f seconds ---" % (time.time() - start_time))
-				start_time=time.time()
-
-				if self.doEvent or self.doEntities or self.doSS:
-
-					entity_vals=self.entityTagger.tag(tokens, doEvent=self.doEvent, doEntities=self.doEntities, doSS=self.doSS)
-					entity_vals["entities"]=sorted(entity_vals["entities"])
-					if self.doSS:
-						supersense_entities=entity_vals["supersense"]
-						with open(join(outFolder, "%s.supersense" % (idd)), "w", encoding="utf-8") as out:
-							out.write("start_token\tend_token\tsupersense_category\ttext\n")
-							for start, end, cat, text in supersense_entities:
-								out.write("%s\t%s\t%s\t%s\n" % (start, end, cat, text))
-
-					if self.doEvent:
-						events=entity_vals["events"]
-						for token in tokens:
-							if token.token_id in events:
-								token.event="EVENT"
+				results=self.annotate(data, pipeline=pipes, verbose=True)
+				tokens=results["tokens"]
+				quotes=results["quotes"]
+				entities=results["entities"]
+				attributed_quotations=results["attributed_quotations"]
+				assignments=results["assignments"]
 
+				if doSS:
+					with open(join(outFolder, "%s.supersense" % (idd)), "w", encoding="utf-8") as out:
+						out.write("start_token\tend_token\tsupersense_category\ttext\n")
+						for start, end, cat, text in results["supersense"]:
+							out.write("%s\t%s\t%s\t%s\n" % (start, end, cat, text))
+
+				if doEvent or doEntities or doSS:
 					with open(join(outFolder, "%s.tokens" % (idd)), "w", encoding="utf-8") as out:
 						out.write("%s\n" % '\t'.join(["paragraph_ID", "sentence_ID", "token_ID_within_sentence", "token_ID_within_document", "word", "lemma", "byte_onset", "byte_offset", "POS_tag", "fine_POS_tag", "dependency_relation", "syntactic_head_ID", "event"]))
 						for token in tokens:
 							out.write("%s\n" % token)
 
-					print("--- entities: %.3f seconds ---" % (time.time() - start_time))
-					start_time=time.time()
-
-				in_quotes=[]
-				quotes=self.quoteTagger.tag(tokens)
-
-				print("--- quotes: %.3f seconds ---" % (time.time() - start_time))
-				start_time=time.time()
-
-				if self.doQuoteAttrib:
-
-					entities=entity_vals["entities"]
-					attributed_quotations=self.quote_attrib.tag(quotes, entities, tokens)
-
-					print("--- attribution: %.3f seconds ---" % (time.time() - start_time))
-					# return time.time() - start_time
-					start_time=time.time()
-
-				if self.doEntities:
-
-					entities=entity_vals["entities"]
-		
-					in_quotes=[]
-
-					for start, end, cat, text in entities:
-	
-						if tokens[start].inQuote or tokens[end].inQuote:
-							in_quotes.append(1)
-						else:
-							in_quotes.append(0)
-
-
-					# Create entity for first-person narrator, if present
-					refs=self.name_resolver.cluster_narrator(entities, in_quotes, tokens)
-				
-					# Cluster non-PER PROP mentions that are identical
-					refs=self.name_resolver.cluster_identical_propers(entities, refs)
-
-					# Cluster mentions of named people
-					refs=self.name_resolver.cluster_only_nouns(entities, refs, tokens)
-
-					print("--- name coref: %.3f seconds ---" % (time.time() - start_time))
-
-					start_time=time.time()
-
-					# Infer referential gender from he/she/they mentions around characters
-					
-					genderEM=GenderEM(tokens=tokens, entities=entities, refs=refs, genders=self.gender_cats, hyperparameterFile=self.gender_hyperparameterFile)
-					genders=genderEM.tag(entities, tokens, refs)
-				
-				assignments=None
-				if self.doEntities:
-					assignments=copy.deepcopy(refs)
-
-				if self.doCoref:
-					torch.cuda.empty_cache()
-					assignments=self.litbank_coref.tag(tokens, entities, refs, genders, attributed_quotations, quotes)
-
-					print("--- coref: %.3f seconds ---" % (time.time() - start_time))
-					start_time=time.time()
-
-					ent_names={}
-					for a, e in zip(assignments, entities):
-						if a not in ent_names:
-							ent_names[a]=Counter()
-						ent_names[a][e[3]]+=1
-				
-					# Update gender estimates from coref data
-					genders=genderEM.update_gender_from_coref(genders, entities, assignments)
-
-					chardata=self.get_syntax(tokens, entities, assignments, genders)
+				if doCoref:
+					chardata={"characters": results["characters"]}
 					with open(join(outFolder, "%s.book" % (idd)), "w", encoding="utf-8") as out:
 						json.dump(chardata, out)
 
-				if self.doEntities:
+				if doEntities:
 					# Write entities and coref			
 					with open(join(outFolder, "%s.entities" % (idd)), "w", encoding="utf-8") as out:
 						out.write("COREF\tstart_token\tend_token\tprop\tcat\ttext\n")
@@ -605,7 +791,7 @@ class EnglishBookNLP:
 							out.write("%s\t%s\t%s\t%s\t%s\t%s\n" % (assignment, start, end, ner_prop, ner_type, text))
 
 
-				if self.doQuoteAttrib:
+				if doQuoteAttrib:
 					with open(join(outFolder, "%s.quotes" % (idd)), "w", encoding="utf-8") as out:
 						out.write('\t'.join(["quote_start", "quote_end", "mention_start", "mention_end", "mention_phrase", "char_id", "quote"]) + "\n")
 
@@ -629,7 +815,7 @@ class EnglishBookNLP:
 					
 						out.close()
 
-				if self.doQuoteAttrib and self.doCoref:
+				if doQuoteAttrib and doCoref:
 
 					# get canonical name for character
 					names={}
@@ -4,12 +4,17 @@ import torch
 import re
 import booknlp.common.layered_reader as layered_reader
 import booknlp.common.sequence_layered_reader as sequence_layered_reader
+from booknlp.common.wordpiece import WordpieceCache
 import pkg_resources
 
 class LitBankEntityTagger:
-	def __init__(self, model_file, model_tagset):
+	def __init__(self, model_file, model_tagset, use_fast_tokenizer=False, batch_max_tokens=None):
 
 		device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+		# if set, batch windows by total wordpieces (after padding) rather than by number of windows
+		self.batch_max_tokens=batch_max_tokens
+
 		self.tagset=sequence_layered_reader.read_tagset(model_tagset)
 		supersenseTagset = pkg_resources.resource_filename(__name__, "data/supersense.tagset")
 
@@ -17,7 +22,7 @@ class LitBankEntityTagger:
 		base_model=re.sub("google_bert", "google/bert", model_file.split("/")[-1])
 		base_model=re.sub(".model", "", base_model)
 
-		self.model = Tagger(freeze_bert=False, base_model=base_model, tagset_flat={"EVENT":1, "O":1}, supersense_tagset=self.supersense_tagset, tagset=self.tagset, device=device)
+		self.model = Tagger(freeze_bert=False, base_model=base_model, tagset_flat={"EVENT":1, "O":1}, supersense_tagset=self.supersense_tagset, tagset=self.tagset, device=device, use_fast_tokenizer=use_fast_tokenizer)
 
 		self.model.to(device)
 		state_dict = torch.load(model_file, map_location=device)
@@ -85,7 +90,10 @@ class LitBankEntityTagger:
 			wn_batches.append(wn_senses)
 		return wn_batches
 
-	def tag(self, toks, doEvent=True, doEntities=True, doSS=True):
+	def tag(self, toks, doEvent=True, doEntities=True, doSS=True, wordpiece_cache=None):
+
+		if wordpiece_cache is None:
+			wordpiece_cache=WordpieceCache()
 
 		max_sentence_length=500
 
@@ -102,14 +110,12 @@ class LitBankEntityTagger:
 
 		length=0
 
+		wordpiece_cache.prime(self.model.tokenizer, [tok.text for tok in toks])
+
 		for tok in toks:
 
-			wptok=tok.text
 			# working with uncased BERT models, so add a special tag to denote capitalization
-			if wptok[0].lower() != wptok[0]:
-				wptok="[CAP] " + wptok.lower()
-
-			toks=self.model.tokenizer.tokenize(wptok)
+			toks=wordpiece_cache.tokenize_word(self.model.tokenizer, tok.text)
 			if lastSid is not None and (tok.sentence_id != lastSid or length + len(toks) > max_sentence_length):
 				sents.append(sent)
 				o_sents.append(o_sent)
@@ -165,7 +171,7 @@ class LitBankEntityTagger:
 
 		sents=o_sentences
 
-		batched_sents, batched_data, batched_mask, batched_transforms, batched_orig_token_lens, ordering, order_to_batch_map = layered_reader.get_batches(self.model, sentences, batch_size, self.tagset, training=False)
+		batched_sents, batched_data, batched_mask, batched_transforms, batched_orig_token_lens, ordering, order_to_batch_map = layered_reader.get_batches(self.model, sentences, batch_size, self.tagset, training=False, max_tokens=self.batch_max_tokens)
 		
 		batch_pos={}
 		for idx, ind in enumerate(ordering):
@@ -16,30 +16,110 @@ This method encodes several assumptions:
 
 
 # requires scipy==1.5.4
-from collections import Counter
+from collections import Counter, namedtuple
 import sys
 from tqdm import tqdm
 from os import listdir
 from os.path import isfile
 import os
 from booknlp.common.pipelines import Token
+from booknlp.common.resources import load_resource
+import numpy as np
+from bisect import bisect_left
+from types import MappingProxyType
 
 import random
 
+HONORIFICS={"mr.":1, "mrs.":1, "miss":1, "lady":1, "sir":1, "captain":1, "mr":1, "lord":1, "aunt":1, "madame":1, "mrs":1, "uncle":1, "colonel":1, "monsieur":1, "mademoiselle":1, "general":1, "major":1, "sergeant":1, "ms.":1,  "king":1, "queen":1, "herr":1, "frau":1, "fräulein":1, "dame":1, "mister":1, "master":1, "mistress":1, "prince":1, "princess":1, "lieutenant":1 }
+
+# Priors read from a hyperparameter file: read-only maps from "term\tproper" and from honorifics to pseudocounts per gender
+GenderHyperparameters=namedtuple("GenderHyperparameters", ["terms", "honorific_priors"])
+
+
+def read_gender_hyperparameters(filename, genders, upper=10):
+
+	genderID={"/".join(gender):idx for idx, gender in enumerate(genders)}
+	num_genders=len(genders)
+
+	hyperparameters={}
+	honorific_priors={}
+
+	with open(filename) as file:
+		header=file.readline().rstrip()
+		gender_mapping={}
+		for idx, val in enumerate(header.split("\t")[2:]):
+			if val in genderID:
+				gender_mapping[genderID[val]]=idx+2
+
+			else:
+				print("NOTE PRIOR CATEGORY %s NOT AMONG GENDERS" % val)
+
+		for line in file:
+			cols=line.rstrip().split("\t")
+			term=cols[0]
+			proper=cols[1]
+
+			vals=[0]*(num_genders)
+			for val in gender_mapping:
+				vals[val]=float(cols[gender_mapping[val]])
+
+			first_token=term.split(" ")[0]
+			if first_token in HONORIFICS:
+				if first_token not in honorific_priors:
+					honorific_priors[first_token]=[0]*num_genders
+
+				for i in range(num_genders):
+					honorific_priors[first_token][i]+=vals[i]
+
+			total=sum(vals)
+			if total >= upper:
+				for i in range(len(vals)):
+					vals[i]=(vals[i]/total) * upper
+				
+				hyperparameters[("%s\t%s" % (term, proper)).lower()]=tuple(vals)
+
+		for honorific in honorific_priors:
+			total=sum(honorific_priors[honorific])
+			if total >= upper:
+				for i in range(num_genders):
+					honorific_priors[honorific][i]=(honorific_priors[honorific][i]/total) * upper
+
+	honorific_priors={honorific:tuple(vals) for honorific, vals in honorific_priors.items()}
+
+	return GenderHyperparameters(MappingProxyType(hyperparameters), MappingProxyType(honorific_priors))
+
+
+def load_gender_hyperparameters(filename, genders, upper=10):
+
+	""" Priors from filename, parsed once per process and shared between GenderEM instances """
+
+	return load_resource(read_gender_hyperparameters, filename, tuple(tuple(gender) for gender in genders), upper)
+
+
 class GenderEM:
 
-	def __init__(self, outfile=None, tokens=None, entities=None, entityFiles=None, tokenFiles=None, hyperparameterFile=None, distance=25, num_epochs=25, refs=None, upper=10, use_tagged_pronouns_only=True, genders=[["he", "him", "his"],["she", "her"],	["they", "them", "their"]] ):
+	def __init__(self, outfile=None, tokens=None, entities=None, entityFiles=None, tokenFiles=None, hyperparameterFile=None, distance=25, num_epochs=25, refs=None, upper=10, use_tagged_pronouns_only=True, genders=[["he", "him", "his"],["she", "her"],	["they", "them", "their"]], tolerance=1e-6, hyperparameters=None):
+
+		"""
+		hyperparameters: priors already loaded with load_gender_hyperparameters (otherwise they're loaded from
+		hyperparameterFile, through the same process-wide cache)
+
+		"""
+
 
 		# Number of epochs for EM
 		self.num_epochs=num_epochs
 
+		# Stop EM early once no alignment probability changes by more than this between epochs
+		self.tolerance=tolerance
+
 		# Candidates entities must within this number of preceding tokens of pronouns
 		self.distance=distance
 
 		# maximum pseudocount value (set lower to contrain how much influence priors have)
 		self.upper=upper
 
-		self.honorifics={"mr.":1, "mrs.":1, "miss":1, "lady":1, "sir":1, "captain":1, "mr":1, "lord":1, "aunt":1, "madame":1, "mrs":1, "uncle":1, "colonel":1, "monsieur":1, "mademoiselle":1, "general":1, "major":1, "sergeant":1, "ms.":1,  "king":1, "queen":1, "herr":1, "frau":1, "fräulein":1, "dame":1, "mister":1, "master":1, "mistress":1, "prince":1, "princess":1, "lieutenant":1 }
+		self.honorifics=HONORIFICS
 		self.honorific_priors={}
 		self.use_tagged_pronouns_only=use_tagged_pronouns_only
 		self.genders=genders
@@ -60,15 +140,24 @@ class GenderEM:
 		# f = he/she/they
 		# e = John, Kate, the man, her husband, his mother
 
-		self.joint_e_f_counts={}
-		self.e_counts={}
+		# parameters are held in arrays over the vocab (num_keys x num_genders); see intern_vocab
+		self.joint_e_f_counts=None
+		self.e_counts=None
+
+		self.t_f_e=None
 
-		self.t_f_e={}
+		# pseudocounts from the priors, computed once
+		self.priors=None
+		self.prior_totals=None
 
 		self.hyperparameters={}
 
-		if hyperparameterFile is not None:
-			self.read_hyperparams(hyperparameterFile)
+		if hyperparameters is None and hyperparameterFile is not None:
+			hyperparameters=load_gender_hyperparameters(hyperparameterFile, self.genders, self.upper)
+
+		if hyperparameters is not None:
+			self.hyperparameters=hyperparameters.terms
+			self.honorific_priors=hyperparameters.honorific_priors
 
 		self.vocab={}
 
@@ -77,6 +166,7 @@ class GenderEM:
 		elif tokens is not None and entities is not None and refs is not None:
 			self.build_vocab(tokens, entities, refs)
 
+		self.intern_vocab()
 
 		self.add_hyperparameters_to_counts(refs=refs, entities=entities, tokens=tokens)
 
@@ -86,20 +176,43 @@ class GenderEM:
 		self.outfile=outfile
 
 
+	def intern_vocab(self):
+
+		""" Map each vocab key (e.g. "tom\tprop", "17\tcoref") to a row in the parameter arrays """
+
+		self.keys=list(self.vocab)
+		self.key_ids={e:idx for idx, e in enumerate(self.keys)}
+
 	def add_hyperparameters_to_counts(self, refs=None, entities=None, tokens=None):
-		for e in self.vocab:
 
-			mf=[1]*self.num_genders
+		""" Reset the counts to the pseudocounts from the priors (which are computed on the first call only) """
 
-			# add pseudocounts if we have them from the hyperparameters
-			if self.hyperparameters is not None and e in self.hyperparameters:
-				mf=self.hyperparameters[e]
+		if self.priors is None:
+			self.priors=self.get_priors(refs=refs, entities=entities, tokens=tokens)
 
+			self.prior_totals=np.zeros(len(self.keys))
 			for f in range(self.num_genders):
-				self.joint_e_f_counts[e,f]=mf[f] + 0.1
-				if e not in self.e_counts:
-					self.e_counts[e]=0
-				self.e_counts[e]+=mf[f] + 0.1
+				self.prior_totals+=self.priors[:,f]
+
+		self.joint_e_f_counts=self.priors.copy()
+		self.e_counts=self.prior_totals.copy()
+
+	def get_term_prior(self, e):
+
+		mf=[1]*self.num_genders
+
+		# add pseudocounts if we have them from the hyperparameters
+		if self.hyperparameters is not None and e in self.hyperparameters:
+			mf=self.hyperparameters[e]
+
+		return [mf[f] + 0.1 for f in range(self.num_genders)]
+
+	def get_priors(self, refs=None, entities=None, tokens=None):
+
+		priors=np.zeros((len(self.keys), self.num_genders))
+
+		for e, eid in self.key_ids.items():
+			priors[eid]=self.get_term_prior(e)
 		
 
 		# for entities/coref IDs, update the coref ID to include priors on the names associated with that ID
@@ -128,7 +241,7 @@ class GenderEM:
 						counts[ref]=Counter()
 					counts[ref][key.lower()]+=1
 
-		for e in self.vocab:
+		for e, eid in self.key_ids.items():
 			mf=[0.]*self.num_genders
 			parts=e.split("\t")
 			if parts[1].lower() == "coref":
@@ -139,9 +252,10 @@ class GenderEM:
 					for text in counts[idd]:
 
 						# add prior over entire name if present (e.g., "[Tom]")
-						for f in range(self.num_genders):
-							if (text,f) in self.joint_e_f_counts:
-								mf[f]=self.joint_e_f_counts[text,f] * counts[idd][text]
+						if text in self.key_ids or text in self.hyperparameters:
+							term_prior=self.get_term_prior(text)
+							for f in range(self.num_genders):
+								mf[f]=term_prior[f] * counts[idd][text]
 
 					if sum(mf) > self.upper:
 						for i in range(self.num_genders):
@@ -156,53 +270,16 @@ class GenderEM:
 								mf[f]=self.honorific_priors[first_name_token][f] * counts[idd][text] * 10000
 
 
-					self.e_counts[e]=0
 					for f in range(self.num_genders):
-						self.joint_e_f_counts[e,f]=mf[f] + 0.1
-						self.e_counts[e]+=mf[f] + 0.1
+						priors[eid,f]=mf[f] + 0.1
 
-	def read_hyperparams(self, filename):
-		self.hyperparameters={}
-		with open(filename) as file:
-			header=file.readline().rstrip()
-			gender_mapping={}
-			for idx, val in enumerate(header.split("\t")[2:]):
-				if val in self.genderID:
-					gender_mapping[self.genderID[val]]=idx+2
+		return priors
 
-				else:
-					print("NOTE PRIOR CATEGORY %s NOT AMONG GENDERS" % val)
+	def read_hyperparams(self, filename):
+		hyperparameters=read_gender_hyperparameters(filename, self.genders, self.upper)
+		self.hyperparameters=hyperparameters.terms
+		self.honorific_priors=hyperparameters.honorific_priors
 
-			for line in file:
-				cols=line.rstrip().split("\t")
-				term=cols[0]
-				proper=cols[1]
-
-				vals=[0]*(self.num_genders)
-				for val in gender_mapping:
-					vals[val]=float(cols[gender_mapping[val]])
-
-				first_token=term.split(" ")[0]
-				if first_token in self.honorifics:
-					if first_token not in self.honorific_priors:
-						self.honorific_priors[first_token]=[0]*self.num_genders
-
-					for i in range(self.num_genders):
-						self.honorific_priors[first_token][i]+=vals[i]
-
-				total=sum(vals)
-				if total >= self.upper:
-					for i in range(len(vals)):
-						vals[i]=(vals[i]/total) * self.upper
-					
-					self.hyperparameters[("%s\t%s" % (term, proper)).lower()]=vals
-
-			for honorific in self.honorific_priors:
-				total=sum(self.honorific_priors[honorific])
-				if total >= self.upper:
-					for i in range(self.num_genders):
-						self.honorific_priors[honorific][i]=(self.honorific_priors[honorific][i]/total) * self.upper
-					
 	def get_head(self, start, end, tokens):
 		phraseHead=None
 		for idd in range(start, end+1):
@@ -213,9 +290,7 @@ class GenderEM:
 
 	def build_vocab(self, tokens, entities, refs=None):
 
-
-		for term in self.hyperparameters:
-			self.vocab[term]=1
+		# only terms mentioned in the document (priors on other terms can't affect the alignments)
 
 		for idx, (start, end, cat, text) in enumerate(entities):
 
@@ -273,11 +348,17 @@ class GenderEM:
 			all_Y.append(Y)
 
 
+		X=[]
+		Y=[]
+		for i in range(len(all_X)):
+			X.extend(all_X[i])
+			Y.extend(all_Y[i])
+
+		mentions, pronouns=self.get_mention_matrix(X, Y)
+
 		for epoch in range(self.num_epochs):
 			
-			for i in tqdm(range(len(all_X))):
-				for e, f in zip(all_X[i], all_Y[i]):
-					self.update(e,f)
+			self.update(mentions, pronouns)
 
 			self.maximization()
 			self.print(epoch)
@@ -289,42 +370,46 @@ class GenderEM:
 
 		X, Y=self.process(tokens, entities, refs)	
 
+		mentions, pronouns=self.get_mention_matrix(X, Y)
+
 		for epoch in range(self.num_epochs):
 			
-			for e, f in zip(X, Y):
-				self.update(e,f)
+			self.update(mentions, pronouns)
 
+			previous=self.t_f_e
 			self.maximization()
-			if epoch < self.num_epochs-1:
-				self.delete_counts()
-				self.add_hyperparameters_to_counts(refs=refs, entities=entities, tokens=tokens)
 
+			if epoch == self.num_epochs-1 or np.abs(self.t_f_e-previous).max(initial=0) <= self.tolerance:
+				break
 
-		genders={}
-		for e, f in self.t_f_e:
-			if f == 1:
+			self.delete_counts()
+			self.add_hyperparameters_to_counts(refs=refs, entities=entities, tokens=tokens)
 
-				vals={}
-				total=0
-				for i in range(self.num_genders):
-					vals[self.reverseID[i]] = self.joint_e_f_counts[e,i]
-					total+=vals[self.reverseID[i]]
 
-				if total > 0:
-					for val in vals:
-						vals[val]=float("%.3f" % (vals[val]/total))
+		genders={}
+		for eid, e in enumerate(self.keys):
+
+			vals={}
+			total=0
+			for i in range(self.num_genders):
+				vals[self.reverseID[i]] = float(self.joint_e_f_counts[eid,i])
+				total+=vals[self.reverseID[i]]
 
-				maxID=None
-				maxVal=0
+			if total > 0:
 				for val in vals:
-					if vals[val] > maxVal:
-						maxVal=vals[val]
-						maxID=val
+					vals[val]=float("%.3f" % (vals[val]/total))
 
-				cat=e.split("\t")[1]
-				if cat == "coref":
-					idd=int(e.split("\t")[0])
-					genders[idd]={"inference":vals, "argmax":maxID, "max":maxVal, "total":float("%.3f" % total)}
+			maxID=None
+			maxVal=0
+			for val in vals:
+				if vals[val] > maxVal:
+					maxVal=vals[val]
+					maxID=val
+
+			cat=e.split("\t")[1]
+			if cat == "coref":
+				idd=int(e.split("\t")[0])
+				genders[idd]={"inference":vals, "argmax":maxID, "max":maxVal, "total":float("%.3f" % total)}
 
 		return genders
 
@@ -336,61 +421,89 @@ class GenderEM:
 
 			out.write("%s\t%s\t%s\n" % ("term", "proper", '\t'.join(valstr)))
 
-			for e, f in self.t_f_e:
-				if f == 1:
-					vals=[0]*self.num_genders
-					for i in range(self.num_genders):
-						vals[i] = self.joint_e_f_counts[e,i]
+			for eid, e in enumerate(self.keys):
+				vals=[0]*self.num_genders
+				for i in range(self.num_genders):
+					vals[i] = self.joint_e_f_counts[eid,i]
 
-					out.write("%s\t%s\n" % (e, '\t'.join(["%.3f" % x for x in vals])))
+				out.write("%s\t%s\n" % (e, '\t'.join(["%.3f" % x for x in vals])))
 
 
 	# get all entities in a window *before* a target pronoun
-	def get_mentions(self, loc_starts, idx):
+	def get_mentions(self, starts, loc_starts, idx):
+
+		""" starts: the sorted token positions in loc_starts; mentions are returned nearest start first """
 
 		mentions=[]
 
-		for i in range(1,self.distance):
-			j=idx-i
-			if j in loc_starts:
-				for end, comp, text in loc_starts[j]:
-					# skip entities that enclose the pronoun 
-					if end < idx:
-						mentions.append((j, end, comp, text))
+		lo=bisect_left(starts, idx-self.distance+1)
+		hi=bisect_left(starts, idx)
+
+		for k in range(hi-1, lo-1, -1):
+			j=starts[k]
+			for end, comp, text in loc_starts[j]:
+				# skip entities that enclose the pronoun 
+				if end < idx:
+					mentions.append((j, end, comp, text))
 
 		return mentions
 
 
-	def update(self, e_seq, f_seq):
+	def get_mention_matrix(self, X, Y):
 
-		for i, f in enumerate(f_seq):
-			total=0
-			for j, e in enumerate(e_seq):
-				total+=self.t_f_e[e, f]
-			for j, e in enumerate(e_seq):
-				delta_k_i_j=self.t_f_e[e, f] / total
+		"""
+		Pack the (mentions, pronoun genders) training pairs into a padded matrix: one row per (pair, gender), with the
+		vocab ids of the pair's mentions (padded with -1), and the gender of each row.
 
-				self.joint_e_f_counts[e,f]+=delta_k_i_j
-				self.e_counts[e]+=delta_k_i_j
+		"""
 
+		rows=[]
+		pronouns=[]
+		for e_seq, f_seq in zip(X, Y):
+			ids=[self.key_ids[e] for e in e_seq]
+			for f in f_seq:
+				rows.append(ids)
+				pronouns.append(f)
 
-	def maximization(self, delete_counts=True):
+		max_len=max([len(ids) for ids in rows], default=0)
+		mentions=np.full((len(rows), max_len), -1, dtype=np.int64)
+		for i, ids in enumerate(rows):
+			mentions[i,:len(ids)]=ids
 
-		for (e,f) in self.joint_e_f_counts:
+		return mentions, np.array(pronouns, dtype=np.int64)
 
-			if self.e_counts[e] > 0:
-				self.t_f_e[e,f]=self.joint_e_f_counts[e,f]/self.e_counts[e]
-			else:
-				self.t_f_e[e,f]=0
+	def update(self, mentions, pronouns):
 
-			parts=e.split("\t")
+		""" E step: add the expected alignment counts of every pronoun to the mentions in its window """
+
+		mask=mentions != -1
+		genders=np.broadcast_to(pronouns[:,None], mentions.shape)
+
+		probs=np.where(mask, self.t_f_e[mentions, genders], 0.)
+
+		# sum in the same order as a sequential loop over each row
+		total=np.zeros(len(mentions))
+		for j in range(mentions.shape[1]):
+			total+=probs[:,j]
+
+		e=mentions[mask]
+		f=genders[mask]
+		delta_k_i_j=probs[mask] / np.broadcast_to(total[:,None], mentions.shape)[mask]
+
+		np.add.at(self.joint_e_f_counts, (e, f), delta_k_i_j)
+		np.add.at(self.e_counts, e, delta_k_i_j)
+
+
+	def maximization(self, delete_counts=True):
+
+		""" M step """
+
+		self.t_f_e=np.zeros(self.joint_e_f_counts.shape)
+		np.divide(self.joint_e_f_counts, self.e_counts[:,None], out=self.t_f_e, where=self.e_counts[:,None] > 0)
 
 	def delete_counts(self):
-		for (e,f) in self.joint_e_f_counts:
-			self.joint_e_f_counts[e,f]=0
-		
-		for e in self.e_counts:
-			self.e_counts[e]=0
+		self.joint_e_f_counts=np.zeros(self.joint_e_f_counts.shape)
+		self.e_counts=np.zeros(self.e_counts.shape)
 
 
 	def process(self, toks, entities, refs=None):
@@ -428,39 +541,26 @@ class GenderEM:
 				if start not in loc_starts:
 					loc_starts[start]=[]
 
-				loc_starts[start].append((end, idx, key))
+				loc_starts[start].append((end, idx, key.lower()))
 
 		X=[]
 		Y=[]
 
+		starts=sorted(loc_starts)
+
 		# for each gendered pronoun in the text, identify all entity/common NP mentions in a window around it
 		if self.use_tagged_pronouns_only:
-			for idx in tagged_pronouns:
-				tok=toks[idx].text
-				mentions=self.get_mentions(loc_starts, idx)
-				mention_refs=[]
-				for start, end, loc_idx, text in mentions:
-					mention_refs.append(text.lower())
-
-				if len(mention_refs) > 0:
-					X.append(mention_refs)
-					gender=self.gender_pronouns[tok.lower()]
-					Y.append([gender])
-
+			pronouns=tagged_pronouns
 		else:
-			for idx, tokenObject in enumerate(toks):
-				tok=tokenObject.text
-				if tok.lower() in self.gender_pronouns:
-
-					mentions=self.get_mentions(loc_starts, idx)
-					mention_refs=[]
-					for start, end, loc_idx, text in mentions:
-						mention_refs.append(text.lower())
-
-					if len(mention_refs) > 0:
-						X.append(mention_refs)
-						gender=self.gender_pronouns[tok.lower()]
-						Y.append([gender])
+			pronouns=[idx for idx, tokenObject in enumerate(toks) if tokenObject.text.lower() in self.gender_pronouns]
+
+		for idx in pronouns:
+			mentions=self.get_mentions(starts, loc_starts, idx)
+
+			if len(mentions) > 0:
+				X.append([text for start, end, loc_idx, text in mentions])
+				gender=self.gender_pronouns[toks[idx].text.lower()]
+				Y.append([gender])
 
 
 		return X, Y
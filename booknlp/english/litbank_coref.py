@@ -4,33 +4,39 @@ from booknlp.english.bert_coref_quote_pronouns import BERTCorefTagger
 from booknlp.patches import remove_position_ids_from_state_dict
 import numpy as np
 from booknlp.common.pipelines import Entity
-from booknlp.english.name_coref import NameCoref
+from booknlp.english.name_coref import NameCoref, load_aliases
+from booknlp.common.wordpiece import WordpieceCache, normalize_word
 import pkg_resources
 
 class LitBankCoref:
 
-	def __init__(self, modelFile, gender_cats, pronominalCorefOnly=True):
+	def __init__(self, modelFile, gender_cats, pronominalCorefOnly=True, use_fast_tokenizer=False):
 
 		device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
 		base_model=re.sub("google_bert", "google/bert", modelFile.split("/")[-1])
 		base_model=re.sub(".model", "", base_model)
 
-		self.model = BERTCorefTagger(gender_cats=gender_cats, freeze_bert=True, base_model=base_model, pronominalCorefOnly=pronominalCorefOnly)
+		self.model = BERTCorefTagger(gender_cats=gender_cats, freeze_bert=True, base_model=base_model, pronominalCorefOnly=pronominalCorefOnly, use_fast_tokenizer=use_fast_tokenizer)
 		state_dict = torch.load(modelFile, map_location=device)
 		state_dict = remove_position_ids_from_state_dict(state_dict)
 		self.model.load_state_dict(state_dict)
 		self.model.to(device)
 		self.model.eval()
 
+		aliasFile = pkg_resources.resource_filename(__name__, "data/aliases.txt")
+		self.name_coref=NameCoref(aliases=load_aliases(aliasFile))
+
 
-	def tag(self, tokens, g_ents, refs, ref_gender, attributed_quotations, quotes):
-		sentences, ents, max_words, max_ents=self.convert_data(tokens, g_ents)
-		assignments,global_entities=self.test(sentences, ents, max_words, max_ents, refs, ref_gender, attributed_quotations, quotes)
+	def tag(self, tokens, g_ents, refs, ref_gender, attributed_quotations, quotes, wordpiece_cache=None):
+		if wordpiece_cache is None:
+			wordpiece_cache=WordpieceCache()
+		sentences, ents, max_words, max_ents=self.convert_data(tokens, g_ents, wordpiece_cache=wordpiece_cache)
+		assignments,global_entities=self.test(sentences, ents, max_words, max_ents, refs, ref_gender, attributed_quotations, quotes, wordpiece_cache=wordpiece_cache)
 		return assignments
 
 
-	def test(self, test_doc, test_ents, max_words, max_ents, refs, ref_gender, attributed_quotations, quotes):
+	def test(self, test_doc, test_ents, max_words, max_ents, refs, ref_gender, attributed_quotations, quotes, wordpiece_cache=None):
 
 		global_entities=[]
 		for ents in test_ents:
@@ -42,19 +48,27 @@ class LitBankCoref:
 					if ent.global_start >= q_start and ent.global_start <= q_end:
 						ent.quote_mention=attributed_quotations[idx]
 
-		test_matrix, test_index, test_token_positions, test_ent_spans, test_starts, test_ends, test_widths, test_data, test_masks, test_transforms, test_quotes=self.model.get_data(test_doc, test_ents, max_ents, max_words)
-		
-		assignments=self.model.forward(test_matrix, test_index, existing=refs, token_positions=test_token_positions, starts=test_starts, ends=test_ends, widths=test_widths, input_ids=test_data, attention_mask=test_masks, transforms=test_transforms, ref_genders=ref_gender, entities=global_entities)
-		
-		aliasFile = pkg_resources.resource_filename(__name__, "data/aliases.txt")
+		active=None
+		if self.model.pronominalCorefOnly:
+			# only run BERT over the windows containing mentions that are scored (pronouns) or their candidates
+			windows=self.get_active_windows(test_ents, global_entities, refs)
 
-		nameCoref=NameCoref(aliasFile)
+			active=[]
+			for idx, ents in enumerate(test_ents):
+				active.extend([windows[idx]]*len(ents))
 
+			test_doc=[sent for idx, sent in enumerate(test_doc) if windows[idx]]
+			test_ents=[ents for idx, ents in enumerate(test_ents) if windows[idx]]
+
+		test_matrix, test_index, test_token_positions, test_ent_spans, test_starts, test_ends, test_widths, test_data, test_masks, test_transforms, test_quotes=self.model.get_data(test_doc, test_ents, max_ents, max_words, wordpiece_cache=wordpiece_cache)
+		
+		assignments=self.model.forward(test_matrix, test_index, existing=refs, token_positions=test_token_positions, starts=test_starts, ends=test_ends, widths=test_widths, input_ids=test_data, attention_mask=test_masks, transforms=test_transforms, ref_genders=ref_gender, entities=global_entities, active=active)
+		
 		e_list=[]
 		for ent in global_entities:
 			e_list.append((ent.global_start, ent.global_end, "%s_%s" % (ent.proper, ent.ner_cat), ent.text))
 
-		assignments=nameCoref.cluster_noms(e_list, assignments)
+		assignments=self.name_coref.cluster_noms(e_list, assignments)
 
 		for ass in assignments:
 			if ass == -1:
@@ -63,7 +77,30 @@ class LitBankCoref:
 
 		return assignments, global_entities
 
-	def convert_data(self, tokens, entities):
+	def get_active_windows(self, test_ents, global_entities, refs):
+
+		""" Whether each sentence window contains a mention that's scored, or a candidate antecedent of one """
+
+		window_ids=[]
+		for idx, ents in enumerate(test_ents):
+			window_ids.extend([idx]*len(ents))
+
+		windows=[False]*len(test_ents)
+		for i in self.model.get_scored_mentions(global_entities, refs):
+			cands_idx, _=self.model.get_cands(i, global_entities)
+			if len(cands_idx) == 0:
+				continue
+
+			windows[window_ids[i]]=True
+			for cand in cands_idx:
+				windows[window_ids[cand]]=True
+
+		return windows
+
+	def convert_data(self, tokens, entities, wordpiece_cache=None):
+
+		if wordpiece_cache is None:
+			wordpiece_cache=WordpieceCache()
 
 		max_words=0
 		max_ents=0
@@ -77,13 +114,11 @@ class LitBankCoref:
 		length=0
 		mapper={}
 
-		for tok in tokens:
+		wordpiece_cache.prime(self.model.tokenizer, [tok.text for tok in tokens])
 
-			wptok=tok.text
-			if wptok[0].lower() != wptok[0]:
-				wptok="[CAP] " + wptok.lower()
+		for tok in tokens:
 
-			toks=self.model.tokenizer.tokenize(wptok)
+			toks=wordpiece_cache.tokenize_word(self.model.tokenizer, tok.text)
 			if lastSid is not None and (tok.sentence_id != lastSid or length + len(toks) > max_sentence_length):
 				sents.append(sent)
 				o_sents.append(o_sent)
@@ -130,12 +165,7 @@ class LitBankCoref:
 
 			for word in o_sents[idx]:
 				mapper[word.token_id]=len(sentences), len(sentence)
-				
-				wptok=word.text
-				if wptok[0].lower() != wptok[0]:
-					wptok="[CAP] " + wptok.lower()
-
-				sentence.append(wptok)
+				sentence.append(normalize_word(word.text))
 
 			o_sent.extend(o_sents[idx])
 
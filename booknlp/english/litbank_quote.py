@@ -1,5 +1,6 @@
 import re
 from collections import Counter
+from booknlp.common.pipelines import TokenTable, get_token_column
 
 class QuoteTagger:
 	
@@ -13,12 +14,16 @@ class QuoteTagger:
 
 		quote_symbols=Counter()
 
-		for tok in toks:
-			if tok.text == "“" or tok.text == "”" or tok.text == "\"" or tok.text == "“":
+		texts=get_token_column(toks, "text")
+		paragraph_ids=get_token_column(toks, "paragraph_id")
+		token_ids=get_token_column(toks, "token_id")
+
+		for text in texts:
+			if text == "“" or text == "”" or text == "\"" or text == "“":
 				quote_symbols["DOUBLE_QUOTE"]+=1
-			elif tok.text == "‘" or tok.text == "’" or tok.text == "'":
+			elif text == "‘" or text == "’" or text == "'":
 				quote_symbols["SINGLE_QUOTE"]+=1
-			elif tok.text == "—":
+			elif text == "—":
 				quote_symbols["DASH"]+=1
 
 
@@ -26,9 +31,9 @@ class QuoteTagger:
 		if len(quote_symbols) > 0:
 			quote_symbol=quote_symbols.most_common()[0][0]
 
-		for tok in toks:
+		for text, paragraph_id, token_id in zip(texts, paragraph_ids, token_ids):
 
-			w=tok.text
+			w=text
 
 			for w_idx, w_char in enumerate(w):
 				if w_char== "“" or w_char == "”" or w_char == "\"":
@@ -40,10 +45,10 @@ class QuoteTagger:
 							w="SINGLE_QUOTE"
 
 			# start over at each new paragraph
-			if tok.paragraph_id != lastPar and lastPar is not None:
+			if paragraph_id != lastPar and lastPar is not None:
 
 				if len(currentQuote) > 0:
-					predictions.append((curStartTok, tok.token_id-1))
+					predictions.append((curStartTok, token_id-1))
 				curStartTok=None
 				currentQuote=[]
 
@@ -52,23 +57,27 @@ class QuoteTagger:
 				if curStartTok is not None:
 
 					if len(currentQuote) > 0:
-						predictions.append((curStartTok, tok.token_id))
-						currentQuote.append(tok.text)
+						predictions.append((curStartTok, token_id))
+						currentQuote.append(text)
 
 					curStartTok=None
 					currentQuote=[]
 				else:
-					curStartTok=tok.token_id
+					curStartTok=token_id
 
 			
 			if curStartTok is not None:
-				currentQuote.append(tok.text)
+				currentQuote.append(text)
 
-			lastPar=tok.paragraph_id
+			lastPar=paragraph_id
 
-		for start, end in predictions:
-			for i in range(start, end+1):
-				toks[i].inQuote=True
+		if isinstance(toks, TokenTable):
+			for start, end in predictions:
+				toks.inQuote[start:end+1]=True
+		else:
+			for start, end in predictions:
+				for i in range(start, end+1):
+					toks[i].inQuote=True
 
 		return predictions
 
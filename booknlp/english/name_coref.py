@@ -8,48 +8,122 @@ from collections import Counter
 import sys
 import itertools
 import pkg_resources
+from types import MappingProxyType
+from booknlp.common.resources import load_resource
 
-class NameCoref:
 
-	def __init__(self, aliasFile):
-		self.honorifics={"mr":1, "mr.":1, "mrs":1, "mrs.":1, "miss":1, "uncle":1, "aunt":1, "lady":1, "lord":1, "monsieur":1, "master":1, "mistress":1}
-		self.aliases={}
-		with open(aliasFile) as file:
-			for line in file:
-				cols=line.rstrip().split("\t")
-				canonical=cols[0]
-				nicknames=cols[1:]
-				for nickname in nicknames:
+def read_aliases(aliasFile):
 
-					if nickname.lower() not in self.aliases:
-						self.aliases[nickname.lower()]={}
-					self.aliases[nickname.lower()][canonical.lower()]=1
+	""" Read-only map from each (lowercased) nickname to the canonical names it can stand for, in file order """
 
-	def get_variants(self, parts):
-		variants={}
-		for i in range(len(parts)):
-			if parts[i].lower() not in self.honorifics:
-				variants[parts[i]]=1
+	aliases={}
+	with open(aliasFile) as file:
+		for line in file:
+			cols=line.rstrip().split("\t")
+			canonical=cols[0]
+			nicknames=cols[1:]
+			for nickname in nicknames:
+
+				if nickname.lower() not in aliases:
+					aliases[nickname.lower()]={}
+				aliases[nickname.lower()][canonical.lower()]=1
+
+	return MappingProxyType({nickname:tuple(canonicals) for nickname, canonicals in aliases.items()})
+
+
+def load_aliases(aliasFile):
 
-			for j in range(i+1, len(parts)):
-				variants["%s %s" % (parts[i], parts[j])]=1
+	""" The alias table in aliasFile, parsed once per process and shared between NameCoref instances """
 
-				for k in range(j+1, len(parts)):
-					variants["%s %s %s" % (parts[i], parts[j], parts[k])]=1
+	return load_resource(read_aliases, aliasFile)
 
-					for l in range(k+1, len(parts)):
-						variants["%s %s %s %s" % (parts[i], parts[j], parts[k], parts[l])]=1
 
-						for m in range(l+1, len(parts)):
-							variants["%s %s %s %s %s" % (parts[i], parts[j], parts[k], parts[l], parts[m])]=1
+class NameVariantIndex:
 
-							for n in range(m+1, len(parts)):
-								variants["%s %s %s %s %s %s" % (parts[i], parts[j], parts[k], parts[l], parts[m], parts[n])]=1
+	"""
+	Answers "which full names can this name be a variant of" without materializing every variant.
 
-								for o in range(n+1, len(parts)):
-									variants["%s %s %s %s %s %s %s" % (parts[i], parts[j], parts[k], parts[l], parts[m], parts[n], parts[o])]=1
-								
+	A variant of a name is any ordered subsequence of (up to max_length of) its parts, except that honorifics
+	("Mr.", "Mrs.") on their own are not variants.  Names are indexed by the tokens they contain; a lookup only checks
+	the names sharing the variant's least frequent token.
 
+	"""
+
+	def __init__(self, honorifics, max_length=7):
+		self.honorifics=honorifics
+		self.max_length=max_length
+		self.entries=[]
+		self.postings={}
+
+	def add(self, name, parts):
+		entry=len(self.entries)
+		self.entries.append((name, parts))
+		for tok in set(parts):
+			if tok not in self.postings:
+				self.postings[tok]=[]
+			self.postings[tok].append(entry)
+
+	def lookup(self, variant):
+
+		""" Names (in the order they were added) that variant is a variant of """
+
+		toks=variant.split(" ")
+
+		if len(toks) > self.max_length:
+			return []
+		if len(toks) == 1 and toks[0].lower() in self.honorifics:
+			return []
+
+		postings=[]
+		for tok in toks:
+			if tok not in self.postings:
+				return []
+			postings.append(self.postings[tok])
+
+		names={}
+		for entry in min(postings, key=len):
+			name, parts=self.entries[entry]
+			if name in names:
+				continue
+
+			# is variant an ordered subsequence of parts?
+			remaining=iter(parts)
+			if all(tok in remaining for tok in toks):
+				names[name]=1
+
+		return list(names)
+
+
+class NameCoref:
+
+	def __init__(self, aliasFile=None, max_variant_length=7, max_canonicals=128, aliases=None):
+
+		"""
+		max_variant_length: the longest subsequence of a name's parts that's considered a variant of it
+		max_canonicals: cap on the number of alias expansions of a single name
+		aliases: an alias table already loaded with load_aliases (otherwise it's loaded from aliasFile, through the same
+		process-wide cache)
+
+		"""
+
+		self.max_variant_length=max_variant_length
+		self.max_canonicals=max_canonicals
+		self.honorifics={"mr":1, "mr.":1, "mrs":1, "mrs.":1, "miss":1, "uncle":1, "aunt":1, "lady":1, "lord":1, "monsieur":1, "master":1, "mistress":1}
+
+		if aliases is None:
+			aliases=load_aliases(aliasFile)
+		self.aliases=aliases
+
+	def get_variants(self, parts):
+
+		""" All variants of a name (see NameVariantIndex, which finds them without enumerating them) """
+
+		variants={}
+		for length in range(1, min(len(parts), self.max_variant_length)+1):
+			for combination in itertools.combinations(parts, length):
+				if length == 1 and combination[0].lower() in self.honorifics:
+					continue
+				variants[' '.join(combination)]=1
 
 		return variants
 
@@ -93,13 +167,55 @@ class NameCoref:
 			else:
 				parts.append([tok])
 		canonicals=[]
-
-		canonicals=[]
-		for i in itertools.product(*parts): 
+		for i in itertools.islice(itertools.product(*parts), self.max_canonicals): 
 			canonicals.append(list(i))
 
 		return canonicals
 
+	def get_subsets(self, canonicals_by_name):
+
+		"""
+		Names that are subsets of others: name2 is a subset of name1 if the tokens of some canonical version of name2
+		are a proper subset of those of some canonical version of name1.  Rather than comparing all pairs of names,
+		each canonical is only compared to those that contain its least frequent token.
+
+		"""
+
+		token_sets={}
+		index={}
+		for name, canonicals in canonicals_by_name.items():
+			token_sets[name]=[]
+			for canonical in canonicals:
+				nameset=set(canonical)
+				token_sets[name].append(nameset)
+				for tok in nameset:
+					if tok not in index:
+						index[tok]=[]
+					index[tok].append((name, nameset))
+
+		subsets={}
+		for name2, namesets in token_sets.items():
+			for name2set in namesets:
+				if name2 in subsets:
+					break
+
+				rarest=min(name2set, key=lambda tok: len(index[tok]))
+				name2key=' '.join(name2set)
+
+				for name1, name1set in index[rarest]:
+
+					if name1 == name2:
+						continue
+
+					if ' '.join(name1set) == name2key:
+						continue
+
+					if name1set.issuperset(name2set):
+						subsets[name2]=1
+						break
+
+		return subsets
+
 	def name_cluster(self, entities, is_named, existing_refs):
 
 		"""
@@ -128,28 +244,13 @@ class NameCoref:
 			* "Em Smith" -> "Emma Smith"
 		"""
 
-		subsets={}
-		for name1 in uniq:
-			canonicals1=self.get_canonical(name1.split(" "))
-			for canonical1 in canonicals1:
-				name1set=set(canonical1)
-				for name2 in uniq:
-
-					if name1 == name2:
-						continue
-
-					canonicals=self.get_canonical(name2.split(" "))
-					for canonical in canonicals:
+		canonicals_by_name={}
+		for name in uniq:
+			canonicals_by_name[name]=self.get_canonical(name.split(" "))
 
-						name2set=set(canonical)
+		subsets=self.get_subsets(canonicals_by_name)
 
-						if ' '.join(name1set) == ' '.join(name2set):
-							continue
-
-						if name1set.issuperset(name2set):
-							subsets[name2]=1
-
-		name_subpart_index={}
+		name_subpart_index=NameVariantIndex(self.honorifics, max_length=self.max_variant_length)
 
 		"""
 
@@ -164,6 +265,8 @@ class NameCoref:
 
 		e.g. "Mr. Tom Sawyer" ->
 		"Mr. Tom Sawyer", "Mr. Tom", "Mr. Sawyer", "Tom Sawyer", "Tom", "Sawyer"
+
+		(NameVariantIndex answers these lookups from the name parts rather than storing every variant.)
 		
 		"""
 
@@ -171,15 +274,8 @@ class NameCoref:
 			if name in subsets:
 				continue
 
-			canonicals=self.get_canonical(name.split(" "))
-			for canonical in canonicals:
-				variants=self.get_variants(canonical)
-
-				for v in variants:
-					if v not in name_subpart_index:
-						name_subpart_index[v]={}
-
-					name_subpart_index[v][name]=1
+			for canonical in canonicals_by_name[name]:
+				name_subpart_index.add(name, canonical)
 
 
 		"""
@@ -203,6 +299,10 @@ class NameCoref:
 
 		lastSeen={}
 		refs=[]
+
+		# canonical versions of each distinct mention name
+		mention_canonicals={}
+
 		for i, val in enumerate(is_named):
 
 			if existing_refs[i] != -1:
@@ -211,23 +311,22 @@ class NameCoref:
 
 			if val == 1:
 
-				canonicals=self.get_canonical(entities[i])
-				name=' '.join(entities[i]).lower()
+				key=tuple(entities[i])
+				if key not in mention_canonicals:
+					mention_canonicals[key]=[' '.join(canonical).lower() for canonical in self.get_canonical(entities[i])]
 
 				top=None
 				max_score=0
 
-				for canonical in canonicals:
-					canonical_name=' '.join(canonical).lower()
-
-					if canonical_name in name_subpart_index:
-						for entity in name_subpart_index[canonical_name]:
-							score=uniq[entity]
-							if entity in lastSeen:
-								score+=lastSeen[entity]
-							if score > max_score:
-								max_score=score
-								top=entity
+				for canonical_name in mention_canonicals[key]:
+
+					for entity in name_subpart_index.lookup(canonical_name):
+						score=uniq[entity]
+						if entity in lastSeen:
+							score+=lastSeen[entity]
+						if score > max_score:
+							max_score=score
+							top=entity
 
 				if top is not None:
 					lastSeen[top]=i
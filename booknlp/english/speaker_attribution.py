@@ -6,10 +6,11 @@ from math import sqrt, exp, isnan
 from transformers import BertTokenizer, BertModel
 import torch.nn as nn
 import torch
-import numpy as np
 import argparse
 import json
 from booknlp.common.b3 import b3
+from booknlp.common.wordpiece import WordpieceCache, build_fast_tokenizer, normalize_word
+from booknlp.common.pooling import pool_spans
 
 from collections import Counter
 
@@ -21,7 +22,7 @@ device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
 class BERTSpeakerID(nn.Module):
 
-	def __init__(self, base_model=None):
+	def __init__(self, base_model=None, use_fast_tokenizer=False):
 		super().__init__()
 
 		modelName=base_model
@@ -43,100 +44,83 @@ class BERTSpeakerID(nn.Module):
 		self.tokenizer.add_tokens(["[QUOTE]", "[ALTQUOTE]", "[PAR]", "[CAP]"], special_tokens=True)
 		self.bert = BertModel.from_pretrained(modelName)
 		self.bert.resize_token_embeddings(len(self.tokenizer))
+
+		if use_fast_tokenizer:
+			self.tokenizer=build_fast_tokenizer(self.tokenizer)
 			
 		self.tanh = nn.Tanh()
 		self.fc = nn.Linear(2*bert_dim, 100)
 		self.fc2 = nn.Linear(100, 1)
 
-	def get_wp_position_for_all_tokens(self, words, doLowerCase=True):
-
-		wps=[]
+	def get_batches(self, all_x, all_m, batch_size=32, doLowerCase=True, wordpiece_cache=None):
 
-		# start with 1 for the inital [CLS] token
-		cur=1
-		for idx, word in enumerate(words):
-			if word == "[ALTQUOTE]" or word == "[PAR]" or word == "[QUOTE]":
-				word=word
+		"""
+		Batches are built on the CPU; candidates and quotes are given as [start, end) wordpiece ranges
+		(cands: batch_size x 10 x 2, with empty ranges for missing candidates; quote: batch_size x 1 x 2).
+		forward moves each batch to the device.
 
-			elif doLowerCase:
-				if word[0].lower() != word[0]:
-					word="[CAP] " + word.lower()
-				else:
-					word=word.lower()
+		"""
 
-			target=self.tokenizer.tokenize(word)
-			wps.append((cur, cur+len(target)))
-			cur+=len(target)
-		
-		return wps
+		if wordpiece_cache is None:
+			wordpiece_cache=WordpieceCache()
 
-
-	def get_batches(self, all_x, all_m, batch_size=32, doLowerCase=True):
-				
 		batches_o=[]	
 		batches_x=[]
 		batches_y=[]
 		batches_m=[]
+
+		cls_id=self.tokenizer.convert_tokens_to_ids("[CLS]")
+		sep_id=self.tokenizer.convert_tokens_to_ids("[SEP]")
 			
 		for i in range(0, len(all_x), batch_size):
 			
 			current_batch_input_ids=[]
-			current_batch_attention_mask=[]
-			current_batch_matrix_cands=[]
-			current_batch_matrix_quote=[]
+			current_batch_cands=[]
+			current_batch_quote=[]
 			current_batch_y=[]
 			current_batch_eid=[]
 			current_quote_eids=[]
 
 			xb=all_x[i:i+batch_size]
 			mb=all_m[i:i+batch_size]
+
+			all_wps=[]
 			for s, sent in enumerate(xb):
 
-				sent_wp_tokens=[self.tokenizer.convert_tokens_to_ids("[CLS]")]
-				attention_mask=[1]
+				sent_wp_tokens=[cls_id]
 
+				# wordpiece range of each token; start with 1 for the inital [CLS] token
+				wps=[]
 				for word in sent:
-					if word == "[ALTQUOTE]" or word == "[PAR]" or word == "[QUOTE]":
-						word=word
-
-					elif doLowerCase:
-						if word[0].lower() != word[0]:
-							word="[CAP] " + word.lower()
-						else:
-							word=word.lower()
+					if doLowerCase:
+						word=normalize_word(word, lowercase=True)
 
-					toks = self.tokenizer.tokenize(word)
+					toks = wordpiece_cache.tokenize(self.tokenizer, word)
 					toks = self.tokenizer.convert_tokens_to_ids(toks)
+					wps.append((len(sent_wp_tokens), len(sent_wp_tokens)+len(toks)))
 					sent_wp_tokens.extend(toks)
-					attention_mask.extend([1]*len(toks))
-				sent_wp_tokens.append(self.tokenizer.convert_tokens_to_ids("[SEP]"))
-				attention_mask.append(1)
+				sent_wp_tokens.append(sep_id)
 
 				current_batch_input_ids.append(sent_wp_tokens)
-				current_batch_attention_mask.append(attention_mask)
+				all_wps.append(wps)
 
 			max_len = max([len(s) for s in current_batch_input_ids])
 
-			for j, sent in enumerate(current_batch_input_ids):
-				for k in range(len(current_batch_input_ids[j]), max_len):
-					current_batch_input_ids[j].append(0)
-					current_batch_attention_mask[j].append(0)
+			input_ids=torch.zeros((len(xb), max_len), dtype=torch.long)
+			attention_mask=torch.zeros((len(xb), max_len), dtype=torch.long)
+			for j, sent_wp_tokens in enumerate(current_batch_input_ids):
+				input_ids[j,:len(sent_wp_tokens)]=torch.LongTensor(sent_wp_tokens)
+				attention_mask[j,:len(sent_wp_tokens)]=1
 
 			for j, (eid, cands, quote) in enumerate(mb):
 
-
-				wps_all=self.get_wp_position_for_all_tokens(xb[j])
+				wps_all=all_wps[j]
 
 				current_quote_eids.append(eid)
 
-				e1_start_wp, e1_end_wp=wps_all[quote]
-				matrix_cands=np.zeros((10,max_len))
-				matrix_quote=np.zeros((10,max_len))
-
-				for l in range(10):
-					for k in range(e1_start_wp, e1_end_wp):
-						matrix_quote[l][k]=1./(e1_end_wp-e1_start_wp)
+				current_batch_quote.append([wps_all[quote]])
 
+				spans=[]
 				y=[]
 				eids=[]
 				for c_idx, (start, end, truth, cand_eid) in enumerate(cands):
@@ -144,39 +128,56 @@ class BERTSpeakerID(nn.Module):
 					e2_start_wp, _=wps_all[start]
 					_, e2_end_wp=wps_all[end-1]
 
-					for k in range(e2_start_wp, e2_end_wp):
-						matrix_cands[c_idx][k]=1./(e2_end_wp-e2_start_wp)
-
+					spans.append((e2_start_wp, e2_end_wp))
 					y.append(truth)
 					eids.append(cand_eid)
 
 				for l in range(len(y), 10):
+					spans.append((0, 0))
 					y.append(0)
 					eids.append(None)
 
-				current_batch_matrix_cands.append(matrix_cands)
-				current_batch_matrix_quote.append(matrix_quote)
+				current_batch_cands.append(spans)
 				current_batch_y.append(y)
 				current_batch_eid.append(eids)
 
 
 			batches_o.append((xb, mb))
-			batches_x.append({"toks": torch.LongTensor(current_batch_input_ids).to(device), "mask":torch.LongTensor(current_batch_attention_mask).to(device)})
-			batches_m.append({"cands":torch.FloatTensor(np.array(current_batch_matrix_cands)).to(device), "quote":torch.FloatTensor(np.array(current_batch_matrix_quote)).to(device)})
-			batches_y.append({"y":torch.LongTensor(current_batch_y).to(device), "eid":current_batch_eid, "quote_eids":current_quote_eids})
+			batches_x.append({"toks": input_ids, "mask": attention_mask})
+			batches_m.append({"cands":torch.LongTensor(current_batch_cands), "quote":torch.LongTensor(current_batch_quote)})
+			batches_y.append({"y":torch.LongTensor(current_batch_y), "eid":current_batch_eid, "quote_eids":current_quote_eids})
 
 		return batches_x, batches_m, batches_y, batches_o
-	
+
+	def batch_to_device(self, batch_x, batch_m):
+
+		""" Move a batch from get_batches to the device as a single (non-blocking) transfer """
+
+		toks=batch_x["toks"]
+		if toks.device.type == device.type:
+			return batch_x, batch_m
+
+		batch_s, max_len=toks.shape
+		packed=torch.cat((toks, batch_x["mask"], batch_m["cands"].view(batch_s, -1), batch_m["quote"].view(batch_s, -1)), 1)
+		if device.type == "cuda":
+			packed=packed.pin_memory()
+		packed=packed.to(device, non_blocking=True)
+
+		toks, mask, cands, quote=torch.split(packed, [max_len, max_len, batch_m["cands"][0].numel(), 2], dim=1)
+
+		return {"toks": toks, "mask": mask}, {"cands": cands.view(batch_m["cands"].shape), "quote": quote.view(batch_m["quote"].shape)}
 
 	def forward(self, batch_x, batch_m): 
+
+		batch_x, batch_m=self.batch_to_device(batch_x, batch_m)
 		
 		_, pooled_outputs, sequence_outputs = self.bert(batch_x["toks"], token_type_ids=None, attention_mask=batch_x["mask"], output_hidden_states=True, return_dict=False)
 
 		out=sequence_outputs[-1]
 		batch_size, _, bert_size=out.shape
 
-		combined_cands=torch.matmul(batch_m["cands"],out)
-		combined_quote=torch.matmul(batch_m["quote"],out)
+		combined_cands=pool_spans(out, batch_m["cands"])
+		combined_quote=pool_spans(out, batch_m["quote"]).expand_as(combined_cands)
 		
 		combined=torch.cat((combined_cands, combined_quote), axis=2)
 
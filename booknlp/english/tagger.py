@@ -9,11 +9,105 @@ import torch
 import numpy as np
 import booknlp.common.crf as crf
 import booknlp.common.sequence_eval as sequence_eval
+from booknlp.common.wordpiece import build_fast_tokenizer
+from booknlp.common.pooling import WordpiecePooling
 from torch.nn import CrossEntropyLoss
 
+class BIOTables:
+
+	"""
+	Lookup tables over tag ids for repairing BIO sequences and for merging (and later restoring) the tokens
+	of an entity when moving between nested NER layers, so that all three operate on whole arrays of tags.
+
+	"""
+
+	def __init__(self, tagset, rev_tagset):
+
+		n=len(rev_tagset)
+		labels={}
+
+		# whether each tag is an I- tag
+		self.is_inside=np.zeros(n, dtype=bool)
+		# the (integer) type of each B-/I- tag; -1 for O (and for the CRF start/stop tags)
+		self.label=np.full(n, -1, dtype=np.int64)
+		# I-X -> B-X (identity for everything else)
+		self.to_begin=np.arange(n, dtype=np.int64)
+		# B-X, I-X -> I-X; everything else -> O
+		self.to_inside=np.full(n, tagset["O"], dtype=np.int64)
+
+		for idx in range(n):
+			parts=rev_tagset[idx].split("-")
+			if len(parts) < 2:
+				continue
+			self.label[idx]=labels.setdefault(parts[1], len(labels))
+			self.is_inside[idx]=parts[0] == "I"
+			if parts[0] == "I":
+				self.to_begin[idx]=tagset.get("B-%s" % parts[1], idx)
+			self.to_inside[idx]=tagset.get("I-%s" % parts[1], -1)
+
+	def repair(self, tags):
+
+		"""
+		Ensure tag sequences (batch_size x seq_len) are BIO-compliant: an I-X tag must continue an entity of
+		type X (B-X or I-X) at the previous position, and is otherwise turned into B-X.  Since repairing
+		never changes a tag's type, this only depends on the type of the previous tag.
+
+		"""
+
+		label=self.label[tags]
+		prev=np.full_like(label, -1)
+		prev[:,1:]=label[:,:-1]
+		return np.where(self.is_inside[tags] & (prev != label), self.to_begin[tags], tags)
+
+	def merge(self, tags):
+
+		"""
+		For repaired tag sequences, get what we need to merge the tokens in the same entity in the next layer:
+
+		-- inside: positions that are merged into the token before them (I- tags)
+		-- pooling: averages the tokens in each entity (and each token outside one) into one position
+		-- lens: length of each sequence after merging
+
+		"""
+
+		batch_s, nl=tags.shape
+
+		inside=self.is_inside[tags]
+		inside[:,0]=False
+
+		group=np.cumsum(~inside, axis=1)-1
+		lens=group[:,-1]+1
+
+		flat=group + (np.arange(batch_s) * nl)[:,None]
+		sizes=np.bincount(flat.ravel(), minlength=batch_s*nl)[flat]
+		weights=(1./sizes).astype(np.float32)
+
+		pooling=WordpiecePooling(torch.from_numpy(group), torch.from_numpy(weights), nl)
+
+		return inside, pooling, lens
+
+	def unmerge(self, tags, inside):
+
+		"""
+		Undo merge: restore the positions flagged in inside, each tagged as the continuation (I-X, or O) of
+		the token before it; the other positions take the tags of the merged sequence in order.  Sequences
+		keep their (padded) length, so tags at the end that are pushed past it are dropped.
+
+		"""
+
+		batch_s, nl=inside.shape
+		rows=np.arange(batch_s)[:,None]
+		positions=np.arange(nl)[None,:]
+
+		kept=~inside
+		restored=tags[rows, np.cumsum(kept, axis=1)-1]
+
+		last_kept=np.maximum.accumulate(np.where(kept, positions, 0), axis=1)
+		return np.where(inside, self.to_inside[restored[rows, last_kept]], restored)
+
 class Tagger(nn.Module):
 
-	def __init__(self, freeze_bert=False, base_model=None, tagset=None, supersense_tagset=None, tagset_flat=None, hidden_dim=100, flat_hidden_dim=200, device=None):
+	def __init__(self, freeze_bert=False, base_model=None, tagset=None, supersense_tagset=None, tagset_flat=None, hidden_dim=100, flat_hidden_dim=200, device=None, use_fast_tokenizer=False):
 		super(Tagger, self).__init__()
 
 		modelName=base_model
@@ -55,12 +149,18 @@ class Tagger(nn.Module):
 
 		self.num_labels_flat=len(tagset_flat)
 
+		self.bio=BIOTables(self.tagset, self.rev_tagset)
+		self.supersense_bio=BIOTables(self.supersense_tagset, self.rev_supersense_tagset)
+
 		self.tokenizer = BertTokenizer.from_pretrained(modelName, do_lower_case=False, do_basic_tokenize=False)
 		self.bert = BertModel.from_pretrained(modelName)
 
 		self.tokenizer.add_tokens(["[CAP]"], special_tokens=True)
 		self.bert.resize_token_embeddings(len(self.tokenizer))
 
+		if use_fast_tokenizer:
+			self.tokenizer=build_fast_tokenizer(self.tokenizer)
+
 		self.bert.eval()
 		
 		if freeze_bert:
@@ -114,7 +214,7 @@ class Tagger(nn.Module):
 		elif self.num_layers == 2:
 			all_layers = torch.cat((hidden_states[-1], hidden_states[-2]), 2)
 
-		out=torch.matmul(transforms,all_layers)
+		out=transforms.pool(all_layers)
 
 		out, _ = self.flat_lstm(out)
 
@@ -163,7 +263,7 @@ class Tagger(nn.Module):
 			all_layers = torch.cat((hidden_states[-1], hidden_states[-2]), 2)
 
 		# remove the opening [CLS]
-		reduced=torch.matmul(transforms,all_layers)[:,1:,:]
+		reduced=transforms.pool(all_layers)[:,1:,:]
 
 		wn_embeds=wn_embeds[:,1:,:]
 
@@ -209,7 +309,7 @@ class Tagger(nn.Module):
 			all_layers = torch.cat((hidden_states[-1], hidden_states[-2]), 2)
 
 		# remove the opening [CLS]
-		reduced=torch.matmul(transforms,all_layers)[:,1:,:]
+		reduced=transforms.pool(all_layers)[:,1:,:]
 
 		reduced=self.layered_dropout(reduced)
 
@@ -248,159 +348,6 @@ class Tagger(nn.Module):
 
 	def predict_all(self, wn, input_ids, attention_mask=None, transforms=None, lens=None, doEvent=True, doEntities=True, doSS=True):
 
-		def fix(sequence):
-
-			"""
-			Ensure tag sequence is BIO-compliant
-
-			"""
-			for idx, tag in enumerate(sequence):
-				tag=self.rev_tagset[tag]
-				if tag.startswith("I-"):
-					parts=tag.split("-")
-					label=parts[1]
-					flag=False
-					for i in range(idx-1, -1, -1):
-						prev=self.rev_tagset[sequence[i]].split("-")
-
-						if prev[0] == "B" and prev[1] == label:
-							flag=True
-							break
-						
-						if prev[0] == "O":
-							break
-
-						if prev[0] != "O" and prev[1] != label:
-							break
-
-					if flag==False:
-						sequence[idx]=self.tagset["B-%s" % label]
-
-
-		def get_layer_transformation(tag_space, t):
-
-			"""
-			After predicting a tag sequence, get the information we need to transform the current layer
-			to the next layer (e.g., merging tokens in the same entity and remembering which ones we merged)
-
-			"""
-
-			nl=tag_space.shape[1]
-
-			all_tags=[]
-			for tags in t:
-				all_tags.append(list(tags.data.cpu().numpy()))
-
-			# matrix for merging tokens in layer n+1 that are part of the same entity in layer n 
-			all_index=[]
-			# indices of tokens that were merged (so we can restored them later)
-			all_missing=[]
-			# length of the resulting layer (after merging)
-			all_lens=[]
-
-			for tags1 in all_tags:
-				fix(tags1)
-				index1=self.get_index([tags1], self.rev_tagset)[0]
-				for z in range(len(index1)):
-					for y in range(len(index1[z]), nl):
-						index1[z].append(0)
-				for z in range(len(index1), nl):
-					index1.append(np.zeros(nl))
-
-				all_index.append(index1)
-
-				missing1=[]
-				nll=0
-				for idx, tag in enumerate(tags1):
-					if idx > 0 and self.rev_tagset[tag].startswith("I-"):
-						missing1.append(idx)
-					else:
-						nll+=1
-
-				all_lens.append(nll)
-				all_missing.append(missing1)
-
-			all_index=torch.FloatTensor(np.array(all_index)).to(self.device)
-
-			return all_tags, all_index, all_missing, all_lens
-
-		def supersense_fix(sequence):
-
-			"""
-			Ensure tag sequence is BIO-compliant
-
-			"""
-			for idx, tag in enumerate(sequence):
-				tag=self.rev_supersense_tagset[tag]
-				if tag.startswith("I-"):
-					parts=tag.split("-")
-					label=parts[1]
-					flag=False
-					for i in range(idx-1, -1, -1):
-						prev=self.rev_supersense_tagset[sequence[i]].split("-")
-
-						if prev[0] == "B" and prev[1] == label:
-							flag=True
-							break
-						
-						if prev[0] == "O":
-							break
-
-						if prev[0] != "O" and prev[1] != label:
-							break
-
-					if flag==False:
-						sequence[idx]=self.supersense_tagset["B-%s" % label]
-
-
-		def get_supersense_layer_transformation(tag_space, t):
-
-			"""
-			After predicting a tag sequence, get the information we need to transform the current layer
-			to the next layer (e.g., merging tokens in the same entity and remembering which ones we merged)
-
-			"""
-
-			nl=tag_space.shape[1]
-
-			all_tags=[]
-			for tags in t:
-				all_tags.append(list(tags.data.cpu().numpy()))
-
-			# matrix for merging tokens in layer n+1 that are part of the same entity in layer n 
-			all_index=[]
-			# indices of tokens that were merged (so we can restored them later)
-			all_missing=[]
-			# length of the resulting layer (after merging)
-			all_lens=[]
-
-			for tags1 in all_tags:
-				supersense_fix(tags1)
-				index1=self.get_index([tags1], self.rev_supersense_tagset)[0]
-				for z in range(len(index1)):
-					for y in range(len(index1[z]), nl):
-						index1[z].append(0)
-				for z in range(len(index1), nl):
-					index1.append(np.zeros(nl))
-
-				all_index.append(index1)
-
-				missing1=[]
-				nll=0
-				for idx, tag in enumerate(tags1):
-					if idx > 0 and self.rev_supersense_tagset[tag].startswith("I-"):
-						missing1.append(idx)
-					else:
-						nll+=1
-
-				all_lens.append(nll)
-				all_missing.append(missing1)
-
-			all_index=torch.FloatTensor(np.array(all_index)).to(self.device)
-
-			return all_tags, all_index, all_missing, all_lens
-
-
 		all_tags1=all_tags2=all_tags3=event_logits=all_supersense_tags1=None
 		
 		
@@ -417,7 +364,7 @@ class Tagger(nn.Module):
 			all_layers = torch.cat((hidden_states[-1], hidden_states[-2]), 2)
 
 		# remove the opening [CLS]
-		reduced=torch.matmul(transforms,all_layers)[:,1:,:]
+		reduced=transforms.pool(all_layers)[:,1:,:]
 
 		##
 		# ENTITIES
@@ -432,64 +379,41 @@ class Tagger(nn.Module):
 
 			_, t1 = self.crf.viterbi_decode(tag_space1, ll-2)
 
-			all_tags1, all_index1, all_missing1, n_lens1=get_layer_transformation(tag_space1, t1)
+			# merge the tokens of each entity found in this layer into one position in the next
+			all_tags1=self.bio.repair(t1.cpu().numpy())
+			inside1, merge1, n_lens1=self.bio.merge(all_tags1)
 
-			input2=torch.matmul(all_index1,lstm_out1)
+			input2=merge1.to(self.device).pool(lstm_out1)
 
 			## LAYER 2
 
 			lstm_out2, _ = self.lstm2(input2)
 			tag_space2 = self.hidden2tag2(lstm_out2)
 			
-			_, t2 = self.crf.viterbi_decode(tag_space2, torch.LongTensor(n_lens1) )
+			_, t2 = self.crf.viterbi_decode(tag_space2, torch.from_numpy(n_lens1))
 
-			all_tags2, all_index2, all_missing2, n_lens2=get_layer_transformation(tag_space2, t2)
+			all_tags2=self.bio.repair(t2.cpu().numpy())
+			inside2, merge2, n_lens2=self.bio.merge(all_tags2)
 			
-			input3=torch.matmul(all_index2,lstm_out2)
+			input3=merge2.to(self.device).pool(lstm_out2)
 
 			## LAYER 3
 
 			lstm_out3, _ = self.lstm3(input3)
 			tag_space3 = self.hidden2tag3(lstm_out3)
 
-			_, t3 = self.crf.viterbi_decode(tag_space3, torch.LongTensor(n_lens2))
+			_, t3 = self.crf.viterbi_decode(tag_space3, torch.from_numpy(n_lens2))
 
-			all_tags3=[]
-			for tags in t3:
-				all_tags3.append(list(tags.data.cpu().numpy()))
-
-			for tags3 in all_tags3:
-				fix(tags3)
+			all_tags3=self.bio.repair(t3.cpu().numpy())
 
 			## Insert tokens into later layers that were compressed in earlier layers
 
-			for idx, missing2 in enumerate(all_missing2):
-				for m in missing2:
-					parts=self.rev_tagset[all_tags3[idx][m-1]].split("-")
-					if len(parts) > 1:
-						all_tags3[idx].insert(m, self.tagset["I-%s" % parts[1]])
-					else:
-						all_tags3[idx].insert(m, self.tagset["O"])
-			
-			for idx, missing1 in enumerate(all_missing1):
-				for m in missing1:
-					parts=self.rev_tagset[all_tags3[idx][m-1]].split("-")
-					if len(parts) > 1:
-						all_tags3[idx].insert(m, self.tagset["I-%s" % parts[1]])
-					else:
-						all_tags3[idx].insert(m, self.tagset["O"])
-			
-			for idx, missing1 in enumerate(all_missing1):
-				for m in missing1:
-					parts=self.rev_tagset[all_tags2[idx][m-1]].split("-")
-					if len(parts) > 1:
-						all_tags2[idx].insert(m, self.tagset["I-%s" % parts[1]])
-					else:
-						all_tags2[idx].insert(m, self.tagset["O"])
+			all_tags3=self.bio.unmerge(self.bio.unmerge(all_tags3, inside2), inside1)
+			all_tags2=self.bio.unmerge(all_tags2, inside1)
 
-			for idx in range(len(all_tags1)):
-				all_tags2[idx]=all_tags2[idx][:len(all_tags1[idx])]
-				all_tags3[idx]=all_tags3[idx][:len(all_tags1[idx])]
+			all_tags1=all_tags1.tolist()
+			all_tags2=all_tags2.tolist()
+			all_tags3=all_tags3.tolist()
 
 
 		###
@@ -517,7 +441,7 @@ class Tagger(nn.Module):
 
 			_, t1 = self.supersense_crf.viterbi_decode(tag_space1, ll-2)
 
-			all_supersense_tags1, all_index1, all_missing1, n_lens1=get_supersense_layer_transformation(tag_space1, t1)
+			all_supersense_tags1=self.supersense_bio.repair(t1.cpu().numpy()).tolist()
 
 
 		return all_tags1, all_tags2, all_tags3, event_logits, all_supersense_tags1
@@ -525,82 +449,6 @@ class Tagger(nn.Module):
 
 	def predict(self, input_ids, attention_mask=None, transforms=None, lens=None):
 
-		def fix(sequence):
-
-			"""
-			Ensure tag sequence is BIO-compliant
-
-			"""
-			for idx, tag in enumerate(sequence):
-				tag=self.rev_tagset[tag]
-				if tag.startswith("I-"):
-					parts=tag.split("-")
-					label=parts[1]
-					flag=False
-					for i in range(idx-1, -1, -1):
-						prev=self.rev_tagset[sequence[i]].split("-")
-
-						if prev[0] == "B" and prev[1] == label:
-							flag=True
-							break
-						
-						if prev[0] == "O":
-							break
-
-						if prev[0] != "O" and prev[1] != label:
-							break
-
-					if flag==False:
-						sequence[idx]=self.tagset["B-%s" % label]
-
-
-		def get_layer_transformation(tag_space, t):
-
-			"""
-			After predicting a tag sequence, get the information we need to transform the current layer
-			to the next layer (e.g., merging tokens in the same entity and remembering which ones we merged)
-
-			"""
-
-			nl=tag_space.shape[1]
-
-			all_tags=[]
-			for tags in t:
-				all_tags.append(list(tags.data.cpu().numpy()))
-
-			# matrix for merging tokens in layer n+1 that are part of the same entity in layer n 
-			all_index=[]
-			# indices of tokens that were merged (so we can restored them later)
-			all_missing=[]
-			# length of the resulting layer (after merging)
-			all_lens=[]
-
-			for tags1 in all_tags:
-				fix(tags1)
-				index1=self.get_index([tags1], self.rev_tagset)[0]
-				for z in range(len(index1)):
-					for y in range(len(index1[z]), nl):
-						index1[z].append(0)
-				for z in range(len(index1), nl):
-					index1.append(np.zeros(nl))
-
-				all_index.append(index1)
-
-				missing1=[]
-				nll=0
-				for idx, tag in enumerate(tags1):
-					if idx > 0 and self.rev_tagset[tag].startswith("I-"):
-						missing1.append(idx)
-					else:
-						nll+=1
-
-				all_lens.append(nll)
-				all_missing.append(missing1)
-
-			all_index=torch.FloatTensor(all_index).to(self.device)
-
-			return all_tags, all_index, all_missing, all_lens
-
 		## PREDICT
 
 		input_ids = input_ids.to(self.device)
@@ -616,7 +464,7 @@ class Tagger(nn.Module):
 			all_layers = torch.cat((hidden_states[-1], hidden_states[-2]), 2)
 
 		# remove the opening [CLS]
-		reduced=torch.matmul(transforms,all_layers)[:,1:,:]
+		reduced=transforms.pool(all_layers)[:,1:,:]
 
 		## LAYER 1
 
@@ -625,64 +473,41 @@ class Tagger(nn.Module):
 
 		_, t1 = self.crf.viterbi_decode(tag_space1, ll-2)
 
-		all_tags1, all_index1, all_missing1, n_lens1=get_layer_transformation(tag_space1, t1)
+		# merge the tokens of each entity found in this layer into one position in the next
+		all_tags1=self.bio.repair(t1.cpu().numpy())
+		inside1, merge1, n_lens1=self.bio.merge(all_tags1)
 
-		input2=torch.matmul(all_index1,lstm_out1)
+		input2=merge1.to(self.device).pool(lstm_out1)
 
 		## LAYER 2
 
 		lstm_out2, _ = self.lstm2(input2)
 		tag_space2 = self.hidden2tag2(lstm_out2)
 		
-		_, t2 = self.crf.viterbi_decode(tag_space2, torch.LongTensor(n_lens1) )
+		_, t2 = self.crf.viterbi_decode(tag_space2, torch.from_numpy(n_lens1))
 
-		all_tags2, all_index2, all_missing2, n_lens2=get_layer_transformation(tag_space2, t2)
+		all_tags2=self.bio.repair(t2.cpu().numpy())
+		inside2, merge2, n_lens2=self.bio.merge(all_tags2)
 		
-		input3=torch.matmul(all_index2,lstm_out2)
+		input3=merge2.to(self.device).pool(lstm_out2)
 
 		## LAYER 3
 
 		lstm_out3, _ = self.lstm3(input3)
 		tag_space3 = self.hidden2tag3(lstm_out3)
 
-		_, t3 = self.crf.viterbi_decode(tag_space3, torch.LongTensor(n_lens2))
-
-		all_tags3=[]
-		for tags in t3:
-			all_tags3.append(list(tags.data.cpu().numpy()))
+		_, t3 = self.crf.viterbi_decode(tag_space3, torch.from_numpy(n_lens2))
 
-		for tags3 in all_tags3:
-			fix(tags3)
+		all_tags3=self.bio.repair(t3.cpu().numpy())
 
 		## Insert tokens into later layers that were compressed in earlier layers
 
-		for idx, missing2 in enumerate(all_missing2):
-			for m in missing2:
-				parts=self.rev_tagset[all_tags3[idx][m-1]].split("-")
-				if len(parts) > 1:
-					all_tags3[idx].insert(m, self.tagset["I-%s" % parts[1]])
-				else:
-					all_tags3[idx].insert(m, self.tagset["O"])
-		
-		for idx, missing1 in enumerate(all_missing1):
-			for m in missing1:
-				parts=self.rev_tagset[all_tags3[idx][m-1]].split("-")
-				if len(parts) > 1:
-					all_tags3[idx].insert(m, self.tagset["I-%s" % parts[1]])
-				else:
-					all_tags3[idx].insert(m, self.tagset["O"])
-		
-		for idx, missing1 in enumerate(all_missing1):
-			for m in missing1:
-				parts=self.rev_tagset[all_tags2[idx][m-1]].split("-")
-				if len(parts) > 1:
-					all_tags2[idx].insert(m, self.tagset["I-%s" % parts[1]])
-				else:
-					all_tags2[idx].insert(m, self.tagset["O"])
+		all_tags3=self.bio.unmerge(self.bio.unmerge(all_tags3, inside2), inside1)
+		all_tags2=self.bio.unmerge(all_tags2, inside1)
 
-		for idx in range(len(all_tags1)):
-			all_tags2[idx]=all_tags2[idx][:len(all_tags1[idx])]
-			all_tags3[idx]=all_tags3[idx][:len(all_tags1[idx])]
+		all_tags1=all_tags1.tolist()
+		all_tags2=all_tags2.tolist()
+		all_tags3=all_tags3.tolist()
 
 		return all_tags1, all_tags2, all_tags3
 
@@ -691,82 +516,6 @@ class Tagger(nn.Module):
 
 		""" Get logits for layered sequence labeling """
 
-		def supersense_fix(sequence):
-
-			"""
-			Ensure tag sequence is BIO-compliant
-
-			"""
-			for idx, tag in enumerate(sequence):
-				tag=self.rev_supersense_tagset[tag]
-				if tag.startswith("I-"):
-					parts=tag.split("-")
-					label=parts[1]
-					flag=False
-					for i in range(idx-1, -1, -1):
-						prev=self.rev_supersense_tagset[sequence[i]].split("-")
-
-						if prev[0] == "B" and prev[1] == label:
-							flag=True
-							break
-						
-						if prev[0] == "O":
-							break
-
-						if prev[0] != "O" and prev[1] != label:
-							break
-
-					if flag==False:
-						sequence[idx]=self.supersense_tagset["B-%s" % label]
-
-
-		def get_layer_transformation(tag_space, t):
-
-			"""
-			After predicting a tag sequence, get the information we need to transform the current layer
-			to the next layer (e.g., merging tokens in the same entity and remembering which ones we merged)
-
-			"""
-
-			nl=tag_space.shape[1]
-
-			all_tags=[]
-			for tags in t:
-				all_tags.append(list(tags.data.cpu().numpy()))
-
-			# matrix for merging tokens in layer n+1 that are part of the same entity in layer n 
-			all_index=[]
-			# indices of tokens that were merged (so we can restored them later)
-			all_missing=[]
-			# length of the resulting layer (after merging)
-			all_lens=[]
-
-			for tags1 in all_tags:
-				supersense_fix(tags1)
-				index1=self.get_index([tags1], self.rev_supersense_tagset)[0]
-				for z in range(len(index1)):
-					for y in range(len(index1[z]), nl):
-						index1[z].append(0)
-				for z in range(len(index1), nl):
-					index1.append(np.zeros(nl))
-
-				all_index.append(index1)
-
-				missing1=[]
-				nll=0
-				for idx, tag in enumerate(tags1):
-					if idx > 0 and self.rev_supersense_tagset[tag].startswith("I-"):
-						missing1.append(idx)
-					else:
-						nll+=1
-
-				all_lens.append(nll)
-				all_missing.append(missing1)
-
-			all_index=torch.FloatTensor(all_index).to(self.device)
-
-			return all_tags, all_index, all_missing, all_lens
-
 		## PREDICT
 
 		wn=wn.to(self.device)
@@ -785,7 +534,7 @@ class Tagger(nn.Module):
 			all_layers = torch.cat((hidden_states[-1], hidden_states[-2]), 2)
 
 		# remove the opening [CLS]
-		reduced=torch.matmul(transforms,all_layers)[:,1:,:]
+		reduced=transforms.pool(all_layers)[:,1:,:]
 
 		wn_embeds=self.wn_embedding(wn)
 
@@ -798,7 +547,7 @@ class Tagger(nn.Module):
 
 		_, t1 = self.supersense_crf.viterbi_decode(tag_space1, ll-2)
 
-		all_tags1, all_index1, all_missing1, n_lens1=get_layer_transformation(tag_space1, t1)
+		all_tags1=self.supersense_bio.repair(t1.cpu().numpy()).tolist()
 
 		return all_tags1
 
@@ -0,0 +1,51 @@
+"""Microbenchmark for CRF Viterbi decoding.
+
+Compares the original step-by-step decoder with each decoding backend on entity tagger shapes
+(batches of up to 500 tokens, 39 labels for the 37-tag layered tagset) and checks the
+results are identical.
+Run with: pytest tests/benchmark/test_crf_performance.py -v -s
+"""
+
+import time
+
+import pytest
+import torch
+
+from tests.helpers.crf import BACKENDS, make_inputs, reference_viterbi_decode
+
+SHAPES = [(6, 500), (12, 200), (32, 100)]
+
+
+def _time(fn, repeat=3):
+    fn()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - start) / repeat, result
+
+
+class TestViterbiBenchmark:
+    """Equivalence and speed of Viterbi backends on realistic shapes."""
+
+    @pytest.mark.slow
+    @pytest.mark.parametrize("backend", BACKENDS)
+    @pytest.mark.parametrize("batch_size,seq_len", SHAPES)
+    def test_backend_speedup(self, backend, batch_size, seq_len):
+        model, logits, lens = make_inputs(batch_size, seq_len, vocab_size=37)
+
+        with torch.no_grad():
+            reference_s, (expected_scores, expected_paths) = _time(
+                lambda: reference_viterbi_decode(model, logits, lens)
+            )
+            backend_s, (scores, paths) = _time(
+                lambda: model.viterbi_decode(logits, lens, backend=backend)
+            )
+
+        assert torch.equal(scores, expected_scores)
+        assert torch.equal(paths, expected_paths)
+
+        print(
+            f"\nviterbi {backend} ({batch_size}, {seq_len}, {model.n_labels}): "
+            f"{reference_s * 1000:.1f}ms -> {backend_s * 1000:.1f}ms "
+            f"({reference_s / backend_s:.1f}x)"
+        )
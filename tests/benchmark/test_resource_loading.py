@@ -0,0 +1,68 @@
+"""Microbenchmark for per-document setup of gender inference and name clustering.
+
+Compares re-parsing the gender priors and alias table for every document (as the pipeline used to)
+with the process-wide cache, on a priors file about the size of the Gutenberg one.
+Run with: pytest tests/benchmark/test_resource_loading.py -v -s
+"""
+
+import random
+import time
+
+import pkg_resources
+import pytest
+
+from booknlp.common.resources import clear_resources
+from booknlp.english.gender_inference_model_1 import (
+    GenderEM,
+    load_gender_hyperparameters,
+    read_gender_hyperparameters,
+)
+from booknlp.english.name_coref import NameCoref, load_aliases, read_aliases
+from tests.helpers.gender_em import GENDERS, make_document
+
+NUM_TERMS = 50000
+NUM_DOCUMENTS = 20
+
+
+@pytest.fixture(scope="module")
+def priors_file(tmp_path_factory):
+    rng = random.Random(0)
+    path = tmp_path_factory.mktemp("priors") / "priors.txt"
+    with open(path, "w") as out:
+        out.write("term\tproper\the/him/his\tshe/her\tthey/them/their\n")
+        for i in range(NUM_TERMS):
+            counts = [rng.randint(0, 50) for _ in GENDERS]
+            out.write("name%d\tprop\t%s\n" % (i, "\t".join(str(c) for c in counts)))
+    return str(path)
+
+
+class TestResourceLoadingBenchmark:
+    """Per-document setup time with and without the process-wide cache."""
+
+    @pytest.mark.slow
+    def test_cached_setup(self, priors_file):
+        alias_file = pkg_resources.resource_filename("booknlp.english", "data/aliases.txt")
+        documents = [make_document(300, seed) for seed in range(NUM_DOCUMENTS)]
+
+        start = time.perf_counter()
+        for tokens, entities, refs in documents:
+            GenderEM(tokens=tokens, entities=entities, refs=refs, genders=GENDERS, hyperparameters=read_gender_hyperparameters(priors_file, GENDERS))
+            NameCoref(aliases=read_aliases(alias_file))
+        uncached_s = (time.perf_counter() - start) / NUM_DOCUMENTS
+
+        clear_resources()
+        load_gender_hyperparameters(priors_file, GENDERS)
+        load_aliases(alias_file)
+
+        start = time.perf_counter()
+        for tokens, entities, refs in documents:
+            GenderEM(tokens=tokens, entities=entities, refs=refs, genders=GENDERS, hyperparameters=load_gender_hyperparameters(priors_file, GENDERS))
+            NameCoref(aliases=load_aliases(alias_file))
+        cached_s = (time.perf_counter() - start) / NUM_DOCUMENTS
+
+        print(
+            f"\nper-document setup ({NUM_TERMS} prior terms): "
+            f"{uncached_s * 1000:.1f}ms -> {cached_s * 1000:.1f}ms "
+            f"({uncached_s / cached_s:.1f}x)"
+        )
+        assert cached_s < uncached_s
@@ -0,0 +1 @@
+"""Shared helpers for unit tests and benchmarks."""
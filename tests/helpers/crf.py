@@ -0,0 +1,52 @@
+"""Reference decoder and inputs shared by the CRF tests and benchmark."""
+
+import pytest
+import torch
+
+from booknlp.common import crf
+
+
+def reference_viterbi_decode(model, logits, lens):
+    """The original step-by-step decoder, kept as the reference for equivalence."""
+    batch_size, seq_len, n_labels = logits.size()
+    vit = logits.new_full((batch_size, n_labels), -10000)
+    vit[:, model.start_idx] = 0
+    c_lens = lens.clone()
+
+    pointers = []
+    for logit in logits.transpose(1, 0):
+        vit_trn_sum = vit.unsqueeze(1).expand(batch_size, n_labels, n_labels) + model.transitions.unsqueeze(0)
+        vt_max, vt_argmax = vit_trn_sum.max(2)
+        vit_nxt = vt_max + logit
+        pointers.append(vt_argmax.unsqueeze(0))
+
+        mask = (c_lens > 0).float().unsqueeze(-1).expand_as(vit_nxt)
+        vit = mask * vit_nxt + (1 - mask) * vit
+        mask = (c_lens == 1).float().unsqueeze(-1).expand_as(vit_nxt)
+        vit += mask * model.transitions[model.stop_idx].unsqueeze(0).expand_as(vit_nxt)
+        c_lens = c_lens - 1
+
+    pointers = torch.cat(pointers)
+    scores, idx = vit.max(1)
+    paths = [idx.unsqueeze(1)]
+    for argmax in reversed(pointers):
+        idx = torch.gather(argmax, 1, idx.unsqueeze(-1)).squeeze(-1)
+        paths.insert(0, idx.unsqueeze(1))
+
+    return scores.squeeze(-1), torch.cat(paths[1:], 1)
+
+
+def make_inputs(batch_size, seq_len, vocab_size=9, seed=0):
+    torch.manual_seed(seed)
+    model = crf.CRF(vocab_size, torch.device("cpu"))
+    logits = torch.randn(batch_size, seq_len, vocab_size + 2)
+    lens = torch.randint(0, seq_len + 1, (batch_size,))
+    lens[0] = seq_len
+    return model, logits, lens
+
+
+BACKENDS = [
+    "torch",
+    "numpy",
+    pytest.param("numba", marks=pytest.mark.skipif(crf.numba is None, reason="numba not installed")),
+]
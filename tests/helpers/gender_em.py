@@ -0,0 +1,43 @@
+"""Random documents shared by the gender inference tests and benchmark."""
+
+import random
+
+from booknlp.common.pipelines import Token
+
+GENDERS = [["he", "him", "his"], ["she", "her"], ["they", "them", "their"]]
+NAMES = ["Elizabeth", "Darcy", "Jane", "Bingley", "Tom", "Mr. Bennet", "Mrs. Bennet"]
+NOMINALS = ["man", "woman", "sister", "captain"]
+PRONOUNS = ["he", "him", "his", "she", "her", "they", "them", "their"]
+
+
+def make_document(n, seed, ref_rate=0.8):
+    """A random sequence of names, nominal phrases and pronouns, with the names clustered by string."""
+    rng = random.Random(seed)
+    tokens = []
+    entities = []
+    refs = []
+    for _ in range(n):
+        r = rng.random()
+        if r < 0.2:
+            text = rng.choice(NAMES)
+            cat = "PROP_PER"
+        elif r < 0.3:
+            text = rng.choice(NOMINALS)
+            cat = "NOM_PER"
+        elif r < 0.6:
+            text = rng.choice(PRONOUNS)
+            cat = "PRON_PER"
+        else:
+            text = None
+
+        if text is None:
+            tokens.append(Token(0, 0, len(tokens), len(tokens), "and", None, None, None, None, len(tokens), None, 0))
+            continue
+
+        start = len(tokens)
+        for word in text.split(" "):
+            tokens.append(Token(0, 0, len(tokens), len(tokens), word, None, None, None, None, start, None, 0))
+        entities.append((start, len(tokens) - 1, cat, text))
+        refs.append(NAMES.index(text) if cat == "PROP_PER" and rng.random() < ref_rate else -1)
+
+    return tokens, entities, refs
@@ -0,0 +1,163 @@
+"""Tests for the bounded inference executor."""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from booknlp.api.services.inference_executor import (
+    ExecutorSaturatedError,
+    InferenceExecutor,
+    InferenceTimeoutError,
+)
+
+
+@pytest.fixture
+def executor():
+    """Create an executor with one worker and one queue slot."""
+    executor = InferenceExecutor(max_workers=1, max_pending=1, queue_timeout=5.0, timeout=5.0)
+    yield executor
+    executor.shutdown(wait=False)
+
+
+def blocking_call(event: threading.Event, value: int) -> int:
+    event.wait(5)
+    return value
+
+
+class TestInferenceExecutor:
+    """Test concurrency limits, saturation and timeouts."""
+
+    async def test_run_returns_result(self, executor):
+        """Given a call, run should return its result."""
+        assert await executor.run(sum, [1, 2, 3]) == 6
+        assert executor.stats()["running"] == 0
+
+    async def test_run_raises_call_errors(self, executor):
+        """Given a failing call, run should raise its error."""
+        with pytest.raises(ValueError):
+            await executor.run(int, "not a number")
+
+    async def test_event_loop_not_blocked(self, executor):
+        """Given a running call, the event loop should keep serving other tasks."""
+        release = threading.Event()
+        task = asyncio.create_task(executor.run(blocking_call, release, 1))
+
+        start = time.monotonic()
+        await asyncio.sleep(0.05)
+        assert time.monotonic() - start < 1.0
+        assert executor.stats()["running"] == 1
+
+        release.set()
+        assert await task == 1
+
+    async def test_rejects_when_queue_full(self, executor):
+        """Given a busy worker and a full queue, run should raise ExecutorSaturatedError."""
+        release = threading.Event()
+        running = asyncio.create_task(executor.run(blocking_call, release, 1))
+        queued = asyncio.create_task(executor.run(blocking_call, release, 2))
+        await asyncio.sleep(0.05)
+
+        with pytest.raises(ExecutorSaturatedError):
+            await executor.run(blocking_call, release, 3)
+        assert executor.stats() == {"running": 1, "queued": 1, "max_workers": 1, "max_pending": 1}
+
+        release.set()
+        assert await running == 1
+        assert await queued == 2
+
+    async def test_waits_when_not_rejecting(self, executor):
+        """Given reject_when_full=False, run should wait for a worker instead of raising."""
+        release = threading.Event()
+        tasks = [asyncio.create_task(executor.run(blocking_call, release, i, reject_when_full=False)) for i in range(3)]
+        await asyncio.sleep(0.05)
+
+        release.set()
+        assert await asyncio.gather(*tasks) == [0, 1, 2]
+
+    async def test_queue_timeout(self, executor):
+        """Given no free worker within queue_timeout, the queued call should be cancelled."""
+        release = threading.Event()
+        running = asyncio.create_task(executor.run(blocking_call, release, 1))
+        await asyncio.sleep(0.05)
+
+        with pytest.raises(ExecutorSaturatedError):
+            await executor.run(blocking_call, release, 2, queue_timeout=0.05)
+        assert executor.stats()["queued"] == 0
+
+        release.set()
+        assert await running == 1
+
+    async def test_shutdown_cancels_queued_call(self, executor):
+        """Given a call waiting without a queue timeout, shutdown should cancel it instead of failing."""
+        release = threading.Event()
+        running = asyncio.create_task(executor.run(blocking_call, release, 1))
+        queued = asyncio.create_task(
+            executor.run(blocking_call, release, 2, queue_timeout=None, reject_when_full=False)
+        )
+        await asyncio.sleep(0.05)
+
+        executor.shutdown(wait=False)
+        with pytest.raises(asyncio.CancelledError):
+            await queued
+        assert executor.stats()["queued"] == 0
+
+        release.set()
+        assert await running == 1
+
+    async def test_run_timeout_keeps_worker(self, executor):
+        """Given a call that outlives its timeout, run should raise and the worker stay busy until it ends."""
+        release = threading.Event()
+
+        with pytest.raises(InferenceTimeoutError):
+            await executor.run(blocking_call, release, 1, timeout=0.05)
+        assert executor.stats()["running"] == 1
+
+        release.set()
+        await asyncio.sleep(0.05)
+        assert executor.stats()["running"] == 0
+
+    async def test_cancelled_caller_drops_queued_call(self, executor):
+        """Given a queued call whose caller is cancelled, the call should never run."""
+        release = threading.Event()
+        calls = []
+        running = asyncio.create_task(executor.run(blocking_call, release, 1))
+        queued = asyncio.create_task(executor.run(calls.append, 2))
+        await asyncio.sleep(0.05)
+
+        queued.cancel()
+        await asyncio.sleep(0.05)
+        release.set()
+        assert await running == 1
+        assert calls == []
+        assert executor.stats()["queued"] == 0
+
+
+class TestAnalyzeSaturation:
+    """Test that /analyze reports a saturated executor as 503."""
+
+    async def test_analyze_returns_503_when_saturated(self, executor, monkeypatch):
+        """Given a full executor, analyze should return 503 with Retry-After."""
+        from unittest.mock import MagicMock
+
+        from fastapi import HTTPException
+
+        from booknlp.api.routes import analyze
+        from booknlp.api.schemas.requests import AnalyzeRequest
+
+        release = threading.Event()
+        monkeypatch.setattr(analyze, "get_inference_executor", lambda: executor)
+        monkeypatch.setattr(analyze, "get_nlp_service", lambda: MagicMock(is_ready=True))
+        running = asyncio.create_task(executor.run(blocking_call, release, 1))
+        queued = asyncio.create_task(executor.run(blocking_call, release, 2))
+        await asyncio.sleep(0.05)
+
+        with pytest.raises(HTTPException) as error:
+            await analyze.analyze(AnalyzeRequest(text="Call me Ishmael."), MagicMock())
+        assert error.value.status_code == 503
+        assert "Retry-After" in error.value.headers
+
+        release.set()
+        assert await running == 1
+        assert await queued == 2
@@ -35,3 +35,43 @@ class TestNLPService:
         service = NLPService()
         with pytest.raises(ValueError, match="not loaded"):
             service.get_model("small")
+
+
+class TestInMemoryAnalysis:
+    """Test that analysis requests run BookNLP in memory."""
+
+    def test_analyze_uses_in_memory_records(self):
+        """Given an analyze request, the model should get its text and pipeline without any files."""
+        from booknlp.api.routes.analyze import _process_text
+        from booknlp.api.schemas.requests import AnalyzeRequest
+
+        model = MagicMock()
+        model.process_records.return_value = {"tokens": [{"word": "Call"}]}
+        service = MagicMock()
+        service.get_model.return_value = model
+
+        result = _process_text(AnalyzeRequest(text="Call me Ishmael.", pipeline=["entities"]), service)
+
+        assert result == {"tokens": [{"word": "Call"}]}
+        model.process_records.assert_called_once_with("Call me Ishmael.", pipeline=["entity"])
+        model.process.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_job_uses_in_memory_records(self):
+        """Given a job, the processor should return the model's records and report progress."""
+        from booknlp.api.schemas.job_schemas import JobRequest
+        from booknlp.api.services.async_processor import AsyncBookNLPProcessor
+
+        model = MagicMock()
+        model.process_records.return_value = {"tokens": [], "entities": []}
+        processor = AsyncBookNLPProcessor()
+        processor._nlp_service = MagicMock(is_ready=True)
+        processor._nlp_service.get_model.return_value = model
+        progress = []
+
+        result = await processor.process(JobRequest(text="Call me Ishmael.", pipeline=["coref"]), progress.append)
+
+        assert result == {"tokens": [], "entities": []}
+        model.process_records.assert_called_once_with("Call me Ishmael.", pipeline=["entity", "quote", "coref"])
+        model.process.assert_not_called()
+        assert progress[-1] == 100.0
@@ -21,8 +21,9 @@ class TestAnalyzeRequestSchema:
     def test_analyze_request_rejects_empty_text(self):
         """Given empty text, AnalyzeRequest should raise validation error."""
         try:
-            from booknlp.api.schemas.requests import AnalyzeRequest
             from pydantic import ValidationError
+
+            from booknlp.api.schemas.requests import AnalyzeRequest
         except ImportError:
             pytest.skip("AnalyzeRequest not implemented yet")
         
@@ -32,8 +33,9 @@ class TestAnalyzeRequestSchema:
     def test_analyze_request_rejects_text_too_long(self):
         """Given text over 500K chars, AnalyzeRequest should raise validation error."""
         try:
-            from booknlp.api.schemas.requests import AnalyzeRequest
             from pydantic import ValidationError
+
+            from booknlp.api.schemas.requests import AnalyzeRequest
         except ImportError:
             pytest.skip("AnalyzeRequest not implemented yet")
         
@@ -90,3 +92,26 @@ class TestAnalyzeResponseSchema:
         )
         assert response.book_id == "test"
         assert response.processing_time_ms == 100
+
+
+class TestPipelineValidation:
+    """Test pipeline normalization on analysis and job requests."""
+
+    def test_pipeline_aliases_and_dependencies(self):
+        """Given plural names and coref alone, the pipeline should be resolved in order."""
+        from booknlp.api.schemas.requests import AnalyzeRequest
+
+        assert AnalyzeRequest(text="test", pipeline=["events", "entities"]).pipeline == ["entity", "event"]
+        assert AnalyzeRequest(text="test", pipeline=["coref"]).pipeline == ["entity", "quote", "coref"]
+
+    def test_pipeline_rejects_unknown_component(self):
+        """Given an unknown component, requests should raise validation error."""
+        from pydantic import ValidationError
+
+        from booknlp.api.schemas.job_schemas import JobRequest
+        from booknlp.api.schemas.requests import AnalyzeRequest
+
+        with pytest.raises(ValidationError):
+            AnalyzeRequest(text="test", pipeline=["entity", "parse"])
+        with pytest.raises(ValidationError):
+            JobRequest(text="test", pipeline=["parse"])
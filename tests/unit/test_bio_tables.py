@@ -0,0 +1,120 @@
+"""Unit tests for array-based BIO repair and nested NER layer merging."""
+
+import numpy as np
+import pkg_resources
+import pytest
+import torch
+
+from booknlp.common.sequence_layered_reader import read_tagset
+from booknlp.english.tagger import BIOTables
+
+
+def load_tagset():
+    tagset = read_tagset(pkg_resources.resource_filename("booknlp.english", "data/entity_cat.tagset"))
+    rev_tagset = {tagset[v]: v for v in tagset}
+    # CRF start/stop tags
+    rev_tagset[len(tagset)] = "O"
+    rev_tagset[len(tagset) + 1] = "O"
+    return tagset, rev_tagset
+
+
+def reference_fix(sequence, tagset, rev_tagset):
+    """The original backward-scanning BIO repair."""
+    for idx, tag in enumerate(sequence):
+        tag = rev_tagset[tag]
+        if tag.startswith("I-"):
+            label = tag.split("-")[1]
+            flag = False
+            for i in range(idx - 1, -1, -1):
+                prev = rev_tagset[sequence[i]].split("-")
+                if prev[0] == "B" and prev[1] == label:
+                    flag = True
+                    break
+                if prev[0] == "O":
+                    break
+                if prev[0] != "O" and prev[1] != label:
+                    break
+            if not flag:
+                sequence[idx] = tagset["B-%s" % label]
+
+
+def reference_missing(sequence, rev_tagset):
+    return [idx for idx, tag in enumerate(sequence) if idx > 0 and rev_tagset[tag].startswith("I-")]
+
+
+def reference_insert(sequence, missing, tagset, rev_tagset):
+    sequence = list(sequence)
+    for m in missing:
+        parts = rev_tagset[sequence[m - 1]].split("-")
+        if len(parts) > 1:
+            sequence.insert(m, tagset["I-%s" % parts[1]])
+        else:
+            sequence.insert(m, tagset["O"])
+    return sequence
+
+
+@pytest.fixture
+def tables():
+    tagset, rev_tagset = load_tagset()
+    return tagset, rev_tagset, BIOTables(tagset, rev_tagset)
+
+
+def random_tags(rev_tagset, batch_size=8, seq_len=60, seed=0):
+    rng = np.random.default_rng(seed)
+    # bias towards I- tags so that long entities and invalid continuations are common
+    inside = [idx for idx, tag in rev_tagset.items() if tag.startswith("I-")]
+    tags = rng.integers(0, len(rev_tagset), size=(batch_size, seq_len))
+    mask = rng.random((batch_size, seq_len)) < 0.5
+    return np.where(mask, rng.choice(inside, size=(batch_size, seq_len)), tags)
+
+
+class TestBIOTables:
+    """Test the array implementations against the original list-based code."""
+
+    @pytest.mark.parametrize("seed", range(5))
+    def test_repair_matches_reference(self, tables, seed):
+        tagset, rev_tagset, bio = tables
+        tags = random_tags(rev_tagset, seed=seed)
+
+        expected = [list(row) for row in tags]
+        for row in expected:
+            reference_fix(row, tagset, rev_tagset)
+
+        assert bio.repair(tags).tolist() == expected
+
+    def test_merge_averages_each_entity(self, tables):
+        tagset, rev_tagset, bio = tables
+        tags = np.array([[tagset["B-PROP_PER"], tagset["I-PROP_PER"], tagset["O"], tagset["B-NOM_FAC"], tagset["I-NOM_FAC"], tagset["I-NOM_FAC"]]])
+
+        inside, pooling, lens = bio.merge(tags)
+
+        assert inside.tolist() == [[False, True, False, False, True, True]]
+        assert lens.tolist() == [3]
+        merged = pooling.pool(torch.arange(6, dtype=torch.float).view(1, 6, 1))
+        assert merged.view(-1).tolist()[:3] == pytest.approx([0.5, 2.0, 4.0])
+        assert merged.view(-1).tolist()[3:] == [0.0, 0.0, 0.0]
+
+    @pytest.mark.parametrize("seed", range(5))
+    def test_unmerge_matches_reference(self, tables, seed):
+        tagset, rev_tagset, bio = tables
+        layer1 = bio.repair(random_tags(rev_tagset, seed=seed))
+        layer2 = bio.repair(random_tags(rev_tagset, seed=seed + 100))
+        layer3 = bio.repair(random_tags(rev_tagset, seed=seed + 200))
+
+        inside1, _, _ = bio.merge(layer1)
+        inside2, _, _ = bio.merge(layer2)
+
+        restored2 = bio.unmerge(layer2, inside1)
+        restored3 = bio.unmerge(bio.unmerge(layer3, inside2), inside1)
+
+        for idx in range(len(layer1)):
+            missing1 = reference_missing(layer1[idx].tolist(), rev_tagset)
+            missing2 = reference_missing(layer2[idx].tolist(), rev_tagset)
+            seq_len = len(layer1[idx])
+
+            expected2 = reference_insert(layer2[idx].tolist(), missing1, tagset, rev_tagset)[:seq_len]
+            expected3 = reference_insert(layer3[idx].tolist(), missing2, tagset, rev_tagset)
+            expected3 = reference_insert(expected3, missing1, tagset, rev_tagset)[:seq_len]
+
+            assert restored2[idx].tolist() == expected2
+            assert restored3[idx].tolist() == expected3
@@ -0,0 +1,272 @@
+"""Unit tests for batched coreference antecedent scoring."""
+
+from types import SimpleNamespace
+
+import pkg_resources
+import pytest
+import torch
+from transformers import BertConfig, BertModel, BertTokenizer
+
+from booknlp.common.pipelines import Entity
+from booknlp.english import bert_coref_quote_pronouns as coref
+from booknlp.english.litbank_coref import LitBankCoref
+from booknlp.english.name_coref import NameCoref
+
+VOCAB = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]", "he", "she", "said"]
+
+
+@pytest.fixture
+def tagger(tmp_path, monkeypatch):
+    vocab_file = tmp_path / "vocab.txt"
+    vocab_file.write_text("\n".join(VOCAB) + "\n")
+    config = BertConfig(vocab_size=len(VOCAB), hidden_size=16, num_hidden_layers=2, num_attention_heads=2, intermediate_size=32)
+
+    monkeypatch.setattr(BertTokenizer, "from_pretrained", classmethod(lambda cls, *args, **kwargs: BertTokenizer(str(vocab_file), do_lower_case=False)))
+    monkeypatch.setattr(BertModel, "from_pretrained", classmethod(lambda cls, *args, **kwargs: BertModel(config)))
+
+    torch.manual_seed(0)
+    model = coref.BERTCorefTagger([["he", "him"], ["she", "her"]], base_model="coref_google_bert_uncased_L-2_H-16_A-2-v1.0.model")
+    model.to(coref.device)
+    model.eval()
+    return model
+
+
+def make_entities(n, seed=0):
+    torch.manual_seed(seed)
+    entities = []
+    start = 0
+    for i in range(n):
+        width = int(torch.randint(1, 4, (1,)))
+        # make every fifth mention nested inside its predecessor
+        if i % 5 == 4:
+            start, end = entities[-1].global_start, entities[-1].global_start
+        else:
+            end = start + width - 1
+        in_quote = bool(i % 3 == 1)
+        quote_mention = int(torch.randint(0, n, (1,))) if in_quote and i % 2 == 0 else None
+        entities.append(SimpleNamespace(global_start=start, global_end=end, in_quote=in_quote, quote_mention=quote_mention))
+        start = end + 2
+    return entities
+
+
+def reference_scores(model, span_representation, unary_scores, entities, i, assignments):
+    """The original per-mention scoring from BERTCorefTagger.forward."""
+    entity = entities[i]
+    cands_idx, ent_dist = model.get_cands(i, entities)
+
+    targets = span_representation[cands_idx]
+    cp = span_representation[i].expand_as(targets)
+
+    same_speaker = []
+    for e in cands_idx:
+        if not entity.in_quote or entity.quote_mention is None:
+            same_speaker.append(2)
+        elif assignments[e] == assignments[entity.quote_mention]:
+            same_speaker.append(1)
+        else:
+            same_speaker.append(0)
+
+    same_speaker_embeds = model.speaker_embeddings(torch.LongTensor(same_speaker).to(coref.device))
+    distance_embeds = model.distance_embeddings(torch.LongTensor(model.vec_get_distance_bucket(ent_dist)).to(coref.device))
+
+    nest1 = []
+    nest2 = []
+    for cand in cands_idx:
+        nest1.append(int(entity.global_start >= entities[cand].global_start and entity.global_end < entities[cand].global_end))
+        nest2.append(int(entities[cand].global_start >= entity.global_start and entities[cand].global_end < entity.global_end))
+
+    nesteds_embeds = model.nested_embeddings(torch.LongTensor(nest1).to(coref.device))
+    nesteds_embeds2 = model.nested_embeddings(torch.LongTensor(nest2).to(coref.device))
+
+    elementwise = cp * targets
+    concat = torch.cat((cp, targets, elementwise, distance_embeds, nesteds_embeds, nesteds_embeds2, same_speaker_embeds), 1)
+
+    preds = model.mention_mention3(model.tanh(model.drop_layer_020(model.mention_mention2(model.tanh(model.drop_layer_020(model.mention_mention1(concat)))))))
+    preds = preds + unary_scores[i] + unary_scores[cands_idx]
+
+    return preds.squeeze(-1).cpu()
+
+
+class TestBatchedPairScoring:
+    """Test that two-phase scoring reproduces the per-mention scores."""
+
+    @pytest.mark.parametrize("pair_batchsize", [7, coref.PAIR_BATCHSIZE])
+    def test_matches_per_mention_scores(self, tagger, pair_batchsize):
+        n = 60
+        entities = make_entities(n)
+        torch.manual_seed(1)
+        span_representation = torch.randn(n, tagger.unary1.in_features, device=coref.device)
+        unary_scores = torch.randn(n, 1, device=coref.device)
+
+        # an arbitrary partial clustering, standing in for earlier decisions
+        assignments = [i % 4 for i in range(n)]
+
+        with torch.no_grad():
+            pair_scores = tagger.score_all_pairs(span_representation, unary_scores, entities, range(1, n), pair_batchsize=pair_batchsize)
+
+            for i in range(1, n):
+                cands_idx, scores = pair_scores[i]
+                preds = tagger.select_pair_scores(i, cands_idx, scores, entities, assignments)
+                expected = reference_scores(tagger, span_representation, unary_scores, entities, i, assignments)
+
+                assert cands_idx.tolist() == tagger.get_cands(i, entities)[0].tolist()
+                assert torch.allclose(preds, expected, atol=1e-5)
+
+    def test_speaker_dependent_scores_are_kept_for_both_values(self, tagger):
+        entities = make_entities(30)
+        span_representation = torch.randn(30, tagger.unary1.in_features, device=coref.device)
+        unary_scores = torch.randn(30, 1, device=coref.device)
+
+        with torch.no_grad():
+            pair_scores = tagger.score_all_pairs(span_representation, unary_scores, entities, range(1, 30))
+
+        for i in range(1, 30):
+            _, scores = pair_scores[i]
+            if entities[i].in_quote and entities[i].quote_mention is not None:
+                assert scores.dim() == 2 and scores.shape[0] == 2
+            else:
+                assert scores.dim() == 1
+
+    def test_no_mentions(self, tagger):
+        span_representation = torch.randn(3, tagger.unary1.in_features, device=coref.device)
+        unary_scores = torch.randn(3, 1, device=coref.device)
+
+        assert tagger.score_all_pairs(span_representation, unary_scores, make_entities(3), []) == {}
+
+
+class TestTrainingPairScoring:
+    """Test that the training loss scores pairs the same way as the per-mention reference."""
+
+    def test_loss_matches_reference(self, tagger, monkeypatch):
+        n = 40
+        entities = make_entities(n, seed=2)
+        for i, entity in enumerate(entities):
+            entity.entity_id = i % 5
+            entity.text = "him"
+            entity.proper = "PRON"
+        torch.manual_seed(3)
+        span_representation = torch.randn(n, tagger.unary1.in_features, device=coref.device)
+        monkeypatch.setattr(tagger, "get_all_mention_reps", lambda *args, **kwargs: span_representation)
+
+        assignments = [entity.entity_id for entity in entities]
+        truth = []
+        for i in range(n):
+            cands_idx, _ = tagger.get_cands(i, entities)
+            truth.append([k for k, cand in enumerate(cands_idx) if assignments[cand] == assignments[i]])
+
+        with torch.no_grad():
+            loss = tagger.forward(None, None, truth=truth, entities=entities)
+
+            unary_scores = tagger.unary3(tagger.tanh(tagger.unary2(tagger.tanh(tagger.unary1(span_representation)))))
+            expected = 0.
+            for in_quote in [False, True]:
+                for i in range(1, n):
+                    if entities[i].in_quote != in_quote or len(tagger.get_cands(i, entities)[0]) == 0:
+                        continue
+                    preds = torch.cat((reference_scores(tagger, span_representation, unary_scores, entities, i, assignments), torch.zeros(1)))
+                    golds = torch.logsumexp(preds[truth[i]], 0) if len(truth[i]) > 0 else 0.
+                    expected += torch.logsumexp(preds, 0) - golds
+
+        assert torch.allclose(loss.cpu(), expected, atol=1e-4)
+
+
+def make_windows(n_windows, pronoun_windows, width=30):
+    doc = []
+    ents = []
+    tok_pos = 0
+    for w in range(n_windows):
+        doc.append(["[CLS]"] + ["said"] * width + ["[SEP]"])
+        sent_ents = []
+        for k, start in enumerate([2, 10, 20]):
+            proper = "PRON" if w in pronoun_windows and k == 1 else "PROP"
+            entity = Entity(start, start + 1, proper=proper, ner_cat="PER", in_quote=False, text="she" if proper == "PRON" else "Elizabeth")
+            entity.global_start = tok_pos + start
+            entity.global_end = tok_pos + start + 1
+            sent_ents.append(entity)
+        ents.append(sent_ents)
+        tok_pos += width
+    return doc, ents
+
+
+@pytest.fixture
+def litbank_coref(tagger):
+    model = LitBankCoref.__new__(LitBankCoref)
+    model.model = tagger
+    model.name_coref = NameCoref(pkg_resources.resource_filename("booknlp.english", "data/aliases.txt"))
+    return model
+
+
+class TestActiveWindows:
+    """Test that pronominal-only coref only runs BERT over windows it needs."""
+
+    def test_windows_with_pronouns_and_their_candidates(self, litbank_coref):
+        doc, ents = make_windows(20, pronoun_windows={3, 15})
+        global_entities = [e for sent_ents in ents for e in sent_ents]
+        refs = [-1] * len(global_entities)
+
+        windows = litbank_coref.get_active_windows(ents, global_entities, refs)
+
+        # 20 previous mentions at 3 mentions per window reach back 7 windows
+        assert [idx for idx, active in enumerate(windows) if active] == [0, 1, 2, 3, 8, 9, 10, 11, 12, 13, 14, 15]
+
+    def test_resolved_pronouns_need_no_windows(self, litbank_coref):
+        doc, ents = make_windows(5, pronoun_windows={3})
+        global_entities = [e for sent_ents in ents for e in sent_ents]
+
+        assert not any(litbank_coref.get_active_windows(ents, global_entities, list(range(len(global_entities)))))
+
+    @pytest.mark.parametrize("pronoun_windows", [{3, 15}, set()])
+    def test_matches_full_path(self, litbank_coref, monkeypatch, pronoun_windows):
+        doc, ents = make_windows(20, pronoun_windows)
+        n = sum(len(sent_ents) for sent_ents in ents)
+
+        with torch.no_grad():
+            assignments, _ = litbank_coref.test(doc, ents, 32, 3, [-1] * n, {}, [], [])
+            monkeypatch.setattr(litbank_coref, "get_active_windows", lambda test_ents, *args: [True] * len(test_ents))
+            expected, _ = litbank_coref.test(doc, ents, 32, 3, [-1] * n, {}, [], [])
+
+        assert assignments == expected
+
+
+class TestAllMentionReps:
+    """Test assembling span representations across batches."""
+
+    def get_inputs(self, tagger, doc, ents):
+        matrix, index, _, _, starts, ends, widths, data, masks, transforms, _ = tagger.get_data(doc, ents, 3, 32, batchsize=4)
+        return dict(matrix=matrix, index=index, starts=starts, ends=ends, widths=widths, input_ids=data, attention_mask=masks, transforms=transforms)
+
+    def test_matches_concatenated_batches(self, tagger):
+        doc, ents = make_windows(10, pronoun_windows={2})
+        ents[4][0].in_quote = True
+        entities = [e for sent_ents in ents for e in sent_ents]
+        inputs = self.get_inputs(tagger, doc, ents)
+
+        with torch.no_grad():
+            reps = tagger.get_all_mention_reps(entities=entities, **inputs)
+
+            expected = []
+            cur = 0
+            for b in range(len(inputs["matrix"])):
+                n = len(inputs["starts"][b])
+                quotes = torch.LongTensor([int(bool(e.in_quote)) for e in entities[cur:cur + n]])
+                expected.append(tagger.get_mention_reps(quotes=quotes, doTrain=False, **{k: v[b] for k, v in inputs.items()}))
+                cur += n
+
+        assert reps.shape == (len(entities), tagger.unary1.in_features)
+        assert reps.is_contiguous()
+        assert torch.equal(reps, torch.cat(expected))
+
+    def test_inactive_rows_are_zero(self, tagger):
+        doc, ents = make_windows(10, pronoun_windows={2})
+        entities = [e for sent_ents in ents for e in sent_ents]
+        active = [idx // 3 in (2, 3, 7) for idx in range(len(entities))]
+        active_doc = [doc[idx] for idx in (2, 3, 7)]
+        active_ents = [ents[idx] for idx in (2, 3, 7)]
+
+        with torch.no_grad():
+            full = tagger.get_all_mention_reps(entities=entities, **self.get_inputs(tagger, doc, ents))
+            reps = tagger.get_all_mention_reps(entities=entities, active=active, **self.get_inputs(tagger, active_doc, active_ents))
+
+        mask = torch.BoolTensor(active)
+        assert torch.allclose(reps[mask], full[mask], atol=1e-6)
+        assert not reps[~mask].any()
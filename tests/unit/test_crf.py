@@ -0,0 +1,41 @@
+"""Unit tests for CRF Viterbi decoding."""
+
+import pytest
+import torch
+
+from booknlp.common import crf
+from tests.helpers.crf import BACKENDS, make_inputs, reference_viterbi_decode
+
+
+class TestViterbiDecode:
+    """Test that every backend reproduces the original decoder exactly."""
+
+    @pytest.mark.parametrize("backend", BACKENDS)
+    @pytest.mark.parametrize("batch_size,seq_len", [(1, 1), (1, 7), (5, 40), (12, 120)])
+    def test_matches_reference(self, backend, batch_size, seq_len):
+        model, logits, lens = make_inputs(batch_size, seq_len)
+
+        with torch.no_grad():
+            expected_scores, expected_paths = reference_viterbi_decode(model, logits, lens)
+            scores, paths = model.viterbi_decode(logits, lens, backend=backend)
+
+        assert torch.equal(scores, expected_scores)
+        assert torch.equal(paths, expected_paths)
+        assert paths.dtype == torch.long
+
+    def test_default_backend_is_used(self):
+        model, logits, lens = make_inputs(3, 10)
+
+        try:
+            crf.set_viterbi_backend("numpy")
+            with torch.no_grad():
+                _, paths = model.viterbi_decode(logits, lens)
+        finally:
+            crf.set_viterbi_backend("torch")
+
+        assert torch.equal(paths, reference_viterbi_decode(model, logits, lens)[1])
+
+    def test_unknown_backend_is_rejected(self):
+        with pytest.raises(ValueError):
+            crf.set_viterbi_backend("cython")
+        assert crf.get_viterbi_backend() == "torch"
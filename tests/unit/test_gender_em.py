@@ -0,0 +1,262 @@
+"""Unit tests for referential gender inference."""
+
+import pytest
+
+from booknlp.common.resources import clear_resources
+from booknlp.english.gender_inference_model_1 import GenderEM, load_gender_hyperparameters
+from tests.helpers.gender_em import GENDERS, NAMES, make_document
+
+PRIORS = """term\tproper\the/him/his\tshe/her\tthey/them/their
+elizabeth\tprop\t0\t40\t1
+darcy\tprop\t30\t1\t1
+mr. bennet\tprop\t20\t0\t0
+mrs. bennet\tprop\t0\t25\t0
+tom\tprop\t8\t1\t0
+man\tnom\t15\t0\t0
+"""
+
+
+class ReferenceGenderEM(GenderEM):
+    """The original dictionary-backed EM loop, over a vocab that includes every term with a prior."""
+
+    def build_vocab(self, tokens, entities, refs=None):
+        for term in self.hyperparameters:
+            self.vocab[term] = 1
+        super().build_vocab(tokens, entities, refs)
+
+    def reference_priors(self, entities, tokens, refs):
+        priors = {}
+        for e in self.vocab:
+            mf = self.hyperparameters.get(e, [1] * self.num_genders)
+            priors[e] = [mf[f] + 0.1 for f in range(self.num_genders)]
+
+        counts = {}
+        for idx, ref in enumerate(refs):
+            start, end, cat, text = entities[idx]
+            prop = cat.split("_")[0]
+            head = self.get_head(start, end, tokens) if prop == "NOM" else None
+            key = "%s\t%s" % (tokens[head].text if head is not None else text, prop)
+            if ref != -1:
+                counts.setdefault(ref, {}).setdefault(key.lower(), 0)
+                counts[ref][key.lower()] += 1
+
+        for e in self.vocab:
+            parts = e.split("\t")
+            if parts[1] != "coref" or int(parts[0]) == -1:
+                continue
+            idd = int(parts[0])
+            mf = [0.0] * self.num_genders
+            for text in counts[idd]:
+                if text in priors:
+                    for f in range(self.num_genders):
+                        mf[f] = priors[text][f] * counts[idd][text]
+            if sum(mf) > self.upper:
+                for i in range(self.num_genders):
+                    mf[i] = (mf[i] / sum(mf)) * self.upper
+            for text in counts[idd]:
+                first_name_token = text.split(" ")[0]
+                if first_name_token in self.honorific_priors:
+                    for f in range(self.num_genders):
+                        mf[f] = self.honorific_priors[first_name_token][f] * counts[idd][text] * 10000
+            priors[e] = [mf[f] + 0.1 for f in range(self.num_genders)]
+
+        return priors
+
+    def reference_tag(self, entities, tokens, refs):
+        G = self.num_genders
+        priors = self.reference_priors(entities, tokens, refs)
+
+        def reset():
+            joint = {}
+            counts = {}
+            for e in self.keys:
+                counts[e] = 0
+                for f in range(G):
+                    joint[e, f] = priors[e][f]
+                    counts[e] += priors[e][f]
+            return joint, counts
+
+        def maximize(joint, counts):
+            return {(e, f): (joint[e, f] / counts[e] if counts[e] > 0 else 0) for (e, f) in joint}
+
+        t = maximize(*reset())
+        X, Y = self.process(tokens, entities, refs)
+        joint = {(e, f): 0.0 for (e, f) in t}
+        counts = {e: 0.0 for e in self.keys}
+        for epoch in range(self.num_epochs):
+            for e_seq, f_seq in zip(X, Y):
+                for f in f_seq:
+                    total = 0
+                    for e in e_seq:
+                        total += t[e, f]
+                    for e in e_seq:
+                        delta = t[e, f] / total
+                        joint[e, f] += delta
+                        counts[e] += delta
+            t = maximize(joint, counts)
+            if epoch < self.num_epochs - 1:
+                joint, counts = reset()
+
+        genders = {}
+        for e in self.keys:
+            vals = {}
+            total = 0
+            for i in range(G):
+                vals[self.reverseID[i]] = joint[e, i]
+                total += vals[self.reverseID[i]]
+            if total > 0:
+                for val in vals:
+                    vals[val] = float("%.3f" % (vals[val] / total))
+            maxID = None
+            maxVal = 0
+            for val in vals:
+                if vals[val] > maxVal:
+                    maxVal = vals[val]
+                    maxID = val
+            if e.split("\t")[1] == "coref":
+                genders[int(e.split("\t")[0])] = {"inference": vals, "argmax": maxID, "max": maxVal, "total": float("%.3f" % total)}
+        return genders
+
+
+@pytest.fixture
+def priors_file(tmp_path):
+    path = tmp_path / "priors.txt"
+    path.write_text(PRIORS)
+    return str(path)
+
+
+class TestGenderEM:
+    """Test the array-backed EM against the original dictionary implementation."""
+
+    @pytest.mark.parametrize("seed", range(5))
+    @pytest.mark.parametrize("ref_rate", [0.8, 1.0])
+    def test_matches_reference(self, priors_file, seed, ref_rate):
+        tokens, entities, refs = make_document(600, seed, ref_rate=ref_rate)
+
+        model = GenderEM(tokens=tokens, entities=entities, refs=refs, genders=GENDERS, hyperparameterFile=priors_file, tolerance=0)
+        reference = ReferenceGenderEM(tokens=tokens, entities=entities, refs=refs, genders=GENDERS, hyperparameterFile=priors_file)
+
+        assert model.tag(entities, tokens, refs) == reference.reference_tag(entities, tokens, refs)
+
+    def test_tolerance_stops_early(self, priors_file):
+        tokens, entities, refs = make_document(600, 0)
+
+        exact = GenderEM(tokens=tokens, entities=entities, refs=refs, genders=GENDERS, hyperparameterFile=priors_file, num_epochs=200, tolerance=0)
+        early = GenderEM(tokens=tokens, entities=entities, refs=refs, genders=GENDERS, hyperparameterFile=priors_file, num_epochs=200, tolerance=1e-3)
+
+        exact_genders = exact.tag(entities, tokens, refs)
+        early_genders = early.tag(entities, tokens, refs)
+
+        assert exact_genders.keys() == early_genders.keys()
+        for idd in exact_genders:
+            assert exact_genders[idd]["argmax"] == early_genders[idd]["argmax"]
+            for gender, val in exact_genders[idd]["inference"].items():
+                assert early_genders[idd]["inference"][gender] == pytest.approx(val, abs=0.01)
+
+    def test_no_pronouns(self, priors_file):
+        tokens, entities, refs = make_document(50, 1)
+        keep = [i for i, (_, _, cat, _) in enumerate(entities) if cat != "PRON_PER"]
+        entities = [entities[i] for i in keep]
+        refs = [refs[i] for i in keep]
+
+        model = GenderEM(tokens=tokens, entities=entities, refs=refs, genders=GENDERS, hyperparameterFile=priors_file)
+        genders = model.tag(entities, tokens, refs)
+
+        # with nothing to align, each character keeps its prior
+        assert genders[NAMES.index("Elizabeth")]["argmax"] == "she/her"
+        assert genders[NAMES.index("Mr. Bennet")]["argmax"] == "he/him/his"
+
+
+def reference_process(model, toks, entities, refs):
+    """The original window probe over every preceding token position."""
+    loc_starts = {}
+    tagged_pronouns = []
+    for idx, (start, end, cat, text) in enumerate(entities):
+        prop, ner_type = cat.split("_")
+        if ner_type != "PER":
+            continue
+        if text.lower() in model.gender_pronouns:
+            tagged_pronouns.append(start)
+        if refs is not None and refs[idx] != -1:
+            key = "%s\t%s" % (refs[idx], "COREF")
+        else:
+            head = model.get_head(start, end, toks) if prop == "NOM" else None
+            key = "%s\t%s" % (toks[head].text if head is not None else text, prop)
+        loc_starts.setdefault(start, []).append((end, idx, key))
+
+    if model.use_tagged_pronouns_only:
+        pronouns = tagged_pronouns
+    else:
+        pronouns = [idx for idx, tok in enumerate(toks) if tok.text.lower() in model.gender_pronouns]
+
+    X = []
+    Y = []
+    for idx in pronouns:
+        mention_refs = []
+        for i in range(1, model.distance):
+            for end, comp, text in loc_starts.get(idx - i, []):
+                if end < idx:
+                    mention_refs.append(text.lower())
+        if len(mention_refs) > 0:
+            X.append(mention_refs)
+            Y.append([model.gender_pronouns[toks[idx].text.lower()]])
+    return X, Y
+
+
+class TestProcess:
+    """Test bisect-based mention windows against probing every preceding position."""
+
+    @pytest.mark.parametrize("seed", range(3))
+    @pytest.mark.parametrize("distance", [1, 2, 5, 25, 200])
+    @pytest.mark.parametrize("use_tagged_pronouns_only", [True, False])
+    def test_matches_reference(self, seed, distance, use_tagged_pronouns_only):
+        tokens, entities, refs = make_document(400, seed)
+        # an entity enclosing every pronoun
+        entities.append((0, len(tokens) - 1, "NOM_PER", "everyone"))
+        refs.append(-1)
+
+        model = GenderEM(tokens=tokens, entities=entities, refs=refs, genders=GENDERS, distance=distance, use_tagged_pronouns_only=use_tagged_pronouns_only)
+
+        assert model.process(tokens, entities, refs) == reference_process(model, tokens, entities, refs)
+        assert model.process(tokens, entities) == reference_process(model, tokens, entities, None)
+
+
+class TestGenderHyperparameters:
+    """Test that priors are parsed once per process and shared."""
+
+    def test_loaded_once(self, priors_file):
+        clear_resources()
+        tokens, entities, refs = make_document(100, 0)
+
+        first = GenderEM(tokens=tokens, entities=entities, refs=refs, genders=GENDERS, hyperparameterFile=priors_file)
+        second = GenderEM(tokens=tokens, entities=entities, refs=refs, genders=GENDERS, hyperparameterFile=priors_file)
+        injected = GenderEM(tokens=tokens, entities=entities, refs=refs, genders=GENDERS, hyperparameters=load_gender_hyperparameters(priors_file, GENDERS))
+
+        assert first.hyperparameters is second.hyperparameters is injected.hyperparameters
+        assert first.honorific_priors is second.honorific_priors
+        assert first.tag(entities, tokens, refs) == injected.tag(entities, tokens, refs)
+
+    def test_matches_uncached_read(self, priors_file):
+        model = GenderEM(genders=GENDERS)
+        model.read_hyperparams(priors_file)
+        hyperparameters = load_gender_hyperparameters(priors_file, GENDERS)
+
+        assert dict(hyperparameters.terms) == model.hyperparameters
+        assert hyperparameters.terms["elizabeth\tprop"] == pytest.approx((0, 10 * 40 / 41, 10 * 1 / 41))
+        assert dict(hyperparameters.honorific_priors) == {"mr.": (10.0, 0.0, 0.0), "mrs.": (0.0, 10.0, 0.0)}
+
+    def test_read_only(self, priors_file):
+        hyperparameters = load_gender_hyperparameters(priors_file, GENDERS)
+
+        with pytest.raises(TypeError):
+            hyperparameters.terms["tom\tprop"] = (0, 1, 0)
+
+    def test_keyed_by_genders_and_reloaded_on_change(self, priors_file):
+        hyperparameters = load_gender_hyperparameters(priors_file, GENDERS)
+
+        assert load_gender_hyperparameters(priors_file, GENDERS[:2]) is not hyperparameters
+
+        with open(priors_file, "a") as out:
+            out.write("jane\tprop\t0\t30\t0\n")
+
+        assert "jane\tprop" in load_gender_hyperparameters(priors_file, GENDERS).terms
@@ -0,0 +1,64 @@
+"""Unit tests for entity tagger batching."""
+
+from booknlp.common import layered_reader
+
+
+class FakeTokenizer:
+    def convert_tokens_to_ids(self, toks):
+        return [1] * len(toks)
+
+
+class FakeModel:
+    tokenizer = FakeTokenizer()
+
+
+def make_sentences(lengths):
+    # each sentence is [CLS] + (length - 2) single-piece words + [SEP]
+    return [[["[CLS]"]] + [["w"]] * (length - 2) + [["[SEP]"]] for length in lengths]
+
+
+def get_batches(lengths, **kwargs):
+    return layered_reader.get_batches(FakeModel(), make_sentences(lengths), 32, {}, training=False, **kwargs)
+
+
+class TestTokenBudgetBatching:
+    """Test batching sentences under a total wordpiece budget."""
+
+    def test_batch_size_fits_budget_after_padding(self):
+        ordered_data = [[0] * n for n in [10, 10, 20, 40, 50]]
+
+        assert layered_reader.get_token_budget_batch_size(ordered_data, 0, 60) == 3
+        assert layered_reader.get_token_budget_batch_size(ordered_data, 3, 60) == 1
+
+    def test_oversized_sentence_gets_its_own_batch(self):
+        ordered_data = [[0] * 100]
+
+        assert layered_reader.get_token_budget_batch_size(ordered_data, 0, 60) == 1
+
+    def test_batches_respect_budget(self):
+        lengths = [12, 40, 7, 40, 9, 25]
+
+        _, batched_data, _, _, _, _, _ = get_batches(lengths, max_tokens=64)
+
+        assert sum(batch.shape[0] for batch in batched_data) == len(lengths)
+        for batch in batched_data:
+            assert batch.shape[0] == 1 or batch.numel() <= 64
+
+    def test_order_to_batch_map_covers_every_sentence_once(self):
+        lengths = [12, 40, 7, 40, 9, 25]
+
+        _, batched_data, _, _, _, ordering, order_to_batch_map = get_batches(lengths, max_tokens=64)
+
+        positions = order_to_batch_map[: len(ordering)]
+        assert len(set(positions)) == len(lengths)
+        for batch_id, batch_s, batch_position in positions:
+            assert batch_s == batched_data[batch_id].shape[0]
+            assert batch_position < batch_s
+
+    def test_default_batching_is_unchanged(self):
+        lengths = [12, 40, 7, 40, 9, 25]
+
+        _, batched_data, _, _, _, _, _ = get_batches(lengths)
+
+        assert len(batched_data) == 1
+        assert batched_data[0].shape == (6, 40)
@@ -0,0 +1,149 @@
+"""Unit tests for proper name clustering."""
+
+import itertools
+import random
+
+import pkg_resources
+import pytest
+
+from booknlp.english.name_coref import NameCoref, NameVariantIndex, load_aliases
+
+FIRST = ["Tom", "Em", "Emma", "Emily", "Abby", "Abigail", "Della", "Bill", "William", "Ned", "Edward", "Becky"]
+LAST = ["Sawyer", "Smith", "Bennet", "Darcy", "Wallace", "Foster", "Thatcher"]
+HONORIFICS = ["Mr.", "Mrs.", "Miss", "Lady", "Uncle"]
+
+
+@pytest.fixture(scope="module")
+def resolver():
+    return NameCoref(pkg_resources.resource_filename("booknlp.english", "data/aliases.txt"))
+
+
+def make_names(n, seed):
+    rng = random.Random(seed)
+    names = []
+    for _ in range(n):
+        parts = []
+        if rng.random() < 0.3:
+            parts.append(rng.choice(HONORIFICS))
+        if rng.random() < 0.8:
+            parts.append(rng.choice(FIRST))
+        if rng.random() < 0.3:
+            parts.append(rng.choice(LAST))
+        if rng.random() < 0.6 or len(parts) == 0:
+            parts.append(rng.choice(LAST))
+        names.append(parts)
+    return names
+
+
+def reference_subsets(resolver, uniq):
+    """The original all-pairs subset scan from name_cluster."""
+    subsets = {}
+    for name1 in uniq:
+        for canonical1 in resolver.get_canonical(name1.split(" ")):
+            name1set = set(canonical1)
+            for name2 in uniq:
+                if name1 == name2:
+                    continue
+                for canonical in resolver.get_canonical(name2.split(" ")):
+                    name2set = set(canonical)
+                    if " ".join(name1set) == " ".join(name2set):
+                        continue
+                    if name1set.issuperset(name2set):
+                        subsets[name2] = 1
+    return subsets
+
+
+class TestNameCluster:
+    """Test name clustering against the original quadratic implementation."""
+
+    @pytest.mark.parametrize("seed", range(5))
+    def test_subsets_match_reference(self, resolver, seed):
+        uniq = sorted(set(" ".join(name).lower() for name in make_names(200, seed)))
+        canonicals_by_name = {name: resolver.get_canonical(name.split(" ")) for name in uniq}
+
+        assert set(resolver.get_subsets(canonicals_by_name)) == set(reference_subsets(resolver, uniq))
+
+    def test_examples(self, resolver):
+        uniq = ["em smith", "em", "emma smith", "tom", "tom sawyer"]
+        canonicals_by_name = {name: resolver.get_canonical(name.split(" ")) for name in uniq}
+
+        # "em smith" -> "emma smith" is the same name, not a subset
+        assert set(resolver.get_subsets(canonicals_by_name)) == {"em", "tom"}
+
+    def test_cluster_assigns_variants_to_full_names(self, resolver):
+        entities = [["Mr.", "Tom", "Sawyer"], ["Tom"], ["Mr.", "Sawyer"], ["Becky", "Thatcher"], ["Becky"]]
+        refs = resolver.name_cluster(entities, [1] * len(entities), [-1] * len(entities))
+
+        assert refs[0] == refs[1] == refs[2]
+        assert refs[3] == refs[4]
+        assert refs[0] != refs[3]
+
+
+def reference_variant_index(resolver, names):
+    """The original index of every variant of every name."""
+    index = {}
+    for name, parts in names:
+        variants = {}
+        for length in range(1, min(len(parts), 7) + 1):
+            for combination in itertools.combinations(parts, length):
+                if length == 1 and combination[0].lower() in resolver.honorifics:
+                    continue
+                variants[" ".join(combination)] = 1
+        for v in variants:
+            index.setdefault(v, {})[name] = 1
+    return index
+
+
+class TestNameVariantIndex:
+    """Test variant lookups against the fully materialized index."""
+
+    @pytest.mark.parametrize("seed", range(3))
+    def test_lookup_matches_reference(self, resolver, seed):
+        rng = random.Random(seed)
+        names = []
+        for parts in make_names(300, seed):
+            name = " ".join(parts).lower()
+            for canonical in resolver.get_canonical(name.split(" ")):
+                names.append((name, canonical))
+        # a few long names, beyond the 7-part variant limit
+        for k in range(5):
+            parts = [rng.choice(FIRST + LAST).lower() for _ in range(9)]
+            names.append((" ".join(parts), parts))
+
+        index = NameVariantIndex(resolver.honorifics)
+        for name, parts in names:
+            index.add(name, parts)
+        expected = reference_variant_index(resolver, names)
+
+        queries = list(expected) + ["mr.", "miss", "nobody here", " ".join(names[-1][1]), "tom tom"]
+        for query in queries:
+            assert index.lookup(query) == list(expected.get(query, {}))
+
+    def test_get_variants(self, resolver):
+        variants = resolver.get_variants(["mr.", "tom", "sawyer"])
+
+        assert set(variants) == {"mr. tom sawyer", "mr. tom", "mr. sawyer", "tom sawyer", "tom", "sawyer"}
+
+    def test_canonicals_are_capped(self):
+        resolver = NameCoref(pkg_resources.resource_filename("booknlp.english", "data/aliases.txt"), max_canonicals=3)
+
+        assert len(resolver.get_canonical(["Della", "Della", "Della"])) == 3
+
+
+class TestAliases:
+    """Test that the alias table is parsed once per process and shared."""
+
+    def test_loaded_once(self):
+        alias_file = pkg_resources.resource_filename("booknlp.english", "data/aliases.txt")
+
+        assert NameCoref(alias_file).aliases is NameCoref(aliases=load_aliases(alias_file)).aliases
+
+    def test_read_only(self, tmp_path):
+        alias_file = tmp_path / "aliases.txt"
+        alias_file.write_text("Emily\tEm\nEmma\tEm\tEmmy\n")
+        aliases = load_aliases(str(alias_file))
+
+        assert dict(aliases) == {"em": ("emily", "emma"), "emmy": ("emma",)}
+        assert NameCoref(str(alias_file)).get_canonical(["Em", "Smith"]) == [["emily", "Smith"], ["emma", "Smith"]]
+        with pytest.raises(TypeError):
+            aliases["em"] = ("emilia",)
@@ -0,0 +1,97 @@
+"""Unit tests for choosing BookNLP pipes per call."""
+
+import json
+
+import pytest
+
+from booknlp.common.pipelines import Token
+from booknlp.english.english_booknlp import EnglishBookNLP
+
+
+def make_model(pipeline):
+    # skip loading models; get_pipes only needs the loaded pipes
+    model = EnglishBookNLP.__new__(EnglishBookNLP)
+    model.pipes = set(pipeline.split(","))
+    model.spacy_syntax = "auto"
+    return model
+
+
+class TestGetPipes:
+    """Test that per-call pipelines are checked against the loaded pipes and their dependencies."""
+
+    def test_defaults_to_loaded_pipes(self):
+        model = make_model("entity,quote,coref")
+
+        assert model.get_pipes() == {"entity", "quote", "coref"}
+
+    @pytest.mark.parametrize("pipeline", [["entity"], ["entity", "quote"], "entity,quote,coref", ["supersense", "event"], []])
+    def test_valid_subsets(self, pipeline):
+        model = make_model("entity,quote,supersense,event,coref")
+        expected = set(pipeline.split(",")) if isinstance(pipeline, str) else set(pipeline)
+
+        assert model.get_pipes(pipeline) == expected
+
+    @pytest.mark.parametrize("pipeline", [["coref", "entity"], ["coref", "quote"], ["quote"], ["parse"]])
+    def test_invalid_subsets(self, pipeline):
+        model = make_model("entity,quote,supersense,event,coref")
+
+        with pytest.raises(ValueError):
+            model.get_pipes(pipeline)
+
+    def test_unloaded_pipe(self):
+        model = make_model("entity,quote")
+
+        with pytest.raises(ValueError):
+            model.get_pipes(["entity", "supersense"])
+
+    def test_syntax_only_for_coref(self):
+        model = make_model("entity,quote,coref")
+
+        assert model.needs_syntax(True)
+        assert not model.needs_syntax(False)
+        model.spacy_syntax = "full"
+        assert model.needs_syntax(False)
+
+
+def make_annotations():
+    words = ["\u201c", "Hello", ",", "\u201d", "said", "Mr.", "Darcy", "."]
+    tokens = []
+    offset = 0
+    for i, word in enumerate(words):
+        tokens.append(Token(0, 0, i, i, word, "NOUN", "NN", word.lower(), "dep", i, None, offset))
+        offset += len(word) + 1
+    tokens[4].event = "EVENT"
+    return {
+        "tokens": tokens,
+        "quotes": [(0, 3)],
+        "entities": [(5, 6, "PROP_PER", "Mr. Darcy"), (6, 6, "PROP_PER", "Darcy")],
+        "supersense": [(4, 4, "verb.communication", "said")],
+        "attributed_quotations": [0],
+        "assignments": [0, 0],
+        "characters": [{"id": 0, "count": 2, "agent": [], "patient": [], "mod": [], "poss": [], "g": None, "mentions": {"proper": [{"n": "Darcy", "c": 2}], "common": [], "pronoun": []}}],
+    }
+
+
+def read_rows(path):
+    with open(path, encoding="utf-8") as file:
+        header = file.readline().rstrip("\n").split("\t")
+        return [dict(zip(header, line.rstrip("\n").split("\t"))) for line in file]
+
+
+class TestOutputs:
+    """Test that process() writes the same results process_records returns."""
+
+    def test_files_match_records(self, tmp_path, monkeypatch):
+        model = make_model("entity,quote,supersense,event,coref")
+        monkeypatch.setattr(model, "annotate", lambda text, pipeline=None, verbose=False: make_annotations())
+        input_file = tmp_path / "input.txt"
+        input_file.write_text("\u201cHello,\u201d said Mr. Darcy.")
+
+        model.process(str(input_file), str(tmp_path / "out"), "doc")
+        records = model.process_records(input_file.read_text())
+
+        for key, name in [("tokens", "tokens"), ("entities", "entities"), ("quotes", "quotes"), ("supersenses", "supersense")]:
+            assert read_rows(tmp_path / "out" / ("doc.%s" % name)) == [{column: str(value) for column, value in row.items()} for row in records[key]]
+        with open(tmp_path / "out" / "doc.book") as file:
+            assert json.load(file)["characters"] == records["characters"]
+        assert [row["word"] for row in records["events"]] == ["said"]
@@ -0,0 +1,80 @@
+"""Unit tests for index-based wordpiece pooling."""
+
+import torch
+
+from booknlp.common.pooling import WordpiecePooling, get_alignment, pool_spans
+
+
+def make_pooling():
+    # [CLS] | pride | prej ##ud ##ice | [SEP]    and    [CLS] | emma | [SEP]
+    sentences = [
+        [["[CLS]"], ["pride"], ["prej", "##ud", "##ice"], ["[SEP]"]],
+        [["[CLS]"], ["emma"], ["[SEP]"]],
+    ]
+    alignments = [get_alignment(sentence) for sentence in sentences]
+    return WordpiecePooling.from_alignments(alignments, max_len=6, num_words=4)
+
+
+class TestGetAlignment:
+    """Test the per-wordpiece token index and weight."""
+
+    def test_pieces_are_mapped_to_their_token(self):
+        word_ids, weights = get_alignment([["[CLS]"], ["a", "##b"], ["[SEP]"]])
+
+        assert word_ids == [0, 1, 1, 2]
+        assert weights == [1.0, 0.5, 0.5, 1.0]
+
+
+class TestWordpiecePooling:
+    """Test that pooling matches the dense averaging matrix it replaces."""
+
+    def test_dense_matrix_averages_pieces(self):
+        dense = make_pooling().dense()
+
+        assert dense.shape == (2, 4, 6)
+        assert torch.allclose(dense[0, 2], torch.tensor([0, 0, 1 / 3, 1 / 3, 1 / 3, 0]))
+        # padded tokens and padded wordpieces contribute nothing
+        assert torch.count_nonzero(dense[1, 3]) == 0
+        assert torch.count_nonzero(dense[1, :, 3:]) == 0
+
+    def test_pool_matches_dense_matmul(self):
+        pooling = make_pooling()
+        all_layers = torch.randn(2, 6, 8)
+
+        expected = torch.matmul(pooling.dense(), all_layers)
+
+        assert torch.allclose(pooling.pool(all_layers), expected, atol=1e-6)
+
+    def test_pool_propagates_gradients(self):
+        pooling = make_pooling()
+        all_layers = torch.randn(2, 6, 8, requires_grad=True)
+
+        pooling.pool(all_layers).sum().backward()
+
+        assert torch.allclose(all_layers.grad[:, :, 0], pooling.dense().sum(1))
+
+
+class TestPoolSpans:
+    """Test span means against the dense averaging matrices they replace."""
+
+    def test_matches_dense_matmul(self):
+        torch.manual_seed(0)
+        all_layers = torch.randn(3, 12, 8)
+        spans = torch.LongTensor([
+            [[1, 4], [0, 0], [11, 12]],
+            [[2, 3], [5, 10], [0, 0]],
+            [[0, 12], [6, 7], [0, 0]],
+        ])
+
+        matrix = torch.zeros(3, 3, 12)
+        for b in range(3):
+            for k, (start, end) in enumerate(spans[b].tolist()):
+                if end > start:
+                    matrix[b, k, start:end] = 1.0 / (end - start)
+
+        assert torch.allclose(pool_spans(all_layers, spans), torch.matmul(matrix, all_layers), atol=1e-6)
+
+    def test_empty_spans_are_zero(self):
+        pooled = pool_spans(torch.randn(1, 5, 4), torch.LongTensor([[[0, 0], [3, 3]]]))
+
+        assert not pooled.any()
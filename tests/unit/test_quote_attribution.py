@@ -0,0 +1,197 @@
+"""Unit tests for quote attribution."""
+
+import pytest
+import torch
+from transformers import BertConfig, BertModel, BertTokenizer
+
+from booknlp.common.pipelines import Token
+from booknlp.common.wordpiece import WordpieceCache, normalize_word
+from booknlp.english.bert_qa import QuotationAttribution, QuoteChains
+from booknlp.english.speaker_attribution import BERTSpeakerID
+
+VOCAB = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]", "elizabeth", "darcy", "jane", "and", "said", "hello", "no", "the", '"']
+
+
+class FakeSpeakerModel:
+    """Stands in for BERTSpeakerID, scoring the second candidate highest and recording what it was asked to score."""
+
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+        self.texts = []
+
+    def get_batches(self, texts, metas, wordpiece_cache=None):
+        self.texts.extend(texts)
+        if len(texts) == 0:
+            return [], [], [], []
+        return [len(texts)], [None], [None], [(texts, metas)]
+
+    def forward(self, batch_x, batch_m):
+        y_pred = torch.zeros(batch_x, 10, 1)
+        y_pred[:, 1] = 1
+        return y_pred
+
+
+def make_tokens(words):
+    tokens = []
+    paragraph_id = 0
+    for word in words:
+        if word == "\n":
+            paragraph_id += 1
+            continue
+        tokens.append(Token(paragraph_id, paragraph_id, len(tokens), len(tokens), word, None, None, None, None, None, None, 0))
+    return tokens
+
+
+def make_attribution(tmp_path):
+    vocab_file = tmp_path / "vocab.txt"
+    vocab_file.write_text("\n".join(VOCAB) + "\n")
+    tokenizer = BertTokenizer(str(vocab_file), do_lower_case=False)
+    tokenizer.add_tokens(["[QUOTE]", "[ALTQUOTE]", "[PAR]", "[CAP]"], special_tokens=True)
+
+    attribution = QuotationAttribution.__new__(QuotationAttribution)
+    attribution.model = FakeSpeakerModel(tokenizer)
+    return attribution
+
+
+class TestShortCircuit:
+    """Test that quotes with a single candidate skip the speaker model."""
+
+    def test_single_candidate_quotes_skip_model(self, tmp_path):
+        attribution = make_attribution(tmp_path)
+        words = ["Elizabeth", "said", '"', "hello", '"', "\n"] + ["the"] * 60 + ["\n", "Darcy", "and", "Jane", "said", '"', "no", '"']
+        tokens = make_tokens(words)
+        quotes = [(2, 4), (69, 71)]
+        entities = [(0, 0, "PROP_PER", "Elizabeth"), (65, 65, "PROP_PER", "Darcy"), (67, 67, "PROP_PER", "Jane")]
+
+        attributions = attribution.tag(quotes, entities, tokens)
+
+        # the first quote only has Elizabeth as a candidate; the second is decided by the model
+        assert attributions == [0, 1]
+        assert len(attribution.model.texts) == 1
+        assert attribution.num_quotes == 2
+        assert attribution.num_short_circuited == 1
+
+    def test_no_quotes(self, tmp_path):
+        attribution = make_attribution(tmp_path)
+
+        assert attribution.tag([], [], make_tokens(["the", "the"])) == []
+        assert attribution.num_quotes == 0
+
+
+@pytest.fixture
+def speaker_model(tmp_path, monkeypatch):
+    vocab_file = tmp_path / "vocab.txt"
+    vocab_file.write_text("\n".join(VOCAB) + "\n")
+    config = BertConfig(vocab_size=len(VOCAB), hidden_size=16, num_hidden_layers=2, num_attention_heads=2, intermediate_size=32)
+
+    monkeypatch.setattr(BertTokenizer, "from_pretrained", classmethod(lambda cls, *args, **kwargs: BertTokenizer(str(vocab_file), do_lower_case=False)))
+    monkeypatch.setattr(BertModel, "from_pretrained", classmethod(lambda cls, *args, **kwargs: BertModel(config)))
+
+    torch.manual_seed(0)
+    model = BERTSpeakerID(base_model="speaker_google_bert_uncased_L-2_H-16_A-2-v1.0.1")
+    model.eval()
+    return model
+
+
+def reference_wp_positions(model, words):
+    """Wordpiece (start, end) of each word, counting from 1 for the initial [CLS] token."""
+    wordpiece_cache = WordpieceCache()
+    wps = []
+    cur = 1
+    for word in words:
+        target = wordpiece_cache.tokenize(model.tokenizer, normalize_word(word, lowercase=True))
+        wps.append((cur, cur + len(target)))
+        cur += len(target)
+    return wps
+
+
+def dense_forward(model, texts, metas):
+    """The original forward over dense candidate and quote averaging matrices."""
+    batch_x, _, _, _ = model.get_batches(texts, metas)
+    batch_x = batch_x[0]
+    max_len = batch_x["toks"].shape[1]
+
+    matrix_cands = torch.zeros(len(texts), 10, max_len)
+    matrix_quote = torch.zeros(len(texts), 10, max_len)
+    for j, (text, (_, cands, quote)) in enumerate(zip(texts, metas)):
+        wps = reference_wp_positions(model, text)
+        q_start, q_end = wps[quote]
+        matrix_quote[j, :, q_start:q_end] = 1.0 / (q_end - q_start)
+        for c_idx, (start, end, _, _) in enumerate(cands):
+            c_start, c_end = wps[start][0], wps[end - 1][1]
+            matrix_cands[j, c_idx, c_start:c_end] = 1.0 / (c_end - c_start)
+
+    _, _, sequence_outputs = model.bert(batch_x["toks"], token_type_ids=None, attention_mask=batch_x["mask"], output_hidden_states=True, return_dict=False)
+    out = sequence_outputs[-1]
+    combined = torch.cat((torch.matmul(matrix_cands, out), torch.matmul(matrix_quote, out)), axis=2)
+    return model.fc2(model.tanh(model.fc(combined)))
+
+
+class TestSpeakerBatches:
+    """Test span-based candidate and quote pooling in the speaker model."""
+
+    def test_matches_dense_pooling(self, speaker_model):
+        texts = [
+            ["Elizabeth", "and", "Darcy", "said", "[QUOTE]"],
+            ["[PAR]", "Jane", "said", "[QUOTE]", "the", "[ALTQUOTE]", "Darcy"],
+        ]
+        metas = [
+            (None, [(0, 1, 0, None), (2, 3, 0, None), (0, 3, 0, None)], 4),
+            (None, [(1, 2, 0, None), (5, 6, 0, None), (6, 7, 0, None)], 3),
+        ]
+
+        batch_x, batch_m, batch_y, _ = speaker_model.get_batches(texts, metas)
+
+        assert batch_m[0]["cands"].shape == (2, 10, 2)
+        assert batch_m[0]["quote"].shape == (2, 1, 2)
+        assert batch_y[0]["y"].shape == (2, 10)
+
+        with torch.no_grad():
+            preds = speaker_model.forward(batch_x[0], batch_m[0])
+            expected = dense_forward(speaker_model, texts, metas)
+
+        assert torch.allclose(preds, expected, atol=1e-5)
+
+
+def reference_get_base(start, end, preds):
+    """The original recursive chain resolution."""
+    if (start, end) in preds:
+        s, e = preds[(start, end)]
+        return reference_get_base(s, e, preds)
+    return start, end
+
+
+class TestQuoteChains:
+    """Test disjoint-set resolution of quote-to-quote attributions."""
+
+    def test_matches_recursive_resolution(self):
+        chains = QuoteChains()
+        preds = {}
+        # quotes 0..9 at (10q, 10q+5); even quotes are attributed to entities, odd ones to the previous quote
+        for q in range(10):
+            quote = (10 * q, 10 * q + 5)
+            target = (10 * (q - 1), 10 * (q - 1) + 5) if q % 2 else (1000 + q, 1000 + q)
+            base = reference_get_base(*target, preds)
+            preds[quote] = base
+
+            assert chains.find(target) == base
+            chains.link(quote, base)
+
+        for quote in preds:
+            assert chains.find(quote) == reference_get_base(*quote, preds)
+
+    def test_long_chain_does_not_recurse(self):
+        chains = QuoteChains()
+        chains.parent.update({(q, q): (q - 1, q - 1) for q in range(1, 100000)})
+
+        assert chains.find((99999, 99999)) == (0, 0)
+        # the path is compressed
+        assert chains.parent[(50000, 50000)] == (0, 0)
+
+    def test_quote_is_not_its_own_speaker(self):
+        chains = QuoteChains()
+        chains.link((1, 2), (3, 4))
+
+        assert chains.link((3, 4), (1, 2)) == (3, 4)
+        assert chains.find((1, 2)) == (3, 4)
+        assert chains.find((3, 4)) == (3, 4)
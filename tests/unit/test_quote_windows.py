@@ -0,0 +1,91 @@
+"""Unit tests for quote attribution context windows."""
+
+import numpy as np
+import pytest
+
+from booknlp.english.bert_qa import QuoteWindows
+
+
+def reference_window(wp_lens, in_quotes, end_quotes, paragraph_ids, end_tok, window=50):
+    """The original token-by-token window expansion from QuotationAttribution.get_representation."""
+    start = end_tok
+    count = 0
+    wp_tok_count = 0
+    lastPar = None
+    while start >= 0 and count < window and wp_tok_count + wp_lens[start] < 350:
+        if in_quotes[start] == 0:
+            count += 1
+            wp_tok_count += wp_lens[start]
+        if start in end_quotes:
+            wp_tok_count += 1
+        if paragraph_ids[start] != lastPar:
+            wp_tok_count += 1
+        lastPar = paragraph_ids[start]
+        start -= 1
+    start += 1
+
+    count = 0
+    end = end_tok
+    while end < len(wp_lens) and count < window and wp_tok_count + wp_lens[end] < 475:
+        if in_quotes[end] == 0:
+            count += 1
+            wp_tok_count += wp_lens[end]
+        if end in end_quotes:
+            wp_tok_count += 1
+        if paragraph_ids[end] != lastPar:
+            wp_tok_count += 1
+        lastPar = paragraph_ids[end]
+        end += 1
+    end -= 1
+
+    return start, end
+
+
+def make_document(n, seed, max_wp=4, quote_rate=0.05, par_rate=0.05):
+    rng = np.random.default_rng(seed)
+    wp_lens = rng.integers(0, max_wp + 1, size=n)
+    paragraph_ids = np.cumsum(rng.random(n) < par_rate)
+
+    in_quotes = np.zeros(n)
+    quotes = []
+    k = 0
+    while k < n:
+        if rng.random() < quote_rate:
+            length = int(rng.integers(1, 200))
+            end = min(n - 1, k + length)
+            quotes.append((k, end))
+            in_quotes[k:end + 1] = 1
+            k = end + 2
+        else:
+            k += 1
+
+    end_quotes = {q_end: idx for idx, (_, q_end) in enumerate(quotes)}
+    return wp_lens, in_quotes, end_quotes, paragraph_ids, quotes
+
+
+class TestQuoteWindows:
+    """Test that prefix-sum windows match the original token-by-token expansion."""
+
+    @pytest.mark.parametrize("seed", range(10))
+    @pytest.mark.parametrize("max_wp", [1, 4, 40])
+    def test_matches_reference(self, seed, max_wp):
+        wp_lens, in_quotes, end_quotes, paragraph_ids, quotes = make_document(3000, seed, max_wp=max_wp)
+        windows = QuoteWindows(wp_lens, in_quotes, end_quotes, paragraph_ids)
+
+        for _, end_tok in quotes:
+            assert windows.get_window(end_tok) == reference_window(wp_lens, in_quotes, end_quotes, paragraph_ids, end_tok)
+
+    def test_every_position(self):
+        wp_lens, in_quotes, end_quotes, paragraph_ids, _ = make_document(400, 0, quote_rate=0.2, par_rate=0.3)
+        windows = QuoteWindows(wp_lens, in_quotes, end_quotes, paragraph_ids, window=5)
+
+        for end_tok in range(len(wp_lens)):
+            assert windows.get_window(end_tok) == reference_window(wp_lens, in_quotes, end_quotes, paragraph_ids, end_tok, window=5)
+
+    def test_oversized_token(self):
+        wp_lens = np.array([1, 1, 400, 1, 1])
+        in_quotes = np.array([0, 0, 0, 1, 0])
+        paragraph_ids = np.zeros(5, dtype=int)
+        windows = QuoteWindows(wp_lens, in_quotes, {3: 0}, paragraph_ids)
+
+        assert windows.get_window(3) == reference_window(wp_lens, in_quotes, {3: 0}, paragraph_ids, 3)
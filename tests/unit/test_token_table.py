@@ -0,0 +1,255 @@
+"""Unit tests for the columnar token store."""
+
+import random
+
+import numpy as np
+import pkg_resources
+import pytest
+import spacy
+from spacy.attrs import DEP, HEAD, LEMMA, POS, SENT_START, TAG
+from spacy.language import Language
+
+from booknlp.common.pipelines import SpacyPipeline, Token, TokenTable, get_token_column
+from booknlp.english.litbank_quote import QuoteTagger
+
+FIELDS = ["paragraph_id", "sentence_id", "index_within_sentence_idx", "token_id", "text", "pos", "fine_pos", "lemma", "deprel", "dephead", "ner", "startByte", "endByte", "inQuote", "event"]
+WORDS = ["Elizabeth", "said", "\"", "Hello", ",", "Mr.", "Darcy", "’s", "—", "she", "laughed", ".", "“", "”", "walked"]
+
+
+def make_tokens(n, seed):
+    rng = random.Random(seed)
+    tokens = []
+    paragraph_id = 0
+    sentence_id = 0
+    index_within_sentence = 0
+    offset = 0
+    for i in range(n):
+        if rng.random() < 0.05:
+            paragraph_id += 1
+        if rng.random() < 0.1:
+            sentence_id += 1
+            index_within_sentence = 0
+        word = rng.choice(WORDS)
+        pos = rng.choice(["NOUN", "VERB", "PUNCT", "PROPN"])
+        tokens.append(Token(paragraph_id, sentence_id, index_within_sentence, i, word, pos, pos[:2], word.lower(), rng.choice(["nsubj", "dobj", "ROOT"]), rng.randrange(n), None, offset))
+        offset += len(word) + 1
+        index_within_sentence += 1
+    return tokens
+
+
+class TestTokenTable:
+    """Test that TokenTable rows behave like the Tokens they were built from."""
+
+    def test_views_match_tokens(self):
+        tokens = make_tokens(500, 0)
+        table = TokenTable.from_tokens(tokens)
+
+        assert len(table) == len(tokens)
+        for tok, view in zip(tokens, table):
+            for field in FIELDS:
+                assert getattr(view, field) == getattr(tok, field)
+                assert type(getattr(view, field)) is type(getattr(tok, field))
+            assert str(view) == str(tok)
+
+    def test_indexing(self):
+        tokens = make_tokens(50, 1)
+        table = TokenTable.from_tokens(tokens)
+
+        assert table[-1].token_id == 49
+        assert [tok.text for tok in table[10:20]] == [tok.text for tok in tokens[10:20]]
+        with pytest.raises(IndexError):
+            table[50]
+
+    def test_setters(self):
+        table = TokenTable.from_tokens(make_tokens(20, 2))
+
+        table[3].inQuote = True
+        table[4].event = "EVENT"
+
+        assert table[3].inQuote is True
+        assert table.inQuote.sum() == 1
+        assert [tok.event for tok in table[3:6]] == ["O", "EVENT", "O"]
+        with pytest.raises(AttributeError):
+            table[3].text = "changed"
+
+    def test_columns(self):
+        tokens = make_tokens(100, 3)
+        table = TokenTable.from_tokens(tokens)
+
+        for field in FIELDS:
+            assert get_token_column(table, field) == get_token_column(tokens, field)
+
+
+class TestQuoteTagger:
+    """Test that quotes are found the same way in token lists and tables."""
+
+    @pytest.mark.parametrize("seed", range(5))
+    def test_table_matches_list(self, seed):
+        tokens = make_tokens(2000, seed)
+        table = TokenTable.from_tokens(tokens)
+
+        assert QuoteTagger().tag(table) == QuoteTagger().tag(tokens)
+        assert get_token_column(table, "inQuote") == get_token_column(tokens, "inQuote")
+
+
+@pytest.fixture(scope="module")
+def pipeline():
+    nlp = spacy.blank("en")
+    nlp.add_pipe("sentencizer")
+    return SpacyPipeline(nlp)
+
+
+def add_syntax(doc, seed=None, cross_sentence_heads=False):
+    """
+    Give every token a tag, lemma and relation, headed by the first token of its sentence (or, optionally, of the doc).
+    Without a seed, the tag and relation depend only on the token's text.
+    """
+    rng = random.Random(seed)
+    rows = []
+    for sent in doc.sents:
+        for tok in sent:
+            if seed is None:
+                rng = random.Random(tok.text)
+            root = 0 if cross_sentence_heads else sent.start
+            pos = rng.choice(["NOUN", "VERB", "PUNCT", "PROPN", "SPACE"])
+            rows.append([
+                (root - tok.i) % 2**64,
+                doc.vocab.strings.add("ROOT" if tok.i == root else rng.choice(["nsubj", "dobj", "conj"])),
+                1 if tok.i == sent.start else 2**64 - 1,
+                doc.vocab.strings[pos],
+                doc.vocab.strings.add(pos[:2]),
+                doc.vocab.strings.add(tok.text.lower()),
+            ])
+    if len(rows) > 0:
+        rows = np.array(rows, dtype="uint64")
+        doc.from_array([HEAD, DEP, POS, TAG, LEMMA], rows[:, [0, 1, 3, 4, 5]])
+        # setting heads re-derives the sentences from the tree, so restore the original ones
+        doc.from_array([SENT_START], rows[:, [2]])
+    return doc
+
+
+def assert_same_tokens(table, tokens):
+    assert len(table) == len(tokens)
+    for field in FIELDS:
+        assert get_token_column(table, field) == get_token_column(tokens, field)
+
+
+class TestSpacyArrays:
+    """Test that tokens built from spaCy's attribute arrays match the token-by-token path."""
+
+    def test_pride_and_prejudice(self, pipeline):
+        with open(pkg_resources.resource_filename("booknlp", "data/english/pride_and_prejudice.txt")) as file:
+            doc = add_syntax(pipeline.spacy_nlp(file.read()), 0)
+
+        assert_same_tokens(pipeline.process_doc_arrays(doc), pipeline.process_doc_by_token(doc))
+
+    @pytest.mark.parametrize("text", [
+        "",
+        "\n\n",
+        "First paragraph.\n\nSecond one.  \n \n  Third\tone.\n\n",
+        "\n\n\n  Leading space. Tabs\t\tand\r\nreturns.\n",
+        "One.\n\n\n\n\n\nTwo.\n \nThree.",
+    ])
+    def test_whitespace(self, pipeline, text):
+        doc = add_syntax(pipeline.spacy_nlp(text), 1)
+
+        assert_same_tokens(pipeline.process_doc_arrays(doc), pipeline.process_doc_by_token(doc))
+
+    def test_heads_outside_sentence_fall_back(self, pipeline):
+        doc = add_syntax(pipeline.spacy_nlp("First sentence here. Second sentence there."), 2, cross_sentence_heads=True)
+
+        assert pipeline.process_doc_arrays(doc) is None
+        assert_same_tokens(pipeline.process_doc(doc), pipeline.process_doc_by_token(doc))
+
+
+@Language.component("test_paragraph_sentences")
+def paragraph_sentences(doc):
+    """Start a sentence after every blank line, as the shards do."""
+    for tok in doc[1:]:
+        if "\n\n" in doc[tok.i - 1].text and doc[tok.i - 1].is_space:
+            tok.is_sent_start = True
+    return doc
+
+
+@Language.component("test_syntax")
+def syntax(doc):
+    return add_syntax(doc)
+
+
+def make_sharded_pipeline(**kwargs):
+    nlp = spacy.blank("en")
+    nlp.add_pipe("sentencizer")
+    nlp.add_pipe("test_paragraph_sentences")
+    nlp.add_pipe("test_syntax")
+    return SpacyPipeline(nlp, **kwargs)
+
+
+def read_pride_and_prejudice():
+    with open(pkg_resources.resource_filename("booknlp", "data/english/pride_and_prejudice.txt")) as file:
+        return file.read()
+
+
+class TestShardedParsing:
+    """Test that parsing paragraph shards separately gives the same tokens as parsing the whole text."""
+
+    def test_shards_end_at_paragraph_breaks(self):
+        pipeline = make_sharded_pipeline(shard_size=20)
+        text = "One.\n\nTwo two.\n \n\nThree three three.\n\n\nFour.\n\n"
+
+        shards = pipeline.get_shards(text)
+
+        assert "".join(shard for offset, shard in shards) == text
+        assert [offset for offset, shard in shards] == [0, 39]
+        assert shards[1][1] == "Four.\n\n"
+
+    @pytest.mark.parametrize("shard_size", [1, 1000, 50000])
+    def test_pride_and_prejudice(self, shard_size):
+        text = read_pride_and_prejudice()[:200000]
+        sharded = make_sharded_pipeline(shard_size=shard_size)
+        whole = make_sharded_pipeline()
+
+        assert_same_tokens(sharded.tag(text), whole.tag(text))
+
+    @pytest.mark.parametrize("text", ["", "\n\n\n", "\n\nLeading blank line.\n\nNext.", "No breaks at all."])
+    def test_edge_cases(self, text):
+        assert_same_tokens(make_sharded_pipeline(shard_size=1).tag(text), make_sharded_pipeline().tag(text))
+
+    def test_multiple_processes(self):
+        text = read_pride_and_prejudice()[:20000]
+        sharded = make_sharded_pipeline(n_process=2, shard_size=2000)
+
+        assert_same_tokens(sharded.tag(text), make_sharded_pipeline().tag(text))
+
+
+def make_light_pipeline(with_sentencizer, **kwargs):
+    nlp = spacy.blank("en")
+    if with_sentencizer:
+        nlp.add_pipe("sentencizer")
+    nlp.add_pipe("test_paragraph_sentences")
+    nlp.add_pipe("test_syntax", name="parser")
+    return SpacyPipeline(nlp, syntax=False, **kwargs)
+
+
+class TestLightSyntax:
+    """Test parsing without the syntax components."""
+
+    @pytest.mark.parametrize("with_sentencizer", [True, False])
+    def test_skips_parser(self, with_sentencizer):
+        text = read_pride_and_prejudice()[:20000]
+        light = make_light_pipeline(with_sentencizer)
+
+        tokens = light.tag(text)
+        full = make_sharded_pipeline().tag(text)
+
+        for field in ["paragraph_id", "sentence_id", "index_within_sentence_idx", "token_id", "text", "startByte", "endByte"]:
+            assert get_token_column(tokens, field) == get_token_column(full, field)
+        assert get_token_column(tokens, "dephead") == get_token_column(tokens, "token_id")
+        assert set(get_token_column(tokens, "deprel")) == {""}
+        assert set(get_token_column(tokens, "lemma")) == {""}
+
+    def test_syntax_per_call(self):
+        text = read_pride_and_prejudice()[:20000]
+        light = make_light_pipeline(True)
+
+        assert_same_tokens(light.tag(text, syntax=True), make_sharded_pipeline().tag(text))
+        assert_same_tokens(make_light_pipeline(True).tag(text), make_light_pipeline(True, shard_size=2000).tag(text))
@@ -0,0 +1,162 @@
+"""Unit tests for the shared wordpiece tokenization cache."""
+
+import pytest
+from transformers import BertTokenizer
+
+from booknlp.common.wordpiece import (
+    LRUWordpieceCache,
+    WordpieceCache,
+    build_fast_tokenizer,
+    normalize_word,
+    vocab_key,
+)
+
+VOCAB = [
+    "[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]",
+    "the", "cat", "mr", "darcy", "caf", "élan", "##s", "##.", "##é", ".", ",", "'",
+]
+
+WORDS = [
+    "the", "cats", "[CAP] mr.", "[CAP] darcy", "café", "élan", "Élan", ".", "'s",
+    "[QUOTE]", "[ALTQUOTE]", "[PAR]", "[CLS]", "[SEP]", "日本", "x" * 150, "a\x07b", "[CAP]",
+]
+
+
+class CountingTokenizer:
+    """Minimal stand-in for a BERT tokenizer that records tokenize() calls."""
+
+    def __init__(self, vocab=None, added=None):
+        self.vocab = vocab or {"[PAD]": 0, "the": 1, "cat": 2, "##s": 3}
+        self.added = added or {"[CAP]": len(self.vocab)}
+        self.calls = 0
+
+    def get_vocab(self):
+        return {**self.vocab, **self.added}
+
+    def get_added_vocab(self):
+        return dict(self.added)
+
+    def tokenize(self, word):
+        self.calls += 1
+        return word.split(" ")
+
+
+@pytest.fixture
+def slow_tokenizer(tmp_path):
+    vocab_file = tmp_path / "vocab.txt"
+    vocab_file.write_text("\n".join(VOCAB) + "\n")
+    tokenizer = BertTokenizer(str(vocab_file), do_lower_case=False, do_basic_tokenize=False)
+    tokenizer.add_tokens(["[QUOTE]", "[ALTQUOTE]", "[PAR]", "[CAP]"], special_tokens=True)
+    return tokenizer
+
+
+class TestNormalizeWord:
+    """Test the [CAP] normalization shared by all BERT components."""
+
+    def test_capitalized_word_is_marked_and_lowercased(self):
+        assert normalize_word("Emma") == "[CAP] emma"
+
+    def test_lowercase_word_is_unchanged(self):
+        assert normalize_word("eBay") == "eBay"
+
+    def test_lowercase_option_lowercases_rest(self):
+        assert normalize_word("eBay", lowercase=True) == "ebay"
+
+    def test_special_tokens_are_preserved(self):
+        for token in ["[QUOTE]", "[ALTQUOTE]", "[PAR]"]:
+            assert normalize_word(token, lowercase=True) == token
+
+
+class TestVocabKey:
+    """Test tokenizer identity by vocabulary contents."""
+
+    def test_same_vocab_shares_key(self):
+        assert vocab_key(CountingTokenizer()) == vocab_key(CountingTokenizer())
+
+    def test_added_tokens_change_key(self):
+        plain = CountingTokenizer()
+        speaker = CountingTokenizer(added={"[QUOTE]": 4, "[CAP]": 5})
+        assert vocab_key(plain) != vocab_key(speaker)
+
+
+class TestWordpieceCache:
+    """Test per-document and process-wide caching."""
+
+    def test_each_word_tokenized_once_per_document(self):
+        tokenizer = CountingTokenizer()
+        cache = WordpieceCache(shared=LRUWordpieceCache(maxsize=0))
+
+        for _ in range(3):
+            assert cache.tokenize_word(tokenizer, "Emma") == ("[CAP]", "emma")
+
+        assert tokenizer.calls == 1
+        assert len(cache) == 1
+
+    def test_shared_cache_carries_over_between_documents(self):
+        shared = LRUWordpieceCache(maxsize=10)
+        tokenizer = CountingTokenizer()
+
+        WordpieceCache(shared=shared).tokenize(tokenizer, "cats")
+        WordpieceCache(shared=shared).tokenize(tokenizer, "cats")
+
+        assert tokenizer.calls == 1
+        assert shared.hits == 1
+
+    def test_shared_cache_is_bounded(self):
+        shared = LRUWordpieceCache(maxsize=2)
+        tokenizer = CountingTokenizer()
+        cache = WordpieceCache(shared=shared)
+
+        for word in ["a", "b", "c"]:
+            cache.tokenize(tokenizer, word)
+
+        assert len(shared) == 2
+        assert shared.get((vocab_key(tokenizer), "a")) is None
+
+    def test_tokenizers_with_different_vocabs_do_not_collide(self):
+        cache = WordpieceCache(shared=LRUWordpieceCache(maxsize=0))
+        plain = CountingTokenizer()
+        speaker = CountingTokenizer(added={"[QUOTE]": 4, "[CAP]": 5})
+
+        cache.tokenize(plain, "the")
+        cache.tokenize(speaker, "the")
+
+        assert plain.calls == 1
+        assert speaker.calls == 1
+
+
+class TestFastTokenizer:
+    """Test that the fast tokenizer reproduces the slow one exactly."""
+
+    def test_wordpieces_match_slow_tokenizer(self, slow_tokenizer):
+        fast = build_fast_tokenizer(slow_tokenizer)
+
+        for word in WORDS:
+            assert fast.tokenize(word) == slow_tokenizer.tokenize(word), word
+
+    def test_added_token_ids_match_slow_tokenizer(self, slow_tokenizer):
+        fast = build_fast_tokenizer(slow_tokenizer)
+
+        assert len(fast) == len(slow_tokenizer)
+        for token in ["[QUOTE]", "[ALTQUOTE]", "[PAR]", "[CAP]", "[CLS]", "[SEP]"]:
+            assert fast.convert_tokens_to_ids(token) == slow_tokenizer.convert_tokens_to_ids(token)
+
+    def test_prime_matches_per_word_tokenization(self, slow_tokenizer):
+        fast = build_fast_tokenizer(slow_tokenizer)
+        cache = WordpieceCache(shared=LRUWordpieceCache(maxsize=0))
+
+        words = WORDS + ["Darcy", "Cats"]
+
+        cache.prime(fast, words)
+
+        assert len(cache) == len({normalize_word(word) for word in words})
+        for word in words:
+            expected = tuple(slow_tokenizer.tokenize(normalize_word(word)))
+            assert cache.tokenize_word(fast, word) == expected, word
+
+    def test_prime_is_a_no_op_for_slow_tokenizers(self, slow_tokenizer):
+        cache = WordpieceCache(shared=LRUWordpieceCache(maxsize=0))
+
+        cache.prime(slow_tokenizer, WORDS)
+
+        assert len(cache) == 0